@@ -0,0 +1,172 @@
+"""
+Admission control – concurrency limits, rate limits and load shedding for tools.
+
+Used by mcp_server_http.py in front of every tool call, so a burst of agent
+sessions queues briefly or is turned away instead of piling onto the
+Customer API:
+
+    async with admission.admit("customer_get_profile", client_id):
+        ...run the tool...
+
+* Token buckets: each tool may have a rate (calls/s) and a burst. A call
+  that finds its bucket empty is rejected at once, with the time until the
+  next token as the retry hint.
+* Concurrency: at most `max_concurrency` tool calls run at once, and at most
+  `max_per_client` of them for one client, so one busy client cannot take
+  every slot.
+* Bounded queue: a call that finds no free slot waits, but only if fewer
+  than `max_queue` calls are already waiting, and for at most `max_wait`
+  seconds. Otherwise it is rejected straight away.
+
+Every rejection raises Overloaded. It carries a machine-readable reason and
+a retry-after hint, and the server turns it into a structured, retryable
+tool error.
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+
+class Overloaded(Exception):
+    """Raised instead of running a tool while the server is over capacity."""
+
+    def __init__(self, reason: str, retry_after: float, message: Optional[str] = None):
+        self.reason = reason                 # rate_limited | queue_full | queue_timeout | upstream_*
+        self.retry_after = round(max(retry_after, 0.1), 2)
+        super().__init__(f"{message or f'Server is busy ({reason}).'} "
+                         f"Retry in {self.retry_after:g} seconds.")
+
+    def to_dict(self) -> dict:
+        return {"error": {"type": "overloaded", "reason": self.reason,
+                          "retryable": True, "retry_after": self.retry_after}}
+
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `burst`."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def available(self) -> float:
+        return min(self.burst, self.tokens + (time.monotonic() - self.updated) * self.rate)
+
+    def take(self) -> float:
+        """Take a token; returns 0 on success, else seconds until one is available."""
+        self.tokens = self.available()
+        self.updated = time.monotonic()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class _ClientSlots:
+    __slots__ = ("semaphore", "users")
+
+    def __init__(self, limit: int):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.users = 0                       # calls holding or waiting for a slot
+
+
+class AdmissionController:
+
+    def __init__(self, max_concurrency: int = 64, max_per_client: int = 16, max_queue: int = 128,
+                 max_wait: float = 2.0, rate_limits: Optional[dict[str, tuple[float, float]]] = None):
+        self.max_concurrency = max_concurrency
+        self.max_per_client = max_per_client
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.buckets = {tool: TokenBucket(rate, burst) for tool, (rate, burst) in (rate_limits or {}).items()}
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._clients: dict[str, _ClientSlots] = {}
+        self.in_flight = 0
+        self.queued = 0
+        self.peak_in_flight = 0
+        self.peak_queued = 0
+        self.admitted = 0
+        self.rejected: dict[str, int] = {}
+        self._hold_time = 0.0                # moving average of seconds a slot is held
+
+    def _reject(self, reason: str, retry_after: float) -> Overloaded:
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        return Overloaded(reason, retry_after)
+
+    def _queue_retry_after(self) -> float:
+        """Rough time for the current queue to drain through the slots."""
+        estimate = self._hold_time * (self.queued + 1) / self.max_concurrency
+        return min(max(estimate, 0.1), max(self.max_wait, 0.1))
+
+    async def _acquire(self, client: _ClientSlots):
+        if not client.semaphore.locked() and not self._slots.locked():
+            await client.semaphore.acquire()         # free slots – neither call suspends
+            await self._slots.acquire()
+            return
+        if self.queued >= self.max_queue:
+            raise self._reject("queue_full", self._queue_retry_after())
+        self.queued += 1
+        self.peak_queued = max(self.peak_queued, self.queued)
+        try:
+            async with asyncio.timeout(self.max_wait):
+                await client.semaphore.acquire()
+                try:
+                    await self._slots.acquire()
+                except BaseException:
+                    client.semaphore.release()
+                    raise
+        except TimeoutError:
+            raise self._reject("queue_timeout", self._queue_retry_after()) from None
+        finally:
+            self.queued -= 1
+
+    @asynccontextmanager
+    async def admit(self, tool: str, client_id: str) -> AsyncIterator[None]:
+        """Hold a slot for one call of `tool` by `client_id`, or raise Overloaded."""
+        bucket = self.buckets.get(tool)
+        if bucket is not None:
+            wait = bucket.take()
+            if wait:
+                raise self._reject("rate_limited", wait)
+
+        client = self._clients.get(client_id)
+        if client is None:
+            client = self._clients[client_id] = _ClientSlots(self.max_per_client)
+        client.users += 1
+        try:
+            await self._acquire(client)
+            self.admitted += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            start = time.monotonic()
+            try:
+                yield
+            finally:
+                self.in_flight -= 1
+                self._hold_time += (time.monotonic() - start - self._hold_time) * 0.1
+                self._slots.release()
+                client.semaphore.release()
+        finally:
+            client.users -= 1
+            if not client.users:
+                del self._clients[client_id]
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_per_client": self.max_per_client,
+            "max_queue": self.max_queue,
+            "max_wait": self.max_wait,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "peak_in_flight": self.peak_in_flight,
+            "peak_queued": self.peak_queued,
+            "clients": len(self._clients),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "avg_hold_ms": round(self._hold_time * 1000, 2),
+            "tokens": {tool: round(b.available(), 2) for tool, b in self.buckets.items()},
+        }
@@ -1,139 +1,173 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, EmailStr
+import asyncio
+import base64
+import binascii
+import os
+import time
 from datetime import date
-from typing import Optional
+from typing import Any, Literal, Optional
+
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, EmailStr, Field
+
+import etags
+import fast_json
+import telemetry
+from models import Change, Customer, CustomerProduct, Product, ProductTotals
+from customer_store import ProductFilter, normalize_email, open_store, product_order
 
 app = FastAPI(title="Customer API", version="1.0.0")
 
-class Customer(BaseModel):
-    id: int
+# GETs carry an ETag and answer If-None-Match with 304
+app.add_middleware(etags.ETagMiddleware)
+
+# Every request is timed as an "api" span, continuing the caller's traceparent
+app.add_middleware(telemetry.TracingMiddleware, hop="api")
+
+
+# Storage backend the routes read from – in-memory sample data by default,
+# or a shared SQLite database when CUSTOMER_DB_PATH is set (see customer_store.py)
+store = open_store()
+
+# Paging limits for /customers
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE     = 1000
+
+# Rows read from the store per chunk of the NDJSON export
+EXPORT_BATCH_SIZE = 1000
+
+# Maximum number of emails + ids accepted by /customers/batch
+MAX_BATCH_SIZE = 500
+
+# Change feed: longest long-poll, how often waiters re-read the store (writes
+# by other workers only show up there) and the SSE heartbeat interval
+MAX_CHANGE_WAIT      = 60.0
+CHANGE_POLL_INTERVAL = float(os.getenv("CHANGE_POLL_INTERVAL", "0.5"))
+SSE_HEARTBEAT        = 15.0
+
+
+class CustomerPage(BaseModel):
+    items: list[dict[str, Any]]
+    next_cursor: Optional[str] = None
+
+
+class CustomerBatchRequest(BaseModel):
+    emails: list[str] = Field(default_factory=list)
+    ids: list[int] = Field(default_factory=list)
+    include_products: bool = False
+
+
+class CustomerBatchResponse(BaseModel):
+    by_email: dict[str, Optional[Customer]] = Field(default_factory=dict)
+    by_id: dict[int, Optional[Customer]] = Field(default_factory=dict)
+    products: Optional[dict[int, list[Product]]] = None
+
+
+class CustomerProfile(BaseModel):
+    customer: Customer
+    products: list[Product]
+
+
+class ProductPage(BaseModel):
+    items: list[CustomerProduct]
+    next_cursor: Optional[str] = None
+
+
+class ProductSummary(BaseModel):
+    totals: ProductTotals
+    by_customer: Optional[list[ProductTotals]] = None
+
+
+class CustomerIn(BaseModel):
     email: EmailStr
     name: str
     dob: date
 
 
-class Product(BaseModel):
-    code: str
-    name: str
-    list_price: float
-    buy_price: float
-    date: date
-    has_warranty: bool
-    warranty_date: Optional[date] = None
-
-
-# Mock database with sample customers
-customers_db = [
-    Customer(
-        id=1,
-        email="john.doe@example.com",
-        name="John Doe",
-        dob=date(1990, 5, 15)
-    ),
-    Customer(
-        id=2,
-        email="jane.smith@example.com",
-        name="Jane Smith",
-        dob=date(1985, 8, 22)
-    ),
-    Customer(
-        id=3,
-        email="bob.wilson@example.com",
-        name="Bob Wilson",
-        dob=date(1992, 3, 10)
-    ),
-]
-
-# Mock database of products purchased by customers
-customer_products_db = {
-    1: [  # John Doe's purchases
-        Product(
-            code="LAP001",
-            name="Dell XPS 15 Laptop",
-            list_price=1899.99,
-            buy_price=1699.99,
-            date=date(2024, 1, 15),
-            has_warranty=True,
-            warranty_date=date(2027, 1, 15)
-        ),
-        Product(
-            code="MOU002",
-            name="Logitech MX Master 3",
-            list_price=99.99,
-            buy_price=89.99,
-            date=date(2024, 2, 20),
-            has_warranty=True,
-            warranty_date=date(2025, 2, 20)
-        ),
-        Product(
-            code="USB003",
-            name="USB-C Hub Adapter",
-            list_price=49.99,
-            buy_price=39.99,
-            date=date(2024, 3, 10),
-            has_warranty=False,
-            warranty_date=None
-        ),
-    ],
-    2: [  # Jane Smith's purchases
-        Product(
-            code="PHO001",
-            name="iPhone 15 Pro",
-            list_price=1199.99,
-            buy_price=1099.99,
-            date=date(2024, 6, 5),
-            has_warranty=True,
-            warranty_date=date(2026, 6, 5)
-        ),
-        Product(
-            code="CAB002",
-            name="USB-C to Lightning Cable",
-            list_price=29.99,
-            buy_price=24.99,
-            date=date(2024, 6, 5),
-            has_warranty=False,
-            warranty_date=None
-        ),
-    ],
-    3: [  # Bob Wilson's purchases
-        Product(
-            code="TAB001",
-            name="iPad Air",
-            list_price=599.99,
-            buy_price=549.99,
-            date=date(2023, 11, 20),
-            has_warranty=True,
-            warranty_date=date(2024, 11, 20)
-        ),
-        Product(
-            code="PEN001",
-            name="Apple Pencil 2nd Gen",
-            list_price=129.99,
-            buy_price=119.99,
-            date=date(2023, 11, 20),
-            has_warranty=True,
-            warranty_date=date(2024, 11, 20)
-        ),
-        Product(
-            code="KEY001",
-            name="Magic Keyboard",
-            list_price=299.99,
-            buy_price=279.99,
-            date=date(2023, 12, 5),
-            has_warranty=True,
-            warranty_date=date(2024, 12, 5)
-        ),
-        Product(
-            code="BAG001",
-            name="Laptop Backpack",
-            list_price=79.99,
-            buy_price=59.99,
-            date=date(2024, 1, 10),
-            has_warranty=False,
-            warranty_date=None
-        ),
-    ],
-}
+class CustomerCreate(CustomerIn):
+    id: Optional[int] = None            # assigned when left out
+
+
+class ChangeFeed(BaseModel):
+    changes: list[Change]
+    last_seq: int
+    reset: bool = False
+
+
+class _ChangeSignal:
+    """Wakes every change-feed waiter of this worker when it writes."""
+
+    def __init__(self):
+        self._event = asyncio.Event()
+
+    def notify(self) -> None:
+        self._event.set()
+        self._event = asyncio.Event()
+
+    async def wait(self, timeout: float) -> None:
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except TimeoutError:
+            pass
+
+
+_changed = _ChangeSignal()
+
+
+async def _store_call(fn, *args, **kwargs):
+    """Run a store method off the event loop when the store blocks (SQLite)."""
+    if store.blocking:
+        return await run_in_threadpool(fn, *args, **kwargs)
+    return fn(*args, **kwargs)
+
+
+def _encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(f"c:{last_id}".encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> int:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        prefix, last_id = raw.split(":", 1)
+        if prefix != "c":
+            raise ValueError(raw)
+        return int(last_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _encode_product_cursor(order: str, position: tuple) -> str:
+    key, product_id = position
+    value = key if order == "customer" else key.isoformat()
+    return base64.urlsafe_b64encode(f"p:{order}:{value}:{product_id}".encode()).decode().rstrip("=")
+
+
+def _decode_product_cursor(cursor: str, order: str) -> tuple:
+    """The position a product cursor points at; it must come from a query in the same `order`."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        prefix, cursor_order, value, product_id = raw.split(":")
+        if prefix != "p" or cursor_order != order:
+            raise ValueError(raw)
+        key = int(value) if order == "customer" else date.fromisoformat(value)
+        return key, int(product_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _parse_fields(fields: Optional[str]) -> Optional[set[str]]:
+    if not fields:
+        return None
+    wanted = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = wanted - Customer.model_fields.keys()
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown field(s): {', '.join(sorted(unknown))}. "
+                   f"Allowed: {', '.join(Customer.model_fields)}"
+        )
+    return wanted
 
 
 @app.get("/")
@@ -155,9 +189,9 @@ async def get_customer_by_email(email: EmailStr):
     Raises:
         HTTPException: 404 if customer not found
     """
-    for customer in customers_db:
-        if customer.email.lower() == email.lower():
-            return customer
+    customer = await _store_call(store.get_customer_by_email, email)
+    if customer is not None:
+        return customer
 
     raise HTTPException(
         status_code=404,
@@ -165,10 +199,109 @@ async def get_customer_by_email(email: EmailStr):
     )
 
 
-@app.get("/customers", response_model=list[Customer])
-async def get_all_customers():
-    """Get all customers in the database."""
-    return customers_db
+@app.get("/customer/profile", response_model=CustomerProfile)
+async def get_customer_profile(email: EmailStr):
+    """
+    Get a customer and all of their purchases by email address.
+
+    Combines /customer and /customer/{id}/products in one round trip.
+
+    Args:
+        email: Customer's email address
+
+    Returns:
+        The customer and their products (empty list if none)
+
+    Raises:
+        HTTPException: 404 if customer not found
+    """
+    customer = await _store_call(store.get_customer_by_email, email)
+    if customer is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Customer with email '{email}' not found"
+        )
+    return CustomerProfile(customer=customer, products=await _store_call(store.get_products, customer.id))
+
+
+@app.get("/customers", response_model=CustomerPage)
+async def get_all_customers(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    email_prefix: Optional[str] = None,
+    dob_from: Optional[date] = None,
+    dob_to: Optional[date] = None,
+):
+    """
+    Get customers one page at a time, in id order.
+
+    Args:
+        limit: Maximum number of customers in the page
+        cursor: Opaque cursor from the previous page's next_cursor
+        fields: Comma-separated subset of id,email,name,dob to return
+        email_prefix: Only customers whose email starts with this prefix
+        dob_from: Only customers born on or after this date
+        dob_to: Only customers born on or before this date
+
+    Returns:
+        Page with the projected customer rows and the cursor of the next page
+        (null on the last page)
+    """
+    include = _parse_fields(fields)
+    after_id = _decode_cursor(cursor) if cursor else 0
+
+    # Fetch one extra row to know whether another page follows
+    rows = await _store_call(store.page_customers, after_id, limit + 1, email_prefix=email_prefix,
+                             dob_from=dob_from, dob_to=dob_to)
+    next_cursor = _encode_cursor(rows[limit - 1].id) if len(rows) > limit else None
+
+    if fast_json.ENABLED:
+        # The rows come from the store, already validated – encode the page
+        # directly instead of revalidating and re-serializing every dict
+        page = {"items": [c.model_dump(include=include) for c in rows[:limit]], "next_cursor": next_cursor}
+        return Response(fast_json.dumps(page), media_type="application/json")
+
+    return CustomerPage(
+        items=[c.model_dump(mode="json", include=include) for c in rows[:limit]],
+        next_cursor=next_cursor,
+    )
+
+
+@app.post("/customers/batch", response_model=CustomerBatchResponse)
+async def get_customers_batch(req: CustomerBatchRequest):
+    """
+    Look up many customers by email and/or ID in one request.
+
+    Args:
+        req.emails: Email addresses to resolve
+        req.ids: Customer IDs to resolve
+        req.include_products: Also return the purchases of every customer found
+
+    Returns:
+        by_email / by_id keyed by the inputs exactly as sent (null when not
+        found) and, if requested, products keyed by customer ID
+
+    Raises:
+        HTTPException: 400 if more than MAX_BATCH_SIZE keys are sent
+    """
+    if len(req.emails) + len(req.ids) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_BATCH_SIZE} emails and ids per batch"
+        )
+
+    by_norm = await _store_call(store.get_customers_by_email, req.emails)
+    by_id = await _store_call(store.get_customers, req.ids)
+
+    result = CustomerBatchResponse(
+        by_email={e: by_norm.get(normalize_email(e)) for e in req.emails},
+        by_id={i: by_id.get(i) for i in req.ids},
+    )
+    if req.include_products:
+        found = {c.id for c in by_norm.values()} | by_id.keys()
+        result.products = await _store_call(store.get_products_many, sorted(found))
+    return result
 
 
 @app.get("/customer/{customer_id}/products", response_model=list[Product])
@@ -186,15 +319,14 @@ async def get_customer_products(customer_id: int):
         HTTPException: 404 if customer not found or has no purchases
     """
     # First check if customer exists
-    customer_exists = any(c.id == customer_id for c in customers_db)
-    if not customer_exists:
+    if not await _store_call(store.has_customer, customer_id):
         raise HTTPException(
             status_code=404,
             detail=f"Customer with ID {customer_id} not found"
         )
 
     # Get products for the customer
-    products = customer_products_db.get(customer_id, [])
+    products = await _store_call(store.get_products, customer_id)
 
     if not products:
         raise HTTPException(
@@ -205,6 +337,369 @@ async def get_customer_products(customer_id: int):
     return products
 
 
+@app.get("/products", response_model=ProductPage)
+async def find_products(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    customer_id: Optional[int] = None,
+    has_warranty: Optional[bool] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    warranty_from: Optional[date] = None,
+    warranty_to: Optional[date] = None,
+):
+    """
+    Find products across all customers, one page at a time.
+
+    Results follow the index the filter narrows by: warranty expiry date
+    when a warranty range is given, else purchase date when a purchase
+    range is given, else customer ID – always then purchase order.  A page
+    is one walk of that index from the cursor, so its cost does not depend
+    on how many products match.  Keep the filters the same while paging.
+
+    Args:
+        limit: Maximum number of products in the page
+        cursor: Opaque cursor from the previous page's next_cursor
+        customer_id: Only this customer's products
+        has_warranty: Only products with (true) or without (false) a warranty
+        date_from: Only products bought on or after this date
+        date_to: Only products bought on or before this date
+        warranty_from: Only warranties expiring on or after this date
+        warranty_to: Only warranties expiring on or before this date
+
+    Returns:
+        Page of products, each with its customer_id and discount
+        (list_price - buy_price), and the cursor of the next page (null on
+        the last page)
+    """
+    f = ProductFilter(customer_id=customer_id, has_warranty=has_warranty, date_from=date_from,
+                      date_to=date_to, warranty_from=warranty_from, warranty_to=warranty_to)
+    order = product_order(f)
+    after = _decode_product_cursor(cursor, order) if cursor else None
+
+    # Fetch one extra row to know whether another page follows
+    rows = await _store_call(store.find_products, f, after, limit + 1)
+    next_cursor = _encode_product_cursor(order, rows[limit - 1][0]) if len(rows) > limit else None
+    items = [
+        CustomerProduct.model_construct(customer_id=cid, discount=round(p.list_price - p.buy_price, 2),
+                                        **p.__dict__)
+        for _, cid, p in rows[:limit]
+    ]
+    return ProductPage(items=items, next_cursor=next_cursor)
+
+
+@app.get("/products/summary", response_model=ProductSummary)
+async def summarize_products(
+    by_customer: bool = False,
+    order_by: Literal["spend", "discount", "count"] = "spend",
+    limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE),
+    customer_id: Optional[int] = None,
+    has_warranty: Optional[bool] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    warranty_from: Optional[date] = None,
+    warranty_to: Optional[date] = None,
+):
+    """
+    Count and total the products matching the same filters as /products.
+
+    Args:
+        by_customer: Also return per-customer totals
+        order_by: Rank customers by spend (sum of buy_price), discount
+            (sum of list_price - buy_price) or number of products
+        limit: Number of customers returned with by_customer
+        customer_id, has_warranty, date_from, date_to, warranty_from,
+        warranty_to: Filters, as for /products
+
+    Returns:
+        totals (count, with_warranty, list_total, spend, discount) and, with
+        by_customer, the top `limit` customers by `order_by`
+    """
+    f = ProductFilter(customer_id=customer_id, has_warranty=has_warranty, date_from=date_from,
+                      date_to=date_to, warranty_from=warranty_from, warranty_to=warranty_to)
+    totals, groups = await _store_call(store.summarize_products, f, by_customer, order_by, limit)
+    return ProductSummary(totals=totals, by_customer=groups)
+
+
+# ---------------------------------------------------------------------------
+# Writes – every one is recorded in the store's change log
+# ---------------------------------------------------------------------------
+def _not_found(customer_id: int) -> HTTPException:
+    return HTTPException(status_code=404, detail=f"Customer with ID {customer_id} not found")
+
+
+@app.post("/customers", response_model=Customer, status_code=201)
+async def create_customer(req: CustomerCreate):
+    """
+    Create a customer.
+
+    Args:
+        req: email, name and dob, plus an optional id (next free id if omitted)
+
+    Returns:
+        The created customer
+
+    Raises:
+        HTTPException: 409 if the id or email is already taken
+    """
+    customer_id = req.id if req.id is not None else await _store_call(store.next_customer_id)
+    try:
+        customer = await _store_call(
+            store.add_customer, Customer(id=customer_id, email=req.email, name=req.name, dob=req.dob))
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    _changed.notify()
+    return customer
+
+
+@app.put("/customer/{customer_id}", response_model=Customer)
+async def update_customer(customer_id: int, req: CustomerIn):
+    """
+    Replace a customer's email, name and dob.
+
+    Raises:
+        HTTPException: 404 if customer not found, 409 if the email is taken
+    """
+    try:
+        customer = await _store_call(
+            store.update_customer, Customer(id=customer_id, email=req.email, name=req.name, dob=req.dob))
+    except KeyError:
+        raise _not_found(customer_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    _changed.notify()
+    return customer
+
+
+@app.delete("/customer/{customer_id}", response_model=Customer)
+async def delete_customer(customer_id: int):
+    """
+    Delete a customer and their products.
+
+    Returns:
+        The deleted customer
+
+    Raises:
+        HTTPException: 404 if customer not found
+    """
+    try:
+        customer = await _store_call(store.delete_customer, customer_id)
+    except KeyError:
+        raise _not_found(customer_id)
+    _changed.notify()
+    return customer
+
+
+@app.put("/customer/{customer_id}/products", response_model=list[Product])
+async def replace_customer_products(customer_id: int, products: list[Product]):
+    """
+    Replace all products of a customer (an empty list removes them all).
+
+    Raises:
+        HTTPException: 404 if customer not found
+    """
+    try:
+        items = await _store_call(store.set_products, customer_id, products)
+    except KeyError:
+        raise _not_found(customer_id)
+    _changed.notify()
+    return items
+
+
+@app.post("/customer/{customer_id}/products", response_model=Product, status_code=201)
+async def add_customer_product(customer_id: int, product: Product):
+    """
+    Add one product to a customer's purchases.
+
+    Raises:
+        HTTPException: 404 if customer not found
+    """
+    try:
+        item = await _store_call(store.add_product, customer_id, product)
+    except KeyError:
+        raise _not_found(customer_id)
+    _changed.notify()
+    return item
+
+
+@app.delete("/customer/{customer_id}/products/{code}", response_model=Product)
+async def delete_customer_product(customer_id: int, code: str):
+    """
+    Remove a customer's product (the first one with this code).
+
+    Returns:
+        The removed product
+
+    Raises:
+        HTTPException: 404 if the customer has no product with this code
+    """
+    try:
+        item = await _store_call(store.delete_product, customer_id, code)
+    except KeyError:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No product '{code}' found for customer with ID {customer_id}"
+        )
+    _changed.notify()
+    return item
+
+
+# ---------------------------------------------------------------------------
+# Change feed
+# ---------------------------------------------------------------------------
+@app.get("/changes", response_model=ChangeFeed)
+async def get_changes(
+    since: Optional[int] = Query(None, ge=0),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    wait: float = Query(0, ge=0, le=MAX_CHANGE_WAIT),
+):
+    """
+    Get the changes to customers and products made after `since`, oldest first.
+
+    Sequence numbers are monotonic and never reused.  A consumer calls once
+    without `since` to learn the current position, then long-polls from
+    there.
+
+    Args:
+        since: Sequence number of the last change already seen
+        limit: Maximum number of changes returned
+        wait: Seconds to hold the request open while there is nothing new
+
+    Returns:
+        changes, last_seq (the `since` of the next call) and reset – true
+        when the log no longer reaches back to `since` (pruned, or the
+        store was recreated), so the consumer must drop everything it has
+        cached and continue from last_seq
+    """
+    if since is None:
+        return ChangeFeed(changes=[], last_seq=await _store_call(store.last_change_seq))
+
+    # The waiting stays on the event loop; only the store reads leave it
+    deadline = time.monotonic() + wait
+    while True:
+        changes = await _store_call(store.changes_since, since, limit)
+        if changes is None:
+            return ChangeFeed(changes=[], last_seq=await _store_call(store.last_change_seq), reset=True)
+        remaining = deadline - time.monotonic()
+        if changes or remaining <= 0:
+            return ChangeFeed(changes=changes, last_seq=changes[-1].seq if changes else since)
+        await _changed.wait(min(remaining, CHANGE_POLL_INTERVAL))
+
+
+async def _change_events(since: Optional[int]):
+    """The change log as server-sent events, from `since` on, forever."""
+    cursor = await _store_call(store.last_change_seq) if since is None else since
+    idle = 0.0
+    yield "retry: 2000\n\n"
+    while True:
+        changes = await _store_call(store.changes_since, cursor, MAX_PAGE_SIZE)
+        if changes is None:
+            cursor = await _store_call(store.last_change_seq)
+            yield f"id: {cursor}\nevent: reset\ndata: {{\"last_seq\": {cursor}}}\n\n"
+            continue
+        if changes:
+            yield "".join(f"id: {c.seq}\nevent: change\ndata: {c.model_dump_json()}\n\n" for c in changes)
+            cursor = changes[-1].seq
+            idle = 0.0
+            continue
+        if idle >= SSE_HEARTBEAT:
+            yield ": keepalive\n\n"
+            idle = 0.0
+        started = time.monotonic()
+        await _changed.wait(CHANGE_POLL_INTERVAL)
+        idle += time.monotonic() - started
+
+
+@app.get("/changes/stream")
+async def stream_changes(request: Request, since: Optional[int] = Query(None, ge=0)):
+    """
+    Stream the change log as server-sent events.
+
+    One `change` event per change, with the sequence number as the event id,
+    so a reconnecting EventSource resumes via Last-Event-ID.  A `reset`
+    event means the log no longer reaches back to the resume point (see
+    /changes).  Idle streams get a comment line every SSE_HEARTBEAT seconds.
+
+    Args:
+        since: Sequence number to resume after (default: the current one)
+    """
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit():
+        since = int(last_event_id)
+    return StreamingResponse(_change_events(since), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+
+async def _export_lines(include_products: bool):
+    """Yield the export one store batch at a time as NDJSON text chunks.
+
+    Walks keyset pages like store.iter_customers, but each read goes
+    through _store_call: the in-memory store stays on the event loop and
+    SQLite queries run in the threadpool.  Memory stays at one batch.
+    """
+    after_id = 0
+    while batch := await _store_call(store.page_customers, after_id, EXPORT_BATCH_SIZE):
+        after_id = batch[-1].id
+        if include_products:
+            # One products query per batch, not one per customer
+            products = await _store_call(store.get_products_many, [c.id for c in batch])
+            lines = []
+            for c in batch:
+                row = c.model_dump()
+                row["products"] = [p.model_dump() for p in products[c.id]]
+                lines.append(fast_json.dumps_str(row))
+        else:
+            lines = [c.model_dump_json() for c in batch]
+        yield "\n".join(lines) + "\n"
+
+
+@app.get("/export/customers.ndjson")
+async def export_customers(include_products: bool = False):
+    """
+    Stream every customer as newline-delimited JSON (one object per line).
+
+    Rows are read from the store in batches and written as they are produced,
+    so the first byte goes out immediately and memory use does not depend on
+    the size of the dataset.
+
+    Args:
+        include_products: Add each customer's purchases inline as "products"
+    """
+    return StreamingResponse(
+        _export_lines(include_products),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="customers.ndjson"'},
+    )
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Latency histograms of this worker in the Prometheus text format."""
+    return Response(telemetry.render_metrics(), media_type=telemetry.CONTENT_TYPE)
+
+
+@app.get("/traces", include_in_schema=False)
+async def traces(trace_id: Optional[str] = None, limit: int = Query(200, ge=1, le=2000)):
+    """Recently sampled spans of this worker, newest first."""
+    return {"spans": telemetry.recent_spans(trace_id, limit)}
+
+
 if __name__ == "__main__":
+    import logging
+
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+
+    port = int(os.getenv("API_PORT", "8000"))
+
+    # Several workers only make sense over a shared on-disk store: with the
+    # in-memory one each worker would hold, and write to, its own copy
+    workers = int(os.getenv("API_WORKERS", "1"))
+    if workers > 1 and not os.getenv("CUSTOMER_DB_PATH"):
+        logging.getLogger("uvicorn.error").warning(
+            "API_WORKERS=%d ignored: the in-memory store is per process, "
+            "set CUSTOMER_DB_PATH to share a SQLite store – starting one worker", workers)
+        workers = 1
+    if workers > 1:
+        uvicorn.run("api:app", host="0.0.0.0", port=port, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=port)
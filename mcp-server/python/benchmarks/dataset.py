@@ -0,0 +1,69 @@
+"""
+Synthetic customer/product datasets for the benchmarks.
+
+Customers are user<N>@example.com with ids 1..N, so a driver can pick
+emails without reading the database back.
+
+    customers, products = synthetic_dataset(10_000, 5)
+    build_sqlite("/tmp/customers.db", 1_000_000, 5)     # for CUSTOMER_DB_PATH
+"""
+
+import os
+import sys
+from datetime import date, timedelta
+from typing import Iterator
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Customer, Product
+
+
+def email_of(customer_id: int) -> str:
+    return f"user{customer_id}@example.com"
+
+
+def _customers(first: int, last: int) -> list[Customer]:
+    return [
+        Customer(id=i, email=email_of(i), name=f"User {i}",
+                 dob=date(1960, 1, 1) + timedelta(days=i % 15000))
+        for i in range(first, last + 1)
+    ]
+
+
+def _products(n_products: int) -> list[Product]:
+    return [
+        Product(code=f"P{j:04d}", name=f"Product {j}", list_price=100.0 + j, buy_price=90.0 + j,
+                date=date(2024, 1, 1) + timedelta(days=j), has_warranty=j % 2 == 0,
+                warranty_date=date(2026, 1, 1) if j % 2 == 0 else None)
+        for j in range(n_products)
+    ]
+
+
+def synthetic_dataset(n_customers: int, n_products: int) -> tuple[list[Customer], dict[int, list[Product]]]:
+    """`n_customers` customers with `n_products` purchases each, in memory."""
+    customers = _customers(1, n_customers)
+    products = _products(n_products)
+    return customers, {c.id: products for c in customers}
+
+
+def _chunks(n_customers: int, size: int) -> Iterator[tuple[int, int]]:
+    for first in range(1, n_customers + 1, size):
+        yield first, min(first + size - 1, n_customers)
+
+
+def build_sqlite(path: str, n_customers: int, n_products: int, chunk_size: int = 10_000) -> str:
+    """Write a dataset to a fresh SQLite file in chunks (bounded memory)."""
+    from customer_store import SQLiteCustomerStore
+
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    store = SQLiteCustomerStore(path)
+    products = _products(n_products)
+    try:
+        for first, last in _chunks(n_customers, chunk_size):
+            customers = _customers(first, last)
+            store.bulk_load(customers, {c.id: products for c in customers})
+    finally:
+        store.close()
+    return path
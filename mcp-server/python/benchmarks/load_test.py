@@ -0,0 +1,425 @@
+"""
+Load test – api.py, mcp_server_http.py and the orchestrator, end to end.
+
+Builds a synthetic SQLite dataset and starts the Customer API, the MCP
+server and a stub LLM (benchmarks/stub_llm.py) on free local ports. It then
+drives each layer at a fixed concurrency:
+
+    api           GET /customer/profile over a shared httpx client
+    mcp           customer_get_profile through pooled MCPClient sessions
+    orchestrator  fetch_user_and_products (LLM loop, stub model, no result cache)
+    planner       plan_user_and_products(summarize=False)
+    export        one streamed /export/customers.ndjson?include_products=true
+    stream        stream_user_and_products, the stub streaming its completions
+                  (opt-in: --layers ...,stream)
+
+Each layer reports throughput, p50/p95/p99 latency, errors and the RSS of the
+API, the MCP server and this driver process. Results are written as JSON
+(benchmarks/results/<time>-<commit>.json by default), so two commits can be
+compared:
+
+    python benchmarks/load_test.py --customers 100000 --concurrency 32 --requests 5000
+    python benchmarks/load_test.py --compare benchmarks/results/<old>.json
+
+Runs fully offline. RSS is read from /proc, so it is only reported on Linux.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable, Optional
+
+from dataset import build_sqlite, email_of
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)                # mcp-server/python
+LAYERS = ("api", "mcp", "orchestrator", "planner", "export", "stream")
+
+
+# ===========================================================================
+# Processes
+# ===========================================================================
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _rss_mb(pid: Optional[int] = None) -> dict:
+    """Current and peak resident set size in MB (empty off Linux)."""
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+    except OSError:
+        return {}
+    kb = lambda key: int(fields[key].split()[0]) if key in fields else 0
+    return {"rss_mb": round(kb("VmRSS") / 1024, 1), "peak_rss_mb": round(kb("VmHWM") / 1024, 1)}
+
+
+def _process_tree(pid: int) -> list[int]:
+    pids, pending = [], [pid]
+    while pending:
+        pid = pending.pop()
+        pids.append(pid)
+        try:
+            with open(f"/proc/{pid}/task/{pid}/children") as f:
+                pending.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+class Service:
+    """A local server process with its log in the work directory."""
+
+    def __init__(self, name: str, argv: list[str], env: dict, ready_url: str, workdir: str):
+        self.name = name
+        self.ready_url = ready_url
+        self.log_path = os.path.join(workdir, f"{name}.log")
+        self._log = open(self.log_path, "w")
+        self.proc = subprocess.Popen(
+            argv, cwd=ROOT, env={**os.environ, **env}, stdout=self._log, stderr=subprocess.STDOUT,
+            stdin=subprocess.DEVNULL, start_new_session=True,
+        )
+
+    def wait_ready(self, timeout: float = 60.0):
+        import httpx
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"{self.name} exited with {self.proc.returncode}, see {self.log_path}")
+            try:
+                httpx.get(self.ready_url, timeout=1.0)
+                return
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        raise RuntimeError(f"{self.name} not ready after {timeout}s, see {self.log_path}")
+
+    def rss(self) -> dict:
+        """RSS of the process and its children (uvicorn workers), summed."""
+        total: dict = {}
+        for pid in _process_tree(self.proc.pid):
+            for key, value in _rss_mb(pid).items():
+                total[key] = round(total.get(key, 0) + value, 1)
+        return total
+
+    def stop(self):
+        if self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        self._log.close()
+
+
+# ===========================================================================
+# Measurement
+# ===========================================================================
+def _summary(latencies: list[float], errors: int, wall: float) -> dict:
+    """Throughput and latency percentiles (ms) of one layer."""
+    if len(latencies) < 2:
+        p50 = p95 = p99 = latencies[0] if latencies else None
+    else:
+        q = statistics.quantiles(latencies, n=100, method="inclusive")
+        p50, p95, p99 = q[49], q[94], q[98]
+    r = lambda v: round(v, 2) if v is not None else None
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 1) if wall else 0.0,
+        "mean_ms": r(statistics.fmean(latencies)) if latencies else None,
+        "p50_ms": r(p50), "p95_ms": r(p95), "p99_ms": r(p99),
+    }
+
+
+async def _drive(op: Callable[[int], Awaitable[bool]], total: int, concurrency: int,
+                 warmup: int = 0) -> dict:
+    """Run op(0..total-1) on `concurrency` workers; op returns True on success."""
+    for i in range(warmup):
+        with contextlib.suppress(Exception):
+            await op(i)
+
+    latencies: list[float] = []
+    errors = 0
+    counter = itertools.count()
+
+    async def worker():
+        nonlocal errors
+        while (i := next(counter)) < total:
+            start = time.perf_counter()
+            try:
+                ok = await op(i)
+            except Exception:
+                ok = False
+            if ok:
+                latencies.append((time.perf_counter() - start) * 1000)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return _summary(latencies, errors, time.perf_counter() - start)
+
+
+# ===========================================================================
+# Layers
+# ===========================================================================
+async def bench_api(args, urls, emails) -> dict:
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=urls["api"], limits=limits, timeout=30.0) as http:
+        async def op(i: int) -> bool:
+            resp = await http.get("/customer/profile", params={"email": emails[i]})
+            return resp.status_code == 200
+        return await _drive(op, args.requests, args.concurrency, warmup=args.concurrency)
+
+
+async def bench_mcp(args, urls, emails, pool) -> dict:
+    async def op(i: int) -> bool:
+        async with pool.session() as client:
+            result = await client.call_tool("customer_get_profile",
+                                            {"email": emails[i], "response_format": "json"})
+        return not result["isError"]
+    return await _drive(op, args.requests, args.concurrency, warmup=args.concurrency)
+
+
+async def bench_orchestrator(args, urls, emails, pool, planner: bool) -> dict:
+    import mcp_orchestrator as orchestrator
+
+    async def op(i: int) -> bool:
+        if planner:
+            record = await orchestrator.plan_user_and_products(
+                urls["mcp"], emails[i], summarize=False, fallback=False, pool=pool, cache=None)
+        else:
+            record = await orchestrator.fetch_user_and_products(urls["mcp"], emails[i], pool=pool, cache=None)
+        return record.get("user_record") is not None
+    return await _drive(op, args.orchestrations, args.concurrency, warmup=min(4, args.concurrency))
+
+
+async def bench_stream(args, urls, emails, pool) -> dict:
+    import mcp_orchestrator as orchestrator
+
+    async def op(i: int) -> bool:
+        record = {}
+        async for _ in orchestrator.stream_user_and_products(urls["mcp"], emails[i], pool=pool,
+                                                             record=record, cache=None):
+            pass
+        return record.get("user_record") is not None
+    return await _drive(op, args.orchestrations, args.concurrency, warmup=min(4, args.concurrency))
+
+
+async def bench_export(args, urls) -> dict:
+    import httpx
+
+    async with httpx.AsyncClient(base_url=urls["api"], timeout=None) as http:
+        start = time.perf_counter()
+        ttfb, size = None, 0
+        async with http.stream("GET", "/export/customers.ndjson", params={"include_products": "true"}) as resp:
+            async for chunk in resp.aiter_bytes():
+                if ttfb is None:
+                    ttfb = time.perf_counter() - start
+                size += len(chunk)
+        total = time.perf_counter() - start
+    return {
+        "requests": 1, "errors": 0 if resp.status_code == 200 else 1,
+        "ttfb_ms": round(ttfb * 1000, 2) if ttfb is not None else None,
+        "total_ms": round(total * 1000, 2),
+        "mb": round(size / 2 ** 20, 1),
+        "mb_per_s": round(size / 2 ** 20 / total, 1) if total else None,
+    }
+
+
+# ===========================================================================
+# Runner
+# ===========================================================================
+def _git_commit() -> Optional[str]:
+    try:
+        sha = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return f"{sha}-dirty" if dirty else sha
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_layers(args, urls, services) -> dict:
+    # The orchestrator reads its LLM endpoint and limits at import time
+    os.environ.update({
+        "AZURE_OPENAI_ENDPOINT": urls["llm"],
+        "AZURE_OPENAI_API_KEY": "stub",
+        "ORCHESTRATION_CACHE_TTL": "0",
+        "LLM_CONCURRENCY": str(max(16, args.concurrency)),
+        "MCP_TOOL_CATALOG_DIR": os.path.join(args.workdir, "tool_catalog"),
+    })
+    from mcp_client import MCPClientPool
+
+    rng = random.Random(args.seed)
+    emails = [email_of(rng.randint(1, args.customers)) for _ in range(max(args.requests, args.orchestrations))]
+
+    results = {}
+    # MCPClient and the orchestrator print per call – keep the report readable
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        async with MCPClientPool(urls["mcp"], size=args.concurrency) as pool:
+            await pool.warm()
+            for layer in args.layers:
+                if layer == "api":
+                    result = await bench_api(args, urls, emails)
+                elif layer == "mcp":
+                    result = await bench_mcp(args, urls, emails, pool)
+                elif layer in ("orchestrator", "planner"):
+                    result = await bench_orchestrator(args, urls, emails, pool, planner=layer == "planner")
+                elif layer == "stream":
+                    result = await bench_stream(args, urls, emails, pool)
+                else:
+                    result = await bench_export(args, urls)
+                result["memory"] = {name: s.rss() for name, s in services.items()}
+                result["memory"]["driver"] = _rss_mb()
+                results[layer] = result
+                print(f"{layer} done", file=sys.stderr)
+    return results
+
+
+def run(args) -> dict:
+    os.makedirs(args.workdir, exist_ok=True)
+    db = args.db or os.path.join(args.workdir, f"customers-{args.customers}x{args.products}.db")
+    if not args.db or not os.path.exists(db):
+        started = time.perf_counter()
+        build_sqlite(db, args.customers, args.products)
+        print(f"dataset {db} built in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    ports = {name: _free_port() for name in ("api", "mcp", "llm")}
+    urls = {
+        "api": f"http://127.0.0.1:{ports['api']}",
+        "mcp": f"http://127.0.0.1:{ports['mcp']}/mcp",
+        "llm": f"http://127.0.0.1:{ports['llm']}",
+    }
+    services: dict[str, Service] = {}
+    try:
+        services["api"] = Service(
+            "api", [sys.executable, "api.py"],
+            {"CUSTOMER_DB_PATH": db, "CUSTOMER_DB_SEED": "0", "API_PORT": str(ports["api"]),
+             "API_WORKERS": str(args.api_workers)},
+            f"{urls['api']}/", args.workdir)
+        services["mcp"] = Service(
+            "mcp", [sys.executable, "mcp_server_http.py"],
+            {"CUSTOMER_API_URL": urls["api"], "MCP_PORT": str(ports["mcp"]),
+             "MCP_WORKERS": str(args.mcp_workers)},
+            f"http://127.0.0.1:{ports['mcp']}/cache/stats", args.workdir)
+        services["llm"] = Service(
+            "llm", [sys.executable, os.path.join(HERE, "stub_llm.py"), "--port", str(ports["llm"]),
+                    "--latency", str(args.llm_latency)],
+            {}, f"{urls['llm']}/docs", args.workdir)
+        for service in services.values():
+            service.wait_ready()
+
+        layers = asyncio.run(run_layers(args, urls, services))
+    finally:
+        for service in services.values():
+            service.stop()
+
+    config = {k: v for k, v in vars(args).items() if k not in ("compare", "out", "workdir")}
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": config,
+        "layers": layers,
+    }
+
+
+# ===========================================================================
+# Reporting
+# ===========================================================================
+def print_report(result: dict):
+    print(f"\ncommit {result['git_commit']}  {result['timestamp']}  config {json.dumps(result['config'])}\n")
+    print(f"{'layer':14} {'reqs':>7} {'errs':>5} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+          f" {'api MB':>8} {'mcp MB':>8} {'driver MB':>10}")
+    for layer, r in result["layers"].items():
+        mem = r.get("memory", {})
+        mb = lambda name: mem.get(name, {}).get("rss_mb", "-")
+        if layer == "export":
+            print(f"{layer:14} {r['requests']:>7} {r['errors']:>5} ttfb {r['ttfb_ms']} ms, "
+                  f"{r['mb']} MB in {r['total_ms']} ms ({r['mb_per_s']} MB/s)"
+                  f"{'':4} api peak {mem.get('api', {}).get('peak_rss_mb', '-')} MB")
+            continue
+        ms = lambda key: "-" if r[key] is None else r[key]
+        print(f"{layer:14} {r['requests']:>7} {r['errors']:>5} {r['throughput_rps']:>9} {ms('p50_ms'):>9}"
+              f" {ms('p95_ms'):>9} {ms('p99_ms'):>9} {mb('api'):>8} {mb('mcp'):>8} {mb('driver'):>10}")
+
+
+def print_comparison(old: dict, new: dict):
+    """Relative change per layer; positive throughput / negative latency is better."""
+    print(f"\n{old['git_commit']} → {new['git_commit']}")
+    if old.get("config") != new.get("config"):
+        print("warning: the two runs used different configurations")
+    metrics = ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "ttfb_ms", "total_ms")
+    for layer, r in new["layers"].items():
+        before = old["layers"].get(layer)
+        if not before:
+            continue
+        changes = []
+        for metric in metrics:
+            a, b = before.get(metric), r.get(metric)
+            if a and b is not None:
+                changes.append(f"{metric} {a} → {b} ({(b - a) / a * 100:+.1f}%)")
+        print(f"  {layer:14} " + ", ".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load test of the API, MCP server and orchestrator")
+    parser.add_argument("--customers", type=int, default=10_000, help="synthetic customers")
+    parser.add_argument("--products", type=int, default=5, help="products per customer")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight per layer")
+    parser.add_argument("--requests", type=int, default=2000, help="requests for the api and mcp layers")
+    parser.add_argument("--orchestrations", type=int, default=200, help="runs for the orchestrator layers")
+    parser.add_argument("--layers", default="api,mcp,orchestrator,planner,export",
+                        help=f"comma-separated subset of {','.join(LAYERS)}")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="stub LLM seconds per completion")
+    parser.add_argument("--api-workers", type=int, default=1)
+    parser.add_argument("--mcp-workers", type=int, default=1, help="MCP server workers (stateless when > 1)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the email sequence")
+    parser.add_argument("--db", help="reuse (or create) this dataset file instead of a temporary one")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "mcp-load-test"))
+    parser.add_argument("--out", help="result file (default benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--compare", metavar="OLD_JSON",
+                        help="print the change against an earlier result file")
+    args = parser.parse_args()
+    args.layers = [layer.strip() for layer in args.layers.split(",") if layer.strip()]
+    unknown = set(args.layers) - set(LAYERS)
+    if unknown:
+        parser.error(f"unknown layer(s): {', '.join(sorted(unknown))}")
+
+    result = run(args)
+    print_report(result)
+
+    out = args.out or os.path.join(
+        HERE, "results", f"{time.strftime('%Y%m%d-%H%M%S')}-{result['git_commit'] or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nresults written to {out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), result)
+
+
+if __name__ == "__main__":
+    main()
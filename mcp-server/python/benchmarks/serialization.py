@@ -0,0 +1,101 @@
+"""
+Serialization benchmark – standard path vs fast mode (see fast_json.py).
+
+Loads a synthetic dataset into the in-memory store and times the large-list
+responses of api.py, plus the decode/re-encode the MCP server does on a
+batch payload, once with FAST_JSON=0 and once with the fast path. Each mode runs
+in its own interpreter because the mode is fixed at import time.
+
+    python benchmarks/serialization.py                      # 20k customers x 10 products
+    python benchmarks/serialization.py --customers 50000 --products 20 --repeat 20
+
+orjson must be installed for the fast column to differ from the standard one.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from dataset import synthetic_dataset
+
+
+def _time(fn, repeat: int) -> float:
+    """Median wall time of `fn` in milliseconds."""
+    fn()                                            # warm-up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def run_worker(args) -> dict:
+    """Measure one mode in this interpreter (FAST_JSON is already set)."""
+    from fastapi.testclient import TestClient
+    import api
+    import fast_json
+    from customer_store import InMemoryCustomerStore
+
+    customers, products = synthetic_dataset(args.customers, args.products)
+    api.store = InMemoryCustomerStore()
+    api.store.bulk_load(customers, products)
+    client = TestClient(api.app)
+
+    batch_body = {"ids": list(range(1, api.MAX_BATCH_SIZE + 1)), "include_products": True}
+    requests = {
+        "GET /customers?limit=1000": lambda: client.get("/customers", params={"limit": 1000}),
+        "GET /customers?limit=1000&fields=id,email": lambda: client.get(
+            "/customers", params={"limit": 1000, "fields": "id,email"}),
+        "POST /customers/batch (500 ids + products)": lambda: client.post("/customers/batch", json=batch_body),
+        "GET /export/customers.ndjson?include_products": lambda: client.get(
+            "/export/customers.ndjson", params={"include_products": "true"}),
+    }
+
+    results = {}
+    for name, send in requests.items():
+        assert send().status_code == 200, name
+        results[name] = _time(send, args.repeat)
+
+    # The MCP server's share: decode the API response, re-encode it for the tool result
+    payload = client.post("/customers/batch", json=batch_body).content
+    results["MCP decode + encode (batch payload)"] = _time(
+        lambda: fast_json.dumps_str(fast_json.loads(payload)), args.repeat)
+    return {"fast": fast_json.ENABLED, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--customers", type=int, default=20000)
+    parser.add_argument("--products", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args)))
+        return
+
+    runs = {}
+    for mode in ("0", "1"):
+        out = subprocess.run(
+            [sys.executable, __file__, "--worker", "--customers", str(args.customers),
+             "--products", str(args.products), "--repeat", str(args.repeat)],
+            env={**os.environ, "FAST_JSON": mode}, capture_output=True, text=True, check=True,
+        )
+        runs[mode] = json.loads(out.stdout.strip().splitlines()[-1])
+    if not runs["1"]["fast"]:
+        print("orjson is not installed – both columns use the standard path\n")
+
+    print(f"{'':48} {'standard ms':>12} {'fast ms':>10} {'speed-up':>9}")
+    for name, slow in runs["0"]["results"].items():
+        fast = runs["1"]["results"][name]
+        print(f"{name:48} {slow:12.2f} {fast:10.2f} {slow / fast:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
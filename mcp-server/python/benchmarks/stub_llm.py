@@ -0,0 +1,136 @@
+"""
+Stub LLM – an offline, OpenAI-compatible chat completions server.
+
+Stands in for Azure OpenAI so the orchestrator can be benchmarked without
+network access or token cost. It plays the model's part of the customer
+query deterministically:
+
+* no tool result yet  → one tool call: customer_get_profile (or
+  customer_get_by_email if the profile tool is not offered) for the email
+  found in the user message
+* otherwise           → a short final answer built from the tool results
+
+Both the Azure route (/openai/deployments/<name>/chat/completions) and the
+plain OpenAI route (/v1/chat/completions) are served. `"stream": true`
+returns the same message as server-sent chat.completion.chunk events – the
+answer a few characters per chunk, each tool call's arguments split across
+chunks – ending with a usage chunk when stream_options.include_usage is
+set. `--latency` adds a fixed think time per completion.
+
+    python benchmarks/stub_llm.py --port 8100 --latency 0.05
+    AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8100 AZURE_OPENAI_API_KEY=stub python mcp_orchestrator.py
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+LATENCY = float(os.getenv("STUB_LLM_LATENCY", "0"))      # seconds per completion
+CHUNK_CHARS = 8                                           # streamed text per chunk
+
+_EMAIL = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+
+app = FastAPI(title="Stub LLM")
+
+
+def _tool_names(body: dict) -> set[str]:
+    return {t["function"]["name"] for t in body.get("tools") or [] if t.get("type") == "function"}
+
+
+def _message(body: dict) -> tuple[dict, str]:
+    messages = body.get("messages", [])
+    tool_results = [m.get("content") or "" for m in messages if m.get("role") == "tool"]
+    if tool_results:
+        answer = "Here is what I found: " + " ".join(tool_results)[:300]
+        return {"role": "assistant", "content": answer}, "stop"
+
+    question = next((m.get("content") or "" for m in messages if m.get("role") == "user"), "")
+    match = _EMAIL.search(question)
+    tools = _tool_names(body)
+    if not match or not tools:
+        return {"role": "assistant", "content": "I can't look that up."}, "stop"
+    name = "customer_get_profile" if "customer_get_profile" in tools else "customer_get_by_email"
+    call = {"id": "call_0", "type": "function",
+            "function": {"name": name, "arguments": json.dumps({"email": match.group(0)})}}
+    return {"role": "assistant", "content": None, "tool_calls": [call]}, "tool_calls"
+
+
+def _usage(body: dict, message: dict) -> dict:
+    prompt_tokens = len(json.dumps(body.get("messages", []))) // 4
+    completion_tokens = len(json.dumps(message)) // 4
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+def _pieces(text: str) -> list[str]:
+    return [text[i:i + CHUNK_CHARS] for i in range(0, len(text), CHUNK_CHARS)]
+
+
+async def _complete(body: dict, model: str):
+    if LATENCY:
+        await asyncio.sleep(LATENCY)
+    message, finish_reason = _message(body)
+    if body.get("stream"):
+        return StreamingResponse(_stream(body, model, message, finish_reason), media_type="text/event-stream")
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+        "usage": _usage(body, message),
+    }
+
+
+async def _stream(body: dict, model: str, message: dict, finish_reason: str):
+    created = int(time.time())
+
+    def event(choices: list, **extra) -> str:
+        chunk = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": created,
+                 "model": model, "choices": choices, **extra}
+        return f"data: {json.dumps(chunk)}\n\n"
+
+    def delta(d: dict, finish=None) -> str:
+        return event([{"index": 0, "delta": d, "finish_reason": finish}])
+
+    yield delta({"role": "assistant", "content": ""})
+    for piece in _pieces(message.get("content") or ""):
+        yield delta({"content": piece})
+    for index, call in enumerate(message.get("tool_calls") or []):
+        fn = call["function"]
+        yield delta({"tool_calls": [{"index": index, "id": call["id"], "type": "function",
+                                     "function": {"name": fn["name"], "arguments": ""}}]})
+        for piece in _pieces(fn["arguments"]):
+            yield delta({"tool_calls": [{"index": index, "function": {"arguments": piece}}]})
+    yield delta({}, finish_reason)
+    if (body.get("stream_options") or {}).get("include_usage"):
+        yield event([], usage=_usage(body, message))
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/openai/deployments/{deployment}/chat/completions")
+async def azure_chat_completions(deployment: str, request: Request):
+    return await _complete(await request.json(), deployment)
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    return await _complete(body, body.get("model", "stub"))
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Offline OpenAI-compatible stub LLM")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=LATENCY, help="seconds per completion")
+    args = parser.parse_args()
+    LATENCY = args.latency
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
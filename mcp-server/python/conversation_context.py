@@ -0,0 +1,170 @@
+"""
+Conversation context – keeps the orchestrator's prompt small.
+
+The whole message history is resent on every chat completion, so anything
+appended to it is paid for again in every later round. ConversationContext
+trims what goes in and what stays:
+
+* force_json()      asks tools that support it for response_format='json'
+                    (denser than the markdown rendering)
+* tool_message()    turns an MCP result into a compact tool message – the
+                    structured content (or JSON text) is encoded without
+                    whitespace and null fields are stripped
+* prune()           once the model has seen a tool result for `keep_rounds`
+                    completions it is summarized (cut to `summary_chars`),
+                    and if the estimate is still over `token_budget` the
+                    oldest results are replaced by a placeholder
+* record_usage()    keeps the prompt-token count the API reports per round
+
+Token counts are estimated with tiktoken when it is installed and with a
+4-characters-per-token heuristic otherwise.
+"""
+
+import json
+from typing import Any, Dict, List, Optional
+
+import fast_json
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:                       # not installed / no encoding files offline
+    _ENCODING = None
+
+OMITTED = "[tool result omitted – already used in an earlier step]"
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return len(text) // 4 + 1
+
+
+def strip_nulls(value: Any) -> Any:
+    """Recursively drop None values from dicts (list positions are kept)."""
+    if isinstance(value, dict):
+        return {k: strip_nulls(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [strip_nulls(v) for v in value]
+    return value
+
+
+def compact_text(text: str) -> str:
+    try:
+        parsed = fast_json.loads(text)
+    except ValueError:
+        return text
+    return fast_json.dumps_str(strip_nulls(parsed))
+
+
+class ConversationContext:
+
+    def __init__(self, tools: Optional[List[Any]] = None, token_budget: int = 8000,
+                 keep_rounds: int = 1, summary_chars: int = 400):
+        self.token_budget = token_budget
+        self.keep_rounds = keep_rounds
+        self.summary_chars = summary_chars
+        # Tools whose input schema has a response_format parameter
+        self.json_capable = {
+            t.name for t in tools or []
+            if "response_format" in (t.inputSchema or {}).get("properties", {})
+        }
+        self.round = 0
+        self.prompt_tokens: List[int] = []          # reported by the API, per round
+        self.estimated_tokens: List[int] = []       # our estimate of what we sent, per round
+        self._seen_in_round: Dict[int, int] = {}    # id(tool message) -> round it was added
+
+    # -----------------------------------------------------------------------
+    # What goes in
+    # -----------------------------------------------------------------------
+    def force_json(self, name: str, arguments: str) -> str:
+        if name not in self.json_capable:
+            return arguments
+        try:
+            args = json.loads(arguments or "{}")
+        except ValueError:
+            return arguments
+        args["response_format"] = "json"
+        return json.dumps(args)
+
+    def tool_message(self, tool_call_id: str, result: Dict) -> Dict:
+        structured = None if result.get("isError") else result.get("structuredContent")
+        if structured is not None:
+            # Already parsed – no need to decode the text block again
+            text = fast_json.dumps_str(strip_nulls(structured))
+        else:
+            parts = []
+            for item in result.get("content", []):
+                if isinstance(item, dict) and "text" in item:
+                    parts.append(compact_text(item["text"]))
+                else:
+                    parts.append(json.dumps(item, separators=(",", ":")))
+            text = "\n".join(parts)
+        if result.get("isError") and not text.startswith("Error"):
+            text = f"Error: {text}"
+        message = {"role": "tool", "tool_call_id": tool_call_id, "content": text}
+        self._seen_in_round[id(message)] = self.round
+        return message
+
+    @staticmethod
+    def assistant_message(msg: Any) -> Dict:
+        """Plain-dict copy of an SDK assistant message, without null fields."""
+        if isinstance(msg, dict):
+            return strip_nulls(msg)
+        return msg.model_dump(exclude_none=True)
+
+    # -----------------------------------------------------------------------
+    # What stays
+    # -----------------------------------------------------------------------
+    def prune(self, messages: List[Dict]) -> List[Dict]:
+        """Shrink stale tool results in place before the next completion."""
+        self.round += 1
+        for m in messages:
+            added = self._seen_in_round.get(id(m))
+            if added is not None and self.round - added > self.keep_rounds:
+                self._summarize(m)
+
+        # Still over budget: blank the oldest results, never the latest round's
+        for m in messages:
+            if self.estimate(messages) <= self.token_budget:
+                break
+            added = self._seen_in_round.get(id(m))
+            if added is not None and added < self.round - 1 and m["content"] != OMITTED:
+                m["content"] = OMITTED
+
+        self.estimated_tokens.append(self.estimate(messages))
+        return messages
+
+    def _summarize(self, message: Dict):
+        content = message["content"]
+        if content != OMITTED and len(content) > self.summary_chars:
+            message["content"] = (content[:self.summary_chars]
+                                  + f"… [truncated {len(content) - self.summary_chars} chars]")
+
+    @staticmethod
+    def estimate(messages: List[Dict]) -> int:
+        total = 0
+        for m in messages:
+            total += 4                                   # per-message framing
+            total += estimate_tokens(m.get("content") or "")
+            for call in m.get("tool_calls") or []:
+                fn = call.get("function", {})
+                total += estimate_tokens(fn.get("name", "")) + estimate_tokens(fn.get("arguments", ""))
+        return total
+
+    # -----------------------------------------------------------------------
+    # Reporting
+    # -----------------------------------------------------------------------
+    def record_usage(self, usage: Any):
+        if usage is not None and getattr(usage, "prompt_tokens", None) is not None:
+            self.prompt_tokens.append(usage.prompt_tokens)
+
+    def report(self) -> Dict:
+        return {
+            "rounds": self.round,
+            "prompt_tokens": self.prompt_tokens,
+            "estimated_prompt_tokens": self.estimated_tokens,
+            "total_prompt_tokens": sum(self.prompt_tokens),
+        }
@@ -0,0 +1,956 @@
+"""
+Customer store – storage backends behind the Customer API routes.
+
+Two interchangeable implementations of `CustomerStore`:
+
+    InMemoryCustomerStore   hash indexes on the worker heap
+                                id               -> Customer
+                                normalized email -> id
+                                customer id      -> [Product, ...]
+    SQLiteCustomerStore     one on-disk database shared by every worker,
+                            indexed columns, parameterised (cached) statements
+                            and a memory-mapped read path
+
+Every lookup the API serves is a point lookup on an index, so the cost of a
+request does not grow with the size of the customer table.  Product queries
+(`find_products` / `summarize_products`) walk range indexes on the purchase
+and warranty dates and, in memory, read per-customer totals that every
+product write keeps up to date.  All writes go through the store methods so
+the indexes can never drift from the rows.
+
+Every write also appends a `Change` to the store's change log – a bounded,
+monotonically numbered record of which customer it touched – in the same
+step (the same transaction for SQLite).  The API serves the log as a feed so
+downstream caches can drop exactly the entries a write made stale.
+
+Select the backend with environment variables (see `open_store`):
+
+    CUSTOMER_DB_PATH=/var/lib/customers.db   -> SQLiteCustomerStore
+    (unset)                                  -> InMemoryCustomerStore
+"""
+
+import os
+import sqlite3
+import heapq
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from dataclasses import dataclass
+from datetime import date
+from itertools import islice
+from typing import Iterable, Iterator, Optional
+
+from models import Change, Customer, Product, ProductTotals
+
+
+def normalize_email(email: str) -> str:
+    """Canonical form used as the email index key."""
+    return email.strip().lower()
+
+
+@dataclass(frozen=True)
+class ProductFilter:
+    """Conditions of a product query; fields left as None do not filter.  Ranges are inclusive."""
+    customer_id: Optional[int] = None
+    has_warranty: Optional[bool] = None
+    date_from: Optional[date] = None          # purchase date
+    date_to: Optional[date] = None
+    warranty_from: Optional[date] = None      # warranty expiry date
+    warranty_to: Optional[date] = None
+
+    def matches(self, p: Product) -> bool:
+        if self.has_warranty is not None and p.has_warranty != self.has_warranty:
+            return False
+        if (self.date_from and p.date < self.date_from) or (self.date_to and p.date > self.date_to):
+            return False
+        if self.warranty_from or self.warranty_to:
+            w = p.warranty_date
+            if w is None or (self.warranty_from and w < self.warranty_from) or \
+                    (self.warranty_to and w > self.warranty_to):
+                return False
+        return True
+
+
+def product_order(f: ProductFilter) -> str:
+    """The order find_products returns (and pages) the matches of `f` in.
+
+    Follows the narrowest index the filter can use, so a page is a bounded
+    walk of that index: one customer's products, or a warranty / purchase
+    date range.  Positions are (customer id | date, product id).
+    """
+    if f.customer_id is not None:
+        return "customer"
+    if f.warranty_from or f.warranty_to:
+        return "warranty"
+    if f.date_from or f.date_to:
+        return "date"
+    return "customer"
+
+
+# How summarize_products ranks customers – over (count, with_warranty, list_total, spend)
+PRODUCT_ORDERS = {
+    "spend":    lambda s: s[3],
+    "discount": lambda s: s[2] - s[3],
+    "count":    lambda s: s[0],
+}
+
+
+def _make_totals(customer_id: Optional[int], count: int, with_warranty: int,
+                 list_total: float, spend: float) -> ProductTotals:
+    return ProductTotals.model_construct(
+        customer_id=customer_id, count=count, with_warranty=with_warranty,
+        list_total=round(list_total, 2), spend=round(spend, 2), discount=round(list_total - spend, 2),
+    )
+
+
+class CustomerStore(ABC):
+    """Storage interface the API routes depend on."""
+
+    # Calls do I/O and may wait on other processes' locks, so async callers
+    # run them in the threadpool; the in-memory store is confined to the
+    # event loop thread instead and has no locks of its own
+    blocking = False
+
+    # Reads -----------------------------------------------------------------
+    @abstractmethod
+    def count(self) -> int: ...
+
+    @abstractmethod
+    def get_customer(self, customer_id: int) -> Optional[Customer]: ...
+
+    @abstractmethod
+    def get_customer_by_email(self, email: str) -> Optional[Customer]: ...
+
+    def has_customer(self, customer_id: int) -> bool:
+        return self.get_customer(customer_id) is not None
+
+    @abstractmethod
+    def get_products(self, customer_id: int) -> list[Product]: ...
+
+    # Batch reads – one call for many keys; backends override with set lookups
+    def get_customers(self, customer_ids: Iterable[int]) -> dict[int, Customer]:
+        found = {}
+        for customer_id in customer_ids:
+            customer = self.get_customer(customer_id)
+            if customer is not None:
+                found[customer_id] = customer
+        return found
+
+    def get_customers_by_email(self, emails: Iterable[str]) -> dict[str, Customer]:
+        """Keyed by normalized email; unknown emails are left out."""
+        found = {}
+        for email in emails:
+            customer = self.get_customer_by_email(email)
+            if customer is not None:
+                found[normalize_email(email)] = customer
+        return found
+
+    def get_products_many(self, customer_ids: Iterable[int]) -> dict[int, list[Product]]:
+        return {cid: self.get_products(cid) for cid in customer_ids}
+
+    @abstractmethod
+    def list_customers(self) -> list[Customer]: ...
+
+    @abstractmethod
+    def page_customers(self, after_id: int = 0, limit: int = 100,
+                       email_prefix: Optional[str] = None,
+                       dob_from: Optional[date] = None,
+                       dob_to: Optional[date] = None) -> list[Customer]:
+        """Up to `limit` customers with id > after_id, in id order, matching the filters."""
+
+    # Product queries ------------------------------------------------------
+    @abstractmethod
+    def find_products(self, f: ProductFilter, after: Optional[tuple] = None,
+                      limit: int = 100) -> list[tuple[tuple, int, Product]]:
+        """Up to `limit` (position, customer_id, product) matching `f`.
+
+        In position order (see product_order), starting after `after` – the
+        position of the last product of the previous page.  The product id
+        is the insertion order, so one customer's products come back in
+        purchase order.
+        """
+
+    @abstractmethod
+    def summarize_products(self, f: ProductFilter, by_customer: bool = False, order_by: str = "spend",
+                           limit: int = 10) -> tuple[ProductTotals, Optional[list[ProductTotals]]]:
+        """Totals over the products matching `f` and, with `by_customer`, the
+        `limit` customers ranked highest by `order_by` (see PRODUCT_ORDERS)."""
+
+    def iter_customers(self, batch_size: int = 1000) -> Iterator[list[Customer]]:
+        """Walk the whole table in id order, one batch at a time.
+
+        Built on keyset pages so only one batch is held in memory and rows
+        written during the walk do not shift the position.
+        """
+        after_id = 0
+        while True:
+            batch = self.page_customers(after_id, batch_size)
+            if not batch:
+                return
+            yield batch
+            after_id = batch[-1].id
+
+    # Writes ----------------------------------------------------------------
+    @abstractmethod
+    def add_customer(self, customer: Customer) -> Customer: ...
+
+    @abstractmethod
+    def update_customer(self, customer: Customer) -> Customer: ...
+
+    @abstractmethod
+    def delete_customer(self, customer_id: int) -> Customer: ...
+
+    @abstractmethod
+    def set_products(self, customer_id: int, products: Iterable[Product]) -> list[Product]: ...
+
+    @abstractmethod
+    def add_product(self, customer_id: int, product: Product) -> Product: ...
+
+    @abstractmethod
+    def delete_product(self, customer_id: int, code: str) -> Product: ...
+
+    @abstractmethod
+    def next_customer_id(self) -> int:
+        """An id no customer has yet (highest id + 1)."""
+
+    def bulk_load(self, customers: Iterable[Customer],
+                  products: dict[int, list[Product]]) -> None:
+        """Load a dataset in one go (used for seeding).  Not recorded in the change log."""
+        for customer in customers:
+            self.add_customer(customer)
+        for customer_id, items in products.items():
+            self.set_products(customer_id, items)
+
+    # Change log -------------------------------------------------------------
+    @abstractmethod
+    def last_change_seq(self) -> int:
+        """Sequence number of the newest change (0 before the first write)."""
+
+    @abstractmethod
+    def changes_since(self, after_seq: int, limit: int = 100) -> Optional[list[Change]]:
+        """Up to `limit` changes with seq > after_seq, oldest first.
+
+        None when the log no longer covers `after_seq` – it was pruned past
+        it, or the store was recreated and numbering started again – so the
+        caller has to drop everything it cached and resume from
+        last_change_seq().
+        """
+
+    def close(self) -> None:
+        pass
+
+
+# ===========================================================================
+# In-memory backend
+# ===========================================================================
+def _discard(keys: list, key: tuple) -> None:
+    i = bisect_left(keys, key)
+    if i < len(keys) and keys[i] == key:
+        del keys[i]
+
+
+class _ProductIndex:
+    """Read-side indexes over every product, kept in step by the writes.
+
+    by_date / by_warranty   sorted (date, product id) – date ranges by bisection
+    sums                    customer id -> [count, with_warranty, list_total, spend]
+    """
+
+    def __init__(self):
+        self.by_date: list[tuple[date, int]] = []
+        self.by_warranty: list[tuple[date, int]] = []
+        self.sums: dict[int, list] = {}
+
+    def rebuild(self, products: dict[int, tuple[int, Product]]) -> None:
+        """Build from scratch out of product id -> (customer id, product); used after a bulk load."""
+        self.by_date = sorted((p.date, pid) for pid, (_, p) in products.items())
+        self.by_warranty = sorted((p.warranty_date, pid) for pid, (_, p) in products.items() if p.warranty_date)
+        self.sums = {}
+        for cid, p in products.values():
+            self._count(cid, p, 1)
+
+    def add(self, pid: int, customer_id: int, p: Product) -> None:
+        insort(self.by_date, (p.date, pid))
+        if p.warranty_date:
+            insort(self.by_warranty, (p.warranty_date, pid))
+        self._count(customer_id, p, 1)
+
+    def remove(self, pid: int, customer_id: int, p: Product) -> None:
+        _discard(self.by_date, (p.date, pid))
+        if p.warranty_date:
+            _discard(self.by_warranty, (p.warranty_date, pid))
+        self._count(customer_id, p, -1)
+
+    def _count(self, customer_id: int, p: Product, sign: int) -> None:
+        s = self.sums.get(customer_id)
+        if s is None:
+            s = self.sums[customer_id] = [0, 0, 0.0, 0.0]
+        s[0] += sign
+        s[1] += sign * p.has_warranty
+        s[2] += sign * p.list_price
+        s[3] += sign * p.buy_price
+        if not s[0]:
+            del self.sums[customer_id]
+
+
+class InMemoryCustomerStore(CustomerStore):
+
+    def __init__(self, change_retention: int = 10_000):
+        self._customers: dict[int, Customer] = {}
+        self._id_by_email: dict[str, int] = {}
+        self._products: dict[int, list[Product]] = {}
+        self._product_ids: dict[int, list[int]] = {}     # parallel to _products
+        self._by_product_id: dict[int, tuple[int, Product]] = {}
+        self._next_product_id = 0
+        self._index = _ProductIndex()
+        self._ids: list[int] = []          # sorted – drives keyset pagination
+        self._changes: deque[Change] = deque(maxlen=change_retention)   # contiguous seqs
+        self._seq = 0
+        self._loading = False              # inside bulk_load: no change log, index built at the end
+
+    # -----------------------------------------------------------------------
+    # Reads – all O(1)
+    # -----------------------------------------------------------------------
+    def count(self) -> int:
+        return len(self._customers)
+
+    def get_customer(self, customer_id: int) -> Optional[Customer]:
+        return self._customers.get(customer_id)
+
+    def get_customer_by_email(self, email: str) -> Optional[Customer]:
+        customer_id = self._id_by_email.get(normalize_email(email))
+        if customer_id is None:
+            return None
+        return self._customers[customer_id]
+
+    def has_customer(self, customer_id: int) -> bool:
+        return customer_id in self._customers
+
+    def get_products(self, customer_id: int) -> list[Product]:
+        return self._products.get(customer_id, [])
+
+    def list_customers(self) -> list[Customer]:
+        return [self._customers[i] for i in self._ids]
+
+    def page_customers(self, after_id: int = 0, limit: int = 100,
+                       email_prefix: Optional[str] = None,
+                       dob_from: Optional[date] = None,
+                       dob_to: Optional[date] = None) -> list[Customer]:
+        prefix = normalize_email(email_prefix) if email_prefix else None
+        page: list[Customer] = []
+        for i in range(bisect_right(self._ids, after_id), len(self._ids)):
+            c = self._customers[self._ids[i]]
+            if prefix and not normalize_email(c.email).startswith(prefix):
+                continue
+            if (dob_from and c.dob < dob_from) or (dob_to and c.dob > dob_to):
+                continue
+            page.append(c)
+            if len(page) >= limit:
+                break
+        return page
+
+    def _walk(self, f: ProductFilter, after: Optional[tuple] = None) -> Iterator[tuple[tuple, int, Product]]:
+        """(position, customer_id, product) of every match after `after`, in position order.
+
+        Walks the index product_order(f) picks from its start (or the
+        cursor) and checks the rest of the filter on the way, so the caller
+        can stop as soon as it has enough.
+        """
+        order = product_order(f)
+        if order == "customer":
+            if f.customer_id is not None:
+                customer_ids: Iterable[int] = (f.customer_id,)
+            else:
+                start = bisect_left(self._ids, after[0]) if after else 0
+                customer_ids = (self._ids[i] for i in range(start, len(self._ids)))
+            for cid in customer_ids:
+                for pid, p in zip(self._product_ids.get(cid, ()), self._products.get(cid, ())):
+                    if (after is None or (cid, pid) > after) and f.matches(p):
+                        yield (cid, pid), cid, p
+            return
+
+        if order == "warranty":
+            keys, lo, hi = self._index.by_warranty, f.warranty_from, f.warranty_to
+        else:
+            keys, lo, hi = self._index.by_date, f.date_from, f.date_to
+        start = bisect_left(keys, (lo,)) if lo else 0
+        if after is not None:
+            start = max(start, bisect_right(keys, after))
+        for i in range(start, len(keys)):
+            key = keys[i]
+            if hi and key[0] > hi:
+                return
+            cid, p = self._by_product_id[key[1]]
+            if f.matches(p):
+                yield key, cid, p
+
+    def find_products(self, f: ProductFilter, after: Optional[tuple] = None,
+                      limit: int = 100) -> list[tuple[tuple, int, Product]]:
+        return list(islice(self._walk(f, after), limit))
+
+    def summarize_products(self, f: ProductFilter, by_customer: bool = False, order_by: str = "spend",
+                           limit: int = 10) -> tuple[ProductTotals, Optional[list[ProductTotals]]]:
+        if f == ProductFilter(customer_id=f.customer_id):
+            # No conditions on the products themselves – the totals are ready
+            sums = self._index.sums
+            if f.customer_id is not None:
+                sums = {f.customer_id: sums[f.customer_id]} if f.customer_id in sums else {}
+        else:
+            sums = {}
+            for _, cid, p in self._walk(f):
+                count, with_warranty, list_total, spend = sums.get(cid, (0, 0, 0.0, 0.0))
+                sums[cid] = (count + 1, with_warranty + p.has_warranty,
+                             list_total + p.list_price, spend + p.buy_price)
+
+        overall = [sum(column) for column in zip(*sums.values())] or [0, 0, 0.0, 0.0]
+        totals = _make_totals(None, *overall)
+        if not by_customer:
+            return totals, None
+        rank = PRODUCT_ORDERS[order_by]
+        top = heapq.nlargest(limit, sums.items(), key=lambda kv: (rank(kv[1]), -kv[0]))
+        return totals, [_make_totals(cid, *s) for cid, s in top]
+
+    # -----------------------------------------------------------------------
+    # Writes – keep every index in step with the rows
+    # -----------------------------------------------------------------------
+    def add_customer(self, customer: Customer) -> Customer:
+        key = normalize_email(customer.email)
+        if customer.id in self._customers:
+            raise ValueError(f"Customer with ID {customer.id} already exists")
+        if key in self._id_by_email:
+            raise ValueError(f"Customer with email '{customer.email}' already exists")
+        self._customers[customer.id] = customer
+        self._id_by_email[key] = customer.id
+        insort(self._ids, customer.id)
+        self._record("create", "customer", customer.id, [key])
+        return customer
+
+    def update_customer(self, customer: Customer) -> Customer:
+        current = self._customers.get(customer.id)
+        if current is None:
+            raise KeyError(customer.id)
+        old_key, new_key = normalize_email(current.email), normalize_email(customer.email)
+        if new_key != old_key:
+            if new_key in self._id_by_email:
+                raise ValueError(f"Customer with email '{customer.email}' already exists")
+            del self._id_by_email[old_key]
+            self._id_by_email[new_key] = customer.id
+        self._customers[customer.id] = customer
+        self._record("update", "customer", customer.id, list(dict.fromkeys((old_key, new_key))))
+        return customer
+
+    def delete_customer(self, customer_id: int) -> Customer:
+        customer = self._customers.pop(customer_id, None)
+        if customer is None:
+            raise KeyError(customer_id)
+        key = normalize_email(customer.email)
+        del self._id_by_email[key]
+        self._detach_products(customer_id)
+        del self._ids[bisect_right(self._ids, customer_id) - 1]
+        self._record("delete", "customer", customer_id, [key])
+        return customer
+
+    def set_products(self, customer_id: int, products: Iterable[Product]) -> list[Product]:
+        if customer_id not in self._customers:
+            raise KeyError(customer_id)
+        items = list(products)
+        self._detach_products(customer_id)
+        for product in items:
+            self._attach_product(customer_id, product)
+        self._record("update", "products", customer_id, [self._email_key(customer_id)])
+        return items
+
+    def add_product(self, customer_id: int, product: Product) -> Product:
+        if customer_id not in self._customers:
+            raise KeyError(customer_id)
+        self._attach_product(customer_id, product)
+        self._record("create", "product", customer_id, [self._email_key(customer_id)], product.code)
+        return product
+
+    def delete_product(self, customer_id: int, code: str) -> Product:
+        items = self._products.get(customer_id, [])
+        for i, product in enumerate(items):
+            if product.code == code:
+                pids = self._product_ids[customer_id]
+                pid = pids.pop(i)
+                del items[i]
+                if not items:
+                    del self._products[customer_id], self._product_ids[customer_id]
+                del self._by_product_id[pid]
+                self._index.remove(pid, customer_id, product)
+                self._record("delete", "product", customer_id, [self._email_key(customer_id)], code)
+                return product
+        raise KeyError(code)
+
+    def _attach_product(self, customer_id: int, product: Product) -> None:
+        self._next_product_id += 1
+        pid = self._next_product_id
+        self._products.setdefault(customer_id, []).append(product)
+        self._product_ids.setdefault(customer_id, []).append(pid)
+        self._by_product_id[pid] = (customer_id, product)
+        if not self._loading:
+            self._index.add(pid, customer_id, product)
+
+    def _detach_products(self, customer_id: int) -> None:
+        for pid, product in zip(self._product_ids.pop(customer_id, ()), self._products.pop(customer_id, ())):
+            del self._by_product_id[pid]
+            if not self._loading:
+                self._index.remove(pid, customer_id, product)
+
+    def next_customer_id(self) -> int:
+        return self._ids[-1] + 1 if self._ids else 1
+
+    def bulk_load(self, customers: Iterable[Customer],
+                  products: dict[int, list[Product]]) -> None:
+        # One sort at the end instead of an insort per product
+        self._loading = True
+        try:
+            super().bulk_load(customers, products)
+        finally:
+            self._loading = False
+            self._index.rebuild(self._by_product_id)
+
+    # -----------------------------------------------------------------------
+    # Change log – a ring of the newest `change_retention` changes
+    # -----------------------------------------------------------------------
+    def _email_key(self, customer_id: int) -> str:
+        return normalize_email(self._customers[customer_id].email)
+
+    def _record(self, op: str, entity: str, customer_id: int, emails: list[str],
+                code: Optional[str] = None) -> None:
+        if self._loading:
+            return
+        self._seq += 1
+        self._changes.append(Change.model_construct(seq=self._seq, at=time.time(), op=op, entity=entity,
+                                                    customer_id=customer_id, emails=emails, code=code))
+
+    def last_change_seq(self) -> int:
+        return self._seq
+
+    def changes_since(self, after_seq: int, limit: int = 100) -> Optional[list[Change]]:
+        if after_seq >= self._seq:
+            return [] if after_seq == self._seq else None
+        first = self._changes[0].seq
+        if after_seq + 1 < first:
+            return None
+        start = after_seq + 1 - first
+        return list(islice(self._changes, start, start + limit))
+
+
+# ===========================================================================
+# SQLite backend
+# ===========================================================================
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS customers (
+    id          INTEGER PRIMARY KEY,
+    email       TEXT    NOT NULL,
+    email_norm  TEXT    NOT NULL UNIQUE,
+    name        TEXT    NOT NULL,
+    dob         TEXT    NOT NULL
+);
+CREATE TABLE IF NOT EXISTS products (
+    rowid          INTEGER PRIMARY KEY,
+    customer_id    INTEGER NOT NULL REFERENCES customers(id) ON DELETE CASCADE,
+    code           TEXT    NOT NULL,
+    name           TEXT    NOT NULL,
+    list_price     REAL    NOT NULL,
+    buy_price      REAL    NOT NULL,
+    date           TEXT    NOT NULL,
+    has_warranty   INTEGER NOT NULL,
+    warranty_date  TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_products_customer ON products(customer_id, rowid);
+CREATE INDEX IF NOT EXISTS ix_customers_dob ON customers(dob);
+CREATE INDEX IF NOT EXISTS ix_products_date ON products(date);
+CREATE INDEX IF NOT EXISTS ix_products_warranty ON products(warranty_date) WHERE warranty_date IS NOT NULL;
+CREATE TABLE IF NOT EXISTS changes (
+    seq          INTEGER PRIMARY KEY AUTOINCREMENT,   -- never reused, even after pruning
+    at           REAL    NOT NULL,
+    op           TEXT    NOT NULL,
+    entity       TEXT    NOT NULL,
+    customer_id  INTEGER NOT NULL,
+    emails       TEXT    NOT NULL,                    -- space-separated normalized emails
+    code         TEXT
+);
+"""
+
+# Statements are kept as constants so sqlite3's per-connection statement cache
+# reuses the compiled (prepared) form on every call.
+_SQL_COUNT            = "SELECT COUNT(*) FROM customers"
+_SQL_CUSTOMER_BY_ID   = "SELECT id, email, name, dob FROM customers WHERE id = ?"
+_SQL_CUSTOMER_BY_MAIL = "SELECT id, email, name, dob FROM customers WHERE email_norm = ?"
+_SQL_CUSTOMER_EXISTS  = "SELECT 1 FROM customers WHERE id = ?"
+_SQL_EMAIL_BY_ID      = "SELECT email_norm FROM customers WHERE id = ?"
+_SQL_NEXT_ID          = "SELECT COALESCE(MAX(id), 0) + 1 FROM customers"
+_SQL_CUSTOMERS_ALL    = "SELECT id, email, name, dob FROM customers ORDER BY id"
+_SQL_PRODUCTS_BY_CUST = ("SELECT code, name, list_price, buy_price, date, has_warranty, warranty_date "
+                         "FROM products WHERE customer_id = ? ORDER BY rowid")
+_SQL_INSERT_CUSTOMER  = "INSERT INTO customers (id, email, email_norm, name, dob) VALUES (?, ?, ?, ?, ?)"
+_SQL_UPDATE_CUSTOMER  = "UPDATE customers SET email = ?, email_norm = ?, name = ?, dob = ? WHERE id = ?"
+_SQL_DELETE_CUSTOMER  = "DELETE FROM customers WHERE id = ?"
+_SQL_INSERT_PRODUCT   = ("INSERT INTO products (customer_id, code, name, list_price, buy_price, date, "
+                         "has_warranty, warranty_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+_SQL_DELETE_PRODUCTS  = "DELETE FROM products WHERE customer_id = ?"
+_SQL_FIND_PRODUCT     = ("SELECT rowid, code, name, list_price, buy_price, date, has_warranty, warranty_date "
+                         "FROM products WHERE customer_id = ? AND code = ? ORDER BY rowid LIMIT 1")
+_SQL_DELETE_PRODUCT   = "DELETE FROM products WHERE rowid = ?"
+_SQL_INSERT_CHANGE    = "INSERT INTO changes (at, op, entity, customer_id, emails, code) VALUES (?, ?, ?, ?, ?, ?)"
+_SQL_LAST_CHANGE      = "SELECT seq FROM sqlite_sequence WHERE name = 'changes'"
+_SQL_CHANGES_AFTER    = ("SELECT seq, at, op, entity, customer_id, emails, code "
+                         "FROM changes WHERE seq > ? ORDER BY seq LIMIT ?")
+_SQL_PRUNE_CHANGES    = "DELETE FROM changes WHERE seq <= ?"
+_SQL_PRODUCT_COLUMNS  = "code, name, list_price, buy_price, date, has_warranty, warranty_date"
+_SQL_PRODUCT_SUMS     = ("COUNT(*), COALESCE(SUM(has_warranty), 0), "
+                         "COALESCE(SUM(list_price), 0.0), COALESCE(SUM(buy_price), 0.0)")
+_SQL_PRODUCT_POSITION = {"customer": "customer_id", "warranty": "warranty_date", "date": "date"}
+_SQL_PRODUCT_ORDERS   = {
+    "spend":    "SUM(buy_price)",
+    "discount": "SUM(list_price) - SUM(buy_price)",
+    "count":    "COUNT(*)",
+}
+
+# Old changes are pruned once every this many writes
+_PRUNE_EVERY = 256
+
+# Batch lookups bind at most this many keys per statement
+_SQL_MAX_IN = 500
+
+
+def _chunks(items: list, size: int = _SQL_MAX_IN):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _customer_row(c: Customer) -> tuple:
+    return (c.id, str(c.email), normalize_email(c.email), c.name, c.dob.isoformat())
+
+
+def _product_row(customer_id: int, p: Product) -> tuple:
+    return (customer_id, p.code, p.name, p.list_price, p.buy_price, p.date.isoformat(),
+            int(p.has_warranty), p.warranty_date.isoformat() if p.warranty_date else None)
+
+
+def _to_customer(row) -> Customer:
+    # Rows were validated on the way in – skip re-validation on the way out.
+    return Customer.model_construct(id=row[0], email=row[1], name=row[2],
+                                    dob=date.fromisoformat(row[3]))
+
+
+def _product_where(f: ProductFilter) -> tuple[list[str], list]:
+    where, args = [], []
+    if f.customer_id is not None:
+        where.append("customer_id = ?")
+        args.append(f.customer_id)
+    if f.has_warranty is not None:
+        where.append("has_warranty = ?")
+        args.append(int(f.has_warranty))
+    for column, op, value in (("date", ">=", f.date_from), ("date", "<=", f.date_to),
+                              ("warranty_date", ">=", f.warranty_from), ("warranty_date", "<=", f.warranty_to)):
+        if value:
+            where.append(f"{column} {op} ?")
+            args.append(value.isoformat())
+    return where, args
+
+
+def _to_change(row) -> Change:
+    return Change.model_construct(seq=row[0], at=row[1], op=row[2], entity=row[3],
+                                  customer_id=row[4], emails=row[5].split(), code=row[6])
+
+
+def _to_product(row) -> Product:
+    return Product.model_construct(
+        code=row[0], name=row[1], list_price=row[2], buy_price=row[3],
+        date=date.fromisoformat(row[4]), has_warranty=bool(row[5]),
+        warranty_date=date.fromisoformat(row[6]) if row[6] else None,
+    )
+
+
+class SQLiteCustomerStore(CustomerStore):
+    """Shared on-disk store.
+
+    Each thread gets its own connection (sqlite3 connections are not
+    thread-safe); WAL mode lets many worker processes read concurrently while
+    one writes, and `mmap_size` serves reads straight from the page cache
+    instead of copying pages onto the Python heap.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str, mmap_size: int = 256 * 1024 * 1024, change_retention: int = 10_000):
+        self.path = path
+        self.mmap_size = mmap_size
+        self.change_retention = change_retention
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0, check_same_thread=False,
+                                   cached_statements=64)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+            self._local.conn = conn
+        return conn
+
+    # -----------------------------------------------------------------------
+    # Reads – primary key / unique index lookups
+    # -----------------------------------------------------------------------
+    def count(self) -> int:
+        return self._conn().execute(_SQL_COUNT).fetchone()[0]
+
+    def get_customer(self, customer_id: int) -> Optional[Customer]:
+        row = self._conn().execute(_SQL_CUSTOMER_BY_ID, (customer_id,)).fetchone()
+        return _to_customer(row) if row else None
+
+    def get_customer_by_email(self, email: str) -> Optional[Customer]:
+        row = self._conn().execute(_SQL_CUSTOMER_BY_MAIL, (normalize_email(email),)).fetchone()
+        return _to_customer(row) if row else None
+
+    def has_customer(self, customer_id: int) -> bool:
+        return self._conn().execute(_SQL_CUSTOMER_EXISTS, (customer_id,)).fetchone() is not None
+
+    def get_products(self, customer_id: int) -> list[Product]:
+        rows = self._conn().execute(_SQL_PRODUCTS_BY_CUST, (customer_id,)).fetchall()
+        return [_to_product(r) for r in rows]
+
+    def list_customers(self) -> list[Customer]:
+        return [_to_customer(r) for r in self._conn().execute(_SQL_CUSTOMERS_ALL)]
+
+    def get_customers(self, customer_ids: Iterable[int]) -> dict[int, Customer]:
+        found = {}
+        for chunk in _chunks(list(dict.fromkeys(customer_ids))):
+            sql = f"SELECT id, email, name, dob FROM customers WHERE id IN ({','.join('?' * len(chunk))})"
+            for row in self._conn().execute(sql, chunk):
+                found[row[0]] = _to_customer(row)
+        return found
+
+    def get_customers_by_email(self, emails: Iterable[str]) -> dict[str, Customer]:
+        found = {}
+        for chunk in _chunks(list(dict.fromkeys(normalize_email(e) for e in emails))):
+            sql = (f"SELECT id, email, name, dob, email_norm FROM customers "
+                   f"WHERE email_norm IN ({','.join('?' * len(chunk))})")
+            for row in self._conn().execute(sql, chunk):
+                found[row[4]] = _to_customer(row)
+        return found
+
+    def get_products_many(self, customer_ids: Iterable[int]) -> dict[int, list[Product]]:
+        ids = list(dict.fromkeys(customer_ids))
+        found: dict[int, list[Product]] = {cid: [] for cid in ids}
+        for chunk in _chunks(ids):
+            sql = (f"SELECT customer_id, code, name, list_price, buy_price, date, has_warranty, warranty_date "
+                   f"FROM products WHERE customer_id IN ({','.join('?' * len(chunk))}) "
+                   f"ORDER BY customer_id, rowid")
+            for row in self._conn().execute(sql, chunk):
+                found[row[0]].append(_to_product(row[1:]))
+        return found
+
+    def page_customers(self, after_id: int = 0, limit: int = 100,
+                       email_prefix: Optional[str] = None,
+                       dob_from: Optional[date] = None,
+                       dob_to: Optional[date] = None) -> list[Customer]:
+        # Keyset pagination on the primary key; the email prefix becomes a
+        # range on the unique email_norm index instead of a LIKE scan.
+        where, args = ["id > ?"], [after_id]
+        if email_prefix:
+            prefix = normalize_email(email_prefix)
+            where.append("email_norm >= ? AND email_norm < ?")
+            args += [prefix, prefix + "\U0010ffff"]
+        if dob_from:
+            where.append("dob >= ?")
+            args.append(dob_from.isoformat())
+        if dob_to:
+            where.append("dob <= ?")
+            args.append(dob_to.isoformat())
+        sql = (f"SELECT id, email, name, dob FROM customers WHERE {' AND '.join(where)} "
+               f"ORDER BY id LIMIT ?")
+        return [_to_customer(r) for r in self._conn().execute(sql, (*args, limit))]
+
+    def find_products(self, f: ProductFilter, after: Optional[tuple] = None,
+                      limit: int = 100) -> list[tuple[tuple, int, Product]]:
+        # The product id is the rowid, so ORDER BY <column>, rowid is the order
+        # of ix_products_customer / ix_products_warranty / ix_products_date
+        # and LIMIT stops the index walk after one page
+        order = product_order(f)
+        column = _SQL_PRODUCT_POSITION[order]
+        where, args = _product_where(f)
+        if after is not None:
+            where.append(f"({column}, rowid) > (?, ?)")
+            args += [after[0] if order == "customer" else after[0].isoformat(), after[1]]
+        clause = f"WHERE {' AND '.join(where)}" if where else ""
+        sql = (f"SELECT {column}, rowid, customer_id, {_SQL_PRODUCT_COLUMNS} FROM products {clause} "
+               f"ORDER BY {column}, rowid LIMIT ?")
+        rows = self._conn().execute(sql, (*args, limit))
+        if order == "customer":
+            return [((r[0], r[1]), r[2], _to_product(r[3:])) for r in rows]
+        return [((date.fromisoformat(r[0]), r[1]), r[2], _to_product(r[3:])) for r in rows]
+
+    def summarize_products(self, f: ProductFilter, by_customer: bool = False, order_by: str = "spend",
+                           limit: int = 10) -> tuple[ProductTotals, Optional[list[ProductTotals]]]:
+        where, args = _product_where(f)
+        clause = f"WHERE {' AND '.join(where)}" if where else ""
+        conn = self._conn()
+        totals = _make_totals(None, *conn.execute(f"SELECT {_SQL_PRODUCT_SUMS} FROM products {clause}",
+                                                  args).fetchone())
+        if not by_customer:
+            return totals, None
+        sql = (f"SELECT customer_id, {_SQL_PRODUCT_SUMS} FROM products {clause} GROUP BY customer_id "
+               f"ORDER BY {_SQL_PRODUCT_ORDERS[order_by]} DESC, customer_id LIMIT ?")
+        return totals, [_make_totals(*r) for r in conn.execute(sql, (*args, limit))]
+
+    # -----------------------------------------------------------------------
+    # Writes – one transaction each, change log row included
+    # -----------------------------------------------------------------------
+    def _record(self, conn: sqlite3.Connection, op: str, entity: str, customer_id: int,
+                emails: list[str], code: Optional[str] = None) -> None:
+        seq = conn.execute(_SQL_INSERT_CHANGE, (time.time(), op, entity, customer_id,
+                                                " ".join(emails), code)).lastrowid
+        if seq % _PRUNE_EVERY == 0:
+            conn.execute(_SQL_PRUNE_CHANGES, (seq - self.change_retention,))
+
+    def _email_key(self, conn: sqlite3.Connection, customer_id: int) -> str:
+        row = conn.execute(_SQL_EMAIL_BY_ID, (customer_id,)).fetchone()
+        if row is None:
+            raise KeyError(customer_id)
+        return row[0]
+
+    def add_customer(self, customer: Customer) -> Customer:
+        try:
+            with self._conn() as conn:
+                conn.execute(_SQL_INSERT_CUSTOMER, _customer_row(customer))
+                self._record(conn, "create", "customer", customer.id, [normalize_email(customer.email)])
+        except sqlite3.IntegrityError:
+            raise ValueError(f"Customer with ID {customer.id} or email '{customer.email}' already exists")
+        return customer
+
+    def update_customer(self, customer: Customer) -> Customer:
+        new_key = normalize_email(customer.email)
+        try:
+            with self._conn() as conn:
+                old_key = self._email_key(conn, customer.id)
+                cur = conn.execute(_SQL_UPDATE_CUSTOMER, (str(customer.email), new_key,
+                                                          customer.name, customer.dob.isoformat(), customer.id))
+                if cur.rowcount == 0:
+                    raise KeyError(customer.id)
+                self._record(conn, "update", "customer", customer.id, list(dict.fromkeys((old_key, new_key))))
+        except sqlite3.IntegrityError:
+            raise ValueError(f"Customer with email '{customer.email}' already exists")
+        return customer
+
+    def delete_customer(self, customer_id: int) -> Customer:
+        with self._conn() as conn:
+            row = conn.execute(_SQL_CUSTOMER_BY_ID, (customer_id,)).fetchone()
+            if row is None:
+                raise KeyError(customer_id)
+            conn.execute(_SQL_DELETE_PRODUCTS, (customer_id,))
+            conn.execute(_SQL_DELETE_CUSTOMER, (customer_id,))
+            self._record(conn, "delete", "customer", customer_id, [normalize_email(row[1])])
+        return _to_customer(row)
+
+    def set_products(self, customer_id: int, products: Iterable[Product]) -> list[Product]:
+        items = list(products)
+        with self._conn() as conn:
+            key = self._email_key(conn, customer_id)
+            conn.execute(_SQL_DELETE_PRODUCTS, (customer_id,))
+            conn.executemany(_SQL_INSERT_PRODUCT, (_product_row(customer_id, p) for p in items))
+            self._record(conn, "update", "products", customer_id, [key])
+        return items
+
+    def add_product(self, customer_id: int, product: Product) -> Product:
+        with self._conn() as conn:
+            key = self._email_key(conn, customer_id)
+            conn.execute(_SQL_INSERT_PRODUCT, _product_row(customer_id, product))
+            self._record(conn, "create", "product", customer_id, [key], product.code)
+        return product
+
+    def delete_product(self, customer_id: int, code: str) -> Product:
+        with self._conn() as conn:
+            row = conn.execute(_SQL_FIND_PRODUCT, (customer_id, code)).fetchone()
+            if row is None:
+                raise KeyError(code)
+            conn.execute(_SQL_DELETE_PRODUCT, (row[0],))
+            self._record(conn, "delete", "product", customer_id, [self._email_key(conn, customer_id)], code)
+        return _to_product(row[1:])
+
+    def next_customer_id(self) -> int:
+        return self._conn().execute(_SQL_NEXT_ID).fetchone()[0]
+
+    def bulk_load(self, customers: Iterable[Customer],
+                  products: dict[int, list[Product]]) -> None:
+        with self._conn() as conn:
+            conn.executemany(_SQL_INSERT_CUSTOMER, (_customer_row(c) for c in customers))
+            conn.executemany(_SQL_INSERT_PRODUCT, (_product_row(cid, p)
+                                                   for cid, items in products.items() for p in items))
+
+    def seed_if_empty(self, customers: Iterable[Customer],
+                      products: dict[int, list[Product]]) -> bool:
+        """Seed an empty database exactly once, even if several workers race."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute(_SQL_COUNT).fetchone()[0]:
+                conn.rollback()
+                return False
+            conn.executemany(_SQL_INSERT_CUSTOMER, (_customer_row(c) for c in customers))
+            conn.executemany(_SQL_INSERT_PRODUCT, (_product_row(cid, p)
+                                                   for cid, items in products.items() for p in items))
+            conn.commit()
+            return True
+        except BaseException:
+            conn.rollback()
+            raise
+
+    # -----------------------------------------------------------------------
+    # Change log – the `changes` table, shared by every worker
+    # -----------------------------------------------------------------------
+    def last_change_seq(self) -> int:
+        row = self._conn().execute(_SQL_LAST_CHANGE).fetchone()
+        return row[0] if row else 0
+
+    def changes_since(self, after_seq: int, limit: int = 100) -> Optional[list[Change]]:
+        last = self.last_change_seq()
+        if after_seq >= last:
+            return [] if after_seq == last else None
+        rows = self._conn().execute(_SQL_CHANGES_AFTER, (after_seq, limit)).fetchall()
+        if not rows or rows[0][0] > after_seq + 1:
+            return None                     # pruned past after_seq
+        return [_to_change(r) for r in rows]
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+# ===========================================================================
+# Factory
+# ===========================================================================
+def open_store(db_path: Optional[str] = None, seed: bool = True) -> CustomerStore:
+    """Build the store selected by CUSTOMER_DB_PATH.
+
+    With no path the sample data is loaded into an `InMemoryCustomerStore`.
+    With a path the SQLite database is opened (and created if missing); the
+    sample data is only written if the database is empty and `seed` is set,
+    so opening a large existing dataset costs nothing at start-up.
+    """
+    db_path = db_path if db_path is not None else os.getenv("CUSTOMER_DB_PATH", "")
+    retention = int(os.getenv("CHANGE_LOG_RETENTION", "10000"))
+
+    if not db_path:
+        store = InMemoryCustomerStore(change_retention=retention)
+        if seed:
+            from seed_data import customers_db, customer_products_db
+            store.bulk_load(customers_db, customer_products_db)
+        return store
+
+    store = SQLiteCustomerStore(db_path, change_retention=retention)
+    if seed and os.getenv("CUSTOMER_DB_SEED", "1") == "1":
+        from seed_data import customers_db, customer_products_db
+        store.seed_if_empty(customers_db, customer_products_db)
+    return store
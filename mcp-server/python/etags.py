@@ -0,0 +1,81 @@
+"""
+ETags – conditional GETs for the Customer API.
+
+Used by api.py as ASGI middleware:
+
+    app.add_middleware(etags.ETagMiddleware)
+
+* Every complete 200 response to a GET gets a strong ETag: a hash of the
+  body, so any change to the data behind it changes the tag.
+* A GET whose If-None-Match already holds that tag (or `*`) gets
+  304 Not Modified with no body.
+* Streaming responses (the NDJSON export, the change stream) and
+  responses that set their own ETag pass through untouched.
+
+The route still runs on a revalidation; what a 304 saves is the body on
+the wire and the decode on the client, which is most of the cost for a
+cache in front of the API.
+"""
+
+import hashlib
+
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match uses the weak comparison, so W/ prefixes are ignored."""
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class ETagMiddleware:
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        if_none_match = None
+        for name, value in scope["headers"]:
+            if name == b"if-none-match":
+                if_none_match = value.decode("latin-1")
+                break
+
+        held = None            # the 200 start message, until the body shows it is complete
+
+        async def send_with_etag(message):
+            nonlocal held
+            if message["type"] == "http.response.start":
+                if message["status"] == 200 and not any(k == b"etag" for k, _ in message["headers"]):
+                    held = message
+                else:
+                    await send(message)
+                return
+            if held is None:
+                await send(message)
+                return
+
+            start, held = held, None
+            if message.get("more_body", False):
+                await send(start)
+                await send(message)
+                return
+
+            etag = etag_for(message.get("body", b""))
+            if if_none_match and etag_matches(if_none_match, etag):
+                headers = [(k, v) for k, v in start["headers"]
+                           if k not in (b"content-length", b"content-type")]
+                await send({"type": "http.response.start", "status": 304,
+                            "headers": headers + [(b"etag", etag.encode())]})
+                await send({"type": "http.response.body", "body": b""})
+                return
+            await send({**start, "headers": [*start["headers"], (b"etag", etag.encode())]})
+            await send(message)
+
+        await self.app(scope, receive, send_with_etag)
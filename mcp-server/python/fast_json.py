@@ -0,0 +1,54 @@
+"""
+Fast JSON – one codec for the API, the MCP server and the client.
+
+Uses orjson when it is installed (pip install orjson) and the standard
+library otherwise; FAST_JSON=0 forces the standard library. Output is
+always compact and UTF-8, so both backends produce interchangeable text.
+
+    data = fast_json.loads(resp.content)        # bytes or str
+    body = fast_json.dumps(data)                # bytes
+    text = fast_json.dumps_str(data)            # str
+
+`ENABLED` also lets api.py encode its dict-shaped responses (the /customers
+page, the NDJSON export) directly instead of revalidating them through
+response_model, so installing orjson turns the whole fast mode on. Routes
+that return models are left to FastAPI, which already serializes them in
+pydantic-core.
+"""
+
+import json
+import os
+from datetime import date
+from typing import Any
+
+try:
+    import orjson
+except ImportError:                     # optional dependency
+    orjson = None
+
+ENABLED = orjson is not None and os.getenv("FAST_JSON", "1") != "0"
+
+
+def _default(value: Any) -> Any:
+    # What orjson encodes natively but the json module does not
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if ENABLED:
+    def dumps(value: Any) -> bytes:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+
+    def dumps_str(value: Any) -> str:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    loads = orjson.loads
+else:
+    def dumps(value: Any) -> bytes:
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=_default).encode()
+
+    def dumps_str(value: Any) -> str:
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=_default)
+
+    loads = json.loads
@@ -1,25 +1,164 @@
 import asyncio
+import hashlib
+import json
 import os
-from typing import Dict, List, Any, Optional
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Any, Optional
 from datetime import timedelta
 
-from contextlib import AsyncExitStack
+from contextlib import AsyncExitStack, asynccontextmanager, suppress
 
-from mcp import ClientSession
+from jsonschema import ValidationError, validators
+from mcp import ClientSession, types
 from mcp.client.streamable_http import streamablehttp_client
 
+import telemetry
+
+# Tool catalog cache – how long a listed catalog is trusted, and where the
+# on-disk snapshots live (MCP_TOOL_CATALOG_DIR= empty disables snapshots)
+TOOL_CATALOG_TTL = float(os.getenv('MCP_TOOL_CATALOG_TTL', '3600'))
+TOOL_CATALOG_DIR = os.getenv('MCP_TOOL_CATALOG_DIR', os.path.join(
+    os.getenv('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'mcp_tool_catalog'))
+
+# Sent as X-Client-Id; unset = the server tells clients apart by address
+MCP_CLIENT_ID = os.getenv('MCP_CLIENT_ID')
+
+
+@dataclass
+class ToolCatalog:
+    server_url: str
+    fetched_at: float                   # wall clock, so snapshots age across restarts
+    version: str                        # content hash – changes whenever the catalog does
+    tools: List[types.Tool]
+    openai_tools: List[Dict[str, Any]]
+    _validators: Dict[str, Any] = field(default_factory=dict, repr=False, compare=False)
+
+    def output_validator(self, name: str):
+        """jsonschema validator for a tool's output schema; None if it has none."""
+        if name not in self._validators:
+            schema = next((t.outputSchema for t in self.tools if t.name == name), None)
+            self._validators[name] = validators.validator_for(schema)(schema) if schema else None
+        return self._validators[name]
+
+
+def _to_openai_tools(tools: List[types.Tool]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "type": "function",
+            "function": {
+                "name": tool.name,
+                "description": tool.description,
+                "parameters": tool.inputSchema
+            }
+        } for tool in tools
+    ]
+
+
+class ToolCatalogCache:
+    """Converted tool catalogs per server URL, shared by every session.
+
+    Held in memory for the process and mirrored to a JSON snapshot on disk, so
+    a fresh process can skip tools/list too. An entry is dropped when its TTL
+    runs out or the server sends notifications/tools/list_changed.
+
+    Snapshots feed the model its tool definitions, so they are only written
+    to a directory private to the user (0700) and only loaded from files the
+    user owns.
+    """
+
+    def __init__(self, ttl: float = TOOL_CATALOG_TTL, snapshot_dir: Optional[str] = TOOL_CATALOG_DIR):
+        self.ttl = ttl
+        self.snapshot_dir = snapshot_dir or None
+        self._entries: Dict[str, ToolCatalog] = {}
+
+    def _snapshot_path(self, server_url: str) -> str:
+        digest = hashlib.sha256(server_url.encode()).hexdigest()[:16]
+        return os.path.join(self.snapshot_dir, f"{digest}.json")
+
+    def _fresh(self, catalog: ToolCatalog) -> bool:
+        return time.time() - catalog.fetched_at < self.ttl
+
+    def get(self, server_url: str) -> Optional[ToolCatalog]:
+        catalog = self._entries.get(server_url)
+        if catalog is None and self.snapshot_dir:
+            catalog = self._load_snapshot(server_url)
+            if catalog is not None:
+                self._entries[server_url] = catalog
+        if catalog is not None and not self._fresh(catalog):
+            self.invalidate(server_url)
+            return None
+        return catalog
+
+    def put(self, server_url: str, tools: List[types.Tool]) -> ToolCatalog:
+        dumped = [tool.model_dump(mode="json", by_alias=True, exclude_none=True) for tool in tools]
+        version = hashlib.sha256(json.dumps(dumped, sort_keys=True).encode()).hexdigest()[:16]
+        catalog = ToolCatalog(server_url, time.time(), version, tools, _to_openai_tools(tools))
+        self._entries[server_url] = catalog
+        if self.snapshot_dir:
+            self._save_snapshot(catalog, dumped)
+        return catalog
+
+    def invalidate(self, server_url: str):
+        self._entries.pop(server_url, None)
+        if self.snapshot_dir:
+            with suppress(OSError):
+                os.remove(self._snapshot_path(server_url))
+
+    def _load_snapshot(self, server_url: str) -> Optional[ToolCatalog]:
+        try:
+            with open(self._snapshot_path(server_url)) as f:
+                if hasattr(os, "getuid") and os.fstat(f.fileno()).st_uid != os.getuid():
+                    return None
+                data = json.load(f)
+            if data["server_url"] != server_url:
+                return None
+            tools = [types.Tool.model_validate(t) for t in data["tools"]]
+            return ToolCatalog(server_url, data["fetched_at"], data["version"], tools, data["openai_tools"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _save_snapshot(self, catalog: ToolCatalog, dumped: List[Dict[str, Any]]):
+        path = self._snapshot_path(catalog.server_url)
+        try:
+            os.makedirs(self.snapshot_dir, mode=0o700, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+                json.dump({
+                    "server_url": catalog.server_url,
+                    "fetched_at": catalog.fetched_at,
+                    "version": catalog.version,
+                    "tools": dumped,
+                    "openai_tools": catalog.openai_tools,
+                }, f)
+            os.replace(tmp, path)           # atomic – concurrent readers never see half a file
+        except OSError as e:
+            print(f"Could not write tool catalog snapshot {path}: {e}")
+
+
+tool_catalog = ToolCatalogCache()
+
+
 class MCPClient:
 
     def __init__(self, server_url: Optional[str] = None):
         self.server_url = server_url or os.getenv('MCP_SERVER_URL', '')
-        self.headers = None
+        # Groups this process's sessions for the server's per-client limit
+        self.headers = {'X-Client-Id': MCP_CLIENT_ID} if MCP_CLIENT_ID else None
         self.read, self.write, self.session_id = None, None, None
         self.session: Optional[ClientSession] = None
         self.tools = None
         self.OPENAI_TOOLS = None
+        self.catalog_version: Optional[str] = None
+        self._catalog: Optional[ToolCatalog] = None
         self.stack = AsyncExitStack()
+        self._refresh_task: Optional[asyncio.Task] = None
 
     async def setup(self):
+        with telemetry.span("client", "setup"):
+            await self._setup()
+
+    async def _setup(self):
 
         try:
             
@@ -37,46 +176,91 @@ class MCPClient:
             print(f"Connection established, Session ID: {self.session_id}")
 
             # 2. Create and initialize the MCP client session
-            self.session = await self.stack.enter_async_context(ClientSession(self.read, self.write))
+            self.session = await self.stack.enter_async_context(
+                ClientSession(self.read, self.write, message_handler=self._on_message))
             await self.session.initialize()
             print("MCP session initialized")
 
 
-            # 3. Use the session (e.g., list tools or call a tool)
-            # Example: List available tools
-            tools_response = await self.session.list_tools()
-            self.tools = tools_response.tools
-            #print("\nAvailable Tools:", [tool.name for tool in self.tools])
-
-            '''    
-            for tool in self.tools:
-                print(tool)
-                print("*****************")
-            '''
-            
-            self.OPENAI_TOOLS = [
-                {
-                    "type": "function",
-                    "function": {
-                        "name": tool.name,
-                        "description": tool.description,
-                        "parameters": tool.inputSchema
-                    }
-                } for tool in self.tools
-            ]
-            print(f"Listed available tools")
-            #print(json.dumps(OPENAI_TOOLS, indent=2)) 
+            # 3. Tool catalog – reuse the cached one unless it expired or changed
+            catalog = tool_catalog.get(self.server_url)
+            if catalog is None:
+                await self.refresh_tools()
+                print(f"Listed available tools")
+            else:
+                self._use_catalog(catalog)
+                print(f"Using cached tool catalog {catalog.version}")
 
 
         except Exception as e:
             print(f"Failed to connect to the server: {e}")
             raise
 
+    async def refresh_tools(self) -> ToolCatalog:
+        """List the server's tools and update the shared catalog cache."""
+        tools_response = await self.session.list_tools()
+        catalog = tool_catalog.put(self.server_url, tools_response.tools)
+        self._use_catalog(catalog)
+        return catalog
+
+    def _use_catalog(self, catalog: ToolCatalog):
+        self.tools = catalog.tools
+        self.OPENAI_TOOLS = catalog.openai_tools
+        self.catalog_version = catalog.version
+        self._catalog = catalog
+
+    async def _send_call_tool(self, tool_name: str, payload: Dict[str, Any],
+                              meta: Optional[Dict[str, Any]]) -> types.CallToolResult:
+        """Send tools/call without ClientSession.call_tool's own output check.
+
+        That check runs list_tools() before the first call of any tool the
+        session has not listed itself – every tool, when the catalog came
+        from the cache. Structured results are checked by _check_output
+        against the catalog instead.
+        """
+        params = types.CallToolRequestParams(
+            name=tool_name, arguments=payload,
+            _meta=types.RequestParams.Meta(**meta) if meta else None)
+        return await self.session.send_request(
+            types.ClientRequest(types.CallToolRequest(params=params)), types.CallToolResult)
+
+    def _check_output(self, tool_name: str, result: types.CallToolResult):
+        """Raise ValidationError if a result does not match the catalog's output schema."""
+        validator = self._catalog.output_validator(tool_name) if self._catalog else None
+        if validator is None or result.isError:
+            return
+        if result.structuredContent is None:
+            raise ValidationError(f"Tool {tool_name} has an output schema but returned no structured content")
+        validator.validate(result.structuredContent)
+
+    async def _on_message(self, message):
+        if (isinstance(message, types.ServerNotification)
+                and isinstance(message.root, types.ToolListChangedNotification)):
+            print("Tool list changed on server – refreshing catalog")
+            tool_catalog.invalidate(self.server_url)
+            # Refresh outside the receive loop, which must keep reading responses
+            self._refresh_task = asyncio.create_task(self.refresh_tools())
+
     async def call_tool(self, tool_name: str, payload: Dict[str, Any]) -> Any:
         if not self.session:
             raise RuntimeError("Session not initialized. Call setup() first.")
         
-        result = await self.session.call_tool(tool_name, payload)
+        with telemetry.span("client", tool_name) as hop:
+            # The server's tool span continues this trace (traceparent in _meta)
+            meta = telemetry.inject({}) or None
+            result = await self._send_call_tool(tool_name, payload, meta)
+            try:
+                self._check_output(tool_name, result)
+            except ValidationError:
+                # A result that does not match the (possibly cached) catalog usually
+                # means the server was redeployed since it was listed – refresh it
+                # and retry once
+                print(f"Output schema of {tool_name} is stale – refreshing tool catalog")
+                await self.refresh_tools()
+                result = await self._send_call_tool(tool_name, payload, meta)
+                self._check_output(tool_name, result)
+            if result.isError:
+                hop.status = "error"
         #print(f"Tool Result: {result.content}")
 
         # MCP call_tool result contains complex objects that need to be properly extracted.
@@ -99,9 +283,12 @@ class MCPClient:
                 # Fallback - try to convert to dict
                 content_list.append(str(content_item))
         
-        # Create a serializable result
+        # Create a serializable result. structuredContent is the tool's parsed
+        # output (already checked against its outputSchema above) and
+        # is passed through as-is – None for tools without an output schema.
         serializable_result = {
             "content": content_list,
+            "structuredContent": result.structuredContent,
             "isError": getattr(result, 'isError', False)
         }
 
@@ -111,6 +298,203 @@ class MCPClient:
         """Cleanup resources"""
         await self.stack.aclose()
 
+class _PooledSession:
+    """One warm MCPClient owned by a dedicated task.
+
+    The streamable-HTTP transport is built on anyio task groups, which must
+    be entered and exited by the same task. Each pooled session therefore
+    runs setup() and cleanup() in its own background task, and callers
+    borrow the connected client in between.
+    """
+
+    def __init__(self, server_url: str):
+        self.client = MCPClient(server_url)
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._error: Optional[BaseException] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+        await self._ready.wait()
+        if self._error is not None:
+            await self._task
+            raise self._error
+
+    async def _run(self):
+        try:
+            await self.client.setup()
+        except Exception as e:
+            self._error = e
+        self._ready.set()
+        try:
+            if self._error is None:
+                await self._closing.wait()
+        finally:
+            with suppress(Exception):
+                await self.client.cleanup()
+
+    @property
+    def alive(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def age(self) -> float:
+        return time.monotonic() - self.created_at
+
+    async def ping(self, timeout: float) -> bool:
+        if not self.alive:
+            return False
+        try:
+            await asyncio.wait_for(self.client.session.send_ping(), timeout)
+            return True
+        except Exception:
+            return False
+
+    async def close(self):
+        self._closing.set()
+        if self._task is not None:
+            with suppress(Exception, asyncio.CancelledError):
+                await self._task
+
+
+class MCPClientPool:
+    """Keeps warm, initialized MCP sessions and lends them to concurrent tasks.
+
+        async with MCPClientPool(url, size=8) as pool:
+            async with pool.session() as client:
+                await client.call_tool("customer_get_profile", {"email": ...})
+
+    * At most `size` sessions exist; extra borrowers wait for one to return.
+    * Sessions idle for longer than `health_check_interval` are pinged before
+      reuse; dead ones are dropped and replaced by a fresh connection.
+    * Sessions older than `max_age` are recycled when they are returned.
+    * A borrower that exits with an error gets its session pinged before it
+      goes back to the pool.
+    """
+
+    def __init__(self, server_url: Optional[str] = None, size: int = 4,
+                 max_age: float = 300.0, health_check_interval: float = 30.0,
+                 ping_timeout: float = 5.0, connect_attempts: int = 2):
+        self.server_url = server_url or os.getenv('MCP_SERVER_URL', '')
+        self.size = size
+        self.max_age = max_age
+        self.health_check_interval = health_check_interval
+        self.ping_timeout = ping_timeout
+        self.connect_attempts = connect_attempts
+        self._idle: List[_PooledSession] = []
+        self._slots = asyncio.Semaphore(size)
+        self._in_use = 0                        # checked out, or being opened for a borrower
+        self._closed = False
+        self.created = 0
+        self.recycled = 0
+        self.failed_health_checks = 0
+
+    async def __aenter__(self) -> "MCPClientPool":
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def warm(self, count: Optional[int] = None):
+        """Open sessions ahead of first use until `count` (default: size) exist.
+
+        Each session is opened under a slot, like a borrower's, and only if
+        idle and lent-out sessions still fall short of `count` by then – so
+        borrowers arriving mid-warm never take the pool past `size`.
+        """
+        count = min(count or self.size, self.size)
+        missing = max(0, count - len(self._idle) - self._in_use)
+        await asyncio.gather(*(self._warm_one(count) for _ in range(missing)))
+
+    async def _warm_one(self, count: int):
+        async with self._slots:
+            self._in_use += 1
+            try:
+                if len(self._idle) + self._in_use > count:
+                    return
+                pooled = await self._connect()
+                if self._closed:
+                    await pooled.close()
+                else:
+                    self._idle.append(pooled)
+            finally:
+                self._in_use -= 1
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[MCPClient]:
+        if self._closed:
+            raise RuntimeError("MCPClientPool is closed")
+        async with self._slots:
+            self._in_use += 1
+            try:
+                pooled = await self._checkout()
+                failed = False
+                try:
+                    yield pooled.client
+                except BaseException:
+                    failed = True
+                    raise
+                finally:
+                    await self._checkin(pooled, suspect=failed)
+            finally:
+                self._in_use -= 1
+
+    async def _connect(self) -> _PooledSession:
+        for attempt in range(1, self.connect_attempts + 1):
+            pooled = _PooledSession(self.server_url)
+            try:
+                await pooled.start()
+                self.created += 1
+                return pooled
+            except Exception:
+                if attempt == self.connect_attempts:
+                    raise
+                await asyncio.sleep(0.2 * attempt)
+
+    async def _checkout(self) -> _PooledSession:
+        while self._idle:
+            pooled = self._idle.pop()           # LIFO – most recently used is warmest
+            if not pooled.alive or pooled.age() > self.max_age:
+                self.recycled += 1
+                await pooled.close()
+                continue
+            if time.monotonic() - pooled.last_used > self.health_check_interval:
+                if not await pooled.ping(self.ping_timeout):
+                    self.failed_health_checks += 1
+                    await pooled.close()
+                    continue
+            return pooled
+        return await self._connect()
+
+    async def _checkin(self, pooled: _PooledSession, suspect: bool):
+        healthy = pooled.alive and (not suspect or await pooled.ping(self.ping_timeout))
+        if suspect and not healthy:
+            self.failed_health_checks += 1
+        if self._closed or not healthy or pooled.age() > self.max_age:
+            self.recycled += 1
+            await pooled.close()
+            return
+        pooled.last_used = time.monotonic()
+        self._idle.append(pooled)
+
+    async def close(self):
+        self._closed = True
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*(p.close() for p in idle))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "idle": len(self._idle),
+            "in_use": self._in_use,
+            "created": self.created,
+            "recycled": self.recycled,
+            "failed_health_checks": self.failed_health_checks,
+        }
+
+
 async def execute(server_url: str):
     
     client = MCPClient(server_url)
@@ -1,18 +1,77 @@
 import asyncio
-from typing import Dict, List  
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional  
 import json, os  
 from dotenv import load_dotenv
-from mcp_client import MCPClient  
-from openai import AzureOpenAI        
+from mcp_client import MCPClient, MCPClientPool, tool_catalog  
+from conversation_context import ConversationContext, strip_nulls
+from orchestration_cache import OrchestrationCache
+import fast_json
+import httpx
+import telemetry
+from openai import AsyncAzureOpenAI        
 
 load_dotenv()
 
-client = AzureOpenAI(
+# Async client – completions are awaited, so one process can run many
+# orchestrations at once instead of blocking the event loop on each call
+client = AsyncAzureOpenAI(
     api_key=os.getenv("AZURE_OPENAI_API_KEY"),
     api_version=os.getenv('AZURE_OPENAI_API_VERSION', "2024-08-01-preview"),
     azure_endpoint=os.getenv('AZURE_OPENAI_ENDPOINT')
 )
 DEPLOYMENT = os.getenv("AZURE_OPENAI_MODEL", "gpt-4o-mini")   # deployment name, NOT model-name  
+TOOL_CONCURRENCY = int(os.getenv("TOOL_CONCURRENCY", "4"))    # max tool calls in flight per LLM turn
+LLM_CONCURRENCY  = int(os.getenv("LLM_CONCURRENCY", "16"))    # max completions in flight per process
+ORCHESTRATION_CONCURRENCY = int(os.getenv("ORCHESTRATION_CONCURRENCY", "32"))   # default for run_many
+MCP_POOL_SIZE    = int(os.getenv("MCP_POOL_SIZE", "8"))        # warm MCP sessions shared by run_many
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "8000"))   # prompt budget per completion
+ORCHESTRATION_MODE = os.getenv("ORCHESTRATION_MODE", "llm")   # 'llm' or 'planner' (see plan_user_and_products)
+ORCHESTRATION_CACHE_TTL = float(os.getenv("ORCHESTRATION_CACHE_TTL", "300"))   # 0 disables the result cache
+ORCHESTRATION_CACHE_SIZE = int(os.getenv("ORCHESTRATION_CACHE_SIZE", "1024"))
+ORCHESTRATION_CACHE_PATH = os.getenv("ORCHESTRATION_CACHE_PATH")   # SQLite file; unset = memory only
+# The cache follows the Customer API change feed and drops a customer's records
+# when they are written (see _follow_changes)
+ORCHESTRATION_CHANGE_FEED = os.getenv("ORCHESTRATION_CHANGE_FEED", "1") == "1"
+CUSTOMER_API_URL = os.getenv("CUSTOMER_API_URL", "http://localhost:8000")
+CHANGE_FEED_WAIT = float(os.getenv("CHANGE_FEED_WAIT", "30"))        # long-poll seconds
+
+QUERY_TEMPLATE = ("I need customer and product details for {email}. Fetch following details - "
+                  "customer name, id, date of birth, email and products")
+
+_llm_semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+
+# Finished records per (query, tool catalog version, deployment) – see orchestration_cache.py
+orchestration_cache: Optional[OrchestrationCache] = (
+    OrchestrationCache(ORCHESTRATION_CACHE_TTL, ORCHESTRATION_CACHE_SIZE, ORCHESTRATION_CACHE_PATH)
+    if ORCHESTRATION_CACHE_TTL > 0 else None
+)
+
+
+async def _complete(**kwargs):
+    """chat.completions.create under the per-process LLM concurrency limit."""
+    async with _llm_semaphore:
+        with telemetry.span("llm", DEPLOYMENT):
+            return await client.chat.completions.create(**kwargs)
+
+
+async def _stream_completion(chunks: asyncio.Queue, **kwargs):
+    """Streamed chat.completions.create into `chunks`, then None.
+
+    Runs as its own task under the LLM limit and span, so the slot is held
+    for as long as the upstream stream is open – not while the consumer is
+    busy with a token it was handed.  Failures surface when the task is
+    awaited.
+    """
+    try:
+        async with _llm_semaphore:
+            with telemetry.span("llm", DEPLOYMENT):
+                stream = await client.chat.completions.create(
+                    stream=True, stream_options={"include_usage": True}, **kwargs)
+                async for chunk in stream:
+                    chunks.put_nowait(chunk)
+    finally:
+        chunks.put_nowait(None)
 
 '''  
 def _dispatch(mcp_client: MCPClient, name: str, args: Dict):  
@@ -24,82 +83,479 @@ def _dispatch(mcp_client: MCPClient, name: str, args: Dict):
     raise ValueError(f"Unknown tool: {name}")  
 '''  
   
-# Helper funciton  
-async def fetch_user_and_products(REMOTE_MCP_URL, email, max_rounds=5) -> Dict:  
+async def _call_tool_safely(mcp_client: MCPClient, name: str, arguments: str,
+                            semaphore: asyncio.Semaphore) -> Dict:
+    """Call one tool; a failure becomes an isError result instead of raising."""
+    async with semaphore:
+        try:
+            return await mcp_client.call_tool(name, json.loads(arguments or "{}"))
+        except Exception as e:
+            return {
+                "content": [{"type": "text", "text": f"Error: {type(e).__name__} – {e}"}],
+                "isError": True,
+            }
+
+
+async def _run_tool_calls(mcp_client: MCPClient, tool_calls, max_concurrency: int,
+                          context: ConversationContext) -> List[Dict]:
+    """Run one turn's tool calls concurrently; results come back in call order.
+
+    A failing call yields an isError result instead of cancelling its siblings.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    return await asyncio.gather(*(
+        _call_tool_safely(mcp_client, call.function.name,
+                          context.force_json(call.function.name, call.function.arguments), semaphore)
+        for call in tool_calls
+    ))
+
+
+def _error_text(result: Dict) -> str:
+    return " ".join(c.get("text", "") for c in result.get("content", []) if isinstance(c, dict)) or "tool error"
+
+
+def _structured(result: Dict) -> Optional[Dict]:
+    """The tool's parsed output – structuredContent, or None for an error result."""
+    if result.get("isError"):
+        return None
+    if result.get("structuredContent") is not None:
+        return result["structuredContent"]
+    # Server without output schemas: the JSON text is the same object
+    try:
+        data = fast_json.loads(result["content"][0]["text"])
+    except (KeyError, IndexError, ValueError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _remember(record: Dict, name: str, result: Dict):
+    """Keep the typed tool output the caller gets back next to the answer."""
+    data = _structured(result)
+    if data is None:
+        record.setdefault("errors", {})[name] = _error_text(result)
+        return
+    if name == "customer_get_by_email":   record["user_record"] = data
+    if name == "customer_get_products":   record["products"]    = data["products"]
+    if name == "customer_get_profile":    record["user_record"], record["products"] = data["customer"], data["products"]
+
+
+@asynccontextmanager
+async def _mcp_session(REMOTE_MCP_URL, pool: Optional[MCPClientPool]):
+    """Borrow a warm session from `pool`, or open a one-off client without one."""
+    if pool is not None:
+        async with pool.session() as mcp_client:
+            yield mcp_client
+        return
 
-    mcp_client = MCPClient(REMOTE_MCP_URL)  
+    mcp_client = MCPClient(REMOTE_MCP_URL)
     await mcp_client.setup()
+    try:
+        yield mcp_client
+    finally:
+        await mcp_client.cleanup()
+
+
+def _cacheable(record: Dict) -> bool:
+    """Only complete answers for a customer that exists are worth replaying."""
+    return bool(record.get("assistant_answer") and record.get("catalog_version")
+                and record.get("user_record"))
+
+
+# Change-feed followers, one per cache – started by the first _cached() call
+# on a running loop and restarted if that loop is gone
+_followers: Dict[int, asyncio.Task] = {}
+
+
+async def _follow_changes(cache: OrchestrationCache, api_url: str = CUSTOMER_API_URL,
+                          transport: Optional[httpx.AsyncBaseTransport] = None) -> None:
+    """Long-poll the Customer API's /changes and drop the records of every
+    customer written to.
+
+    The position survives reconnects, so writes made in between are still
+    applied; if the API no longer has them (`reset`) or the feed is lost,
+    the whole cache is flushed.
+    """
+    since: Optional[int] = None
+    connected = False
+    delay = 1.0
+    async with httpx.AsyncClient(base_url=api_url, transport=transport) as http:
+        while True:
+            try:
+                params = {} if since is None else {"since": since, "wait": CHANGE_FEED_WAIT, "limit": 1000}
+                resp = await http.get("/changes", params=params, timeout=CHANGE_FEED_WAIT + 10)
+                resp.raise_for_status()
+                feed = fast_json.loads(resp.content)
+            except Exception as e:
+                if connected:
+                    connected = False
+                    removed = await cache.invalidate()
+                    print(f"Change feed lost ({e}) – flushed {removed} cached records")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+                continue
+
+            delay = 1.0
+            if feed["reset"]:
+                await cache.invalidate()
+            customers = {("customer", change["customer_id"]) for change in feed["changes"]}
+            if customers:
+                await cache.invalidate_tags(customers)
+            since = feed["last_seq"]
+            connected = True
+
+
+def _ensure_follower(cache: OrchestrationCache):
+    task = _followers.get(id(cache))
+    if task is None or task.done():
+        _followers[id(cache)] = asyncio.create_task(_follow_changes(cache))
+
+
+async def _cache_lookup(cache: OrchestrationCache, REMOTE_MCP_URL, query: str, variant: str) -> Optional[Dict]:
+    """The stored record for `query`, marked cached=True, or None.
+
+    The lookup needs the catalog version, which is known without a session
+    once any session has listed (or loaded) the server's tool catalog.
+    """
+    if ORCHESTRATION_CHANGE_FEED:
+        _ensure_follower(cache)
+    catalog = tool_catalog.get(REMOTE_MCP_URL)
+    if catalog is None:
+        return None
+    record = await cache.get(cache.key(query, catalog.version, DEPLOYMENT, variant))
+    if record is not None:
+        record["cached"] = True
+    return record
+
+
+async def _cache_store(cache: OrchestrationCache, query: str, variant: str, record: Dict, generation: int):
+    """Store a finished record, tagged with its customer so the change feed can drop it."""
+    if _cacheable(record):
+        await cache.put(cache.key(query, record["catalog_version"], DEPLOYMENT, variant), record,
+                        tags=[("customer", record["user_record"]["id"])], generation=generation)
+
+
+async def _cached(cache: Optional[OrchestrationCache], REMOTE_MCP_URL, query: str, variant: str,
+                  run: Callable[[], Awaitable[Dict]]) -> Dict:
+    """Serve `query` from `cache` when possible, otherwise run it and store the record."""
+    # Root span – every LLM, MCP and API hop of this run shares its trace id
+    with telemetry.span("orchestration", variant) as hop:
+        if cache is None:
+            return await run()
+        record = await _cache_lookup(cache, REMOTE_MCP_URL, query, variant)
+        if record is not None:
+            hop.set("cached", True)
+            return record
+        generation = cache.generation
+        record = await run()
+        await _cache_store(cache, query, variant, record, generation)
+        return record
+
+
+# Helper funciton  
+async def fetch_user_and_products(REMOTE_MCP_URL, email, max_rounds=5,
+                                  max_concurrency=TOOL_CONCURRENCY,
+                                  pool: Optional[MCPClientPool] = None,
+                                  cache: Optional[OrchestrationCache] = orchestration_cache) -> Dict:  
+    """LLM-driven tool loop; repeated queries are answered from `cache` (None disables it)."""
+    query = QUERY_TEMPLATE.format(email=email)
+    return await _cached(cache, REMOTE_MCP_URL, query, "llm",
+                         lambda: _fetch_user_and_products(REMOTE_MCP_URL, query, max_rounds,
+                                                          max_concurrency, pool))
+
 
-    query = f"I need customer and product details for {email}. Fetch following details - customer name, id, date of birth, email and products"
+async def _fetch_user_and_products(REMOTE_MCP_URL, query, max_rounds=5,
+                                   max_concurrency=TOOL_CONCURRENCY,
+                                   pool: Optional[MCPClientPool] = None) -> Dict:
 
     messages = [{"role": "user", "content": query}]  
-    user_rec, product_rec = None, None  
+    record = {"assistant_answer": None, "user_record": None, "products": None}
 
     #print("Available Tools:")
     #print(mcp_client.OPENAI_TOOLS)
   
-    for _ in range(max_rounds):  
-        resp = client.chat.completions.create(  
-            model      = DEPLOYMENT,       
-            messages   = messages,  
-            tools      = mcp_client.OPENAI_TOOLS,   
-            tool_choice= "auto",  
-        )  
+    async with _mcp_session(REMOTE_MCP_URL, pool) as mcp_client:
+        # Compacts tool results and keeps the resent history within budget
+        context = ConversationContext(mcp_client.tools, token_budget=CONTEXT_TOKEN_BUDGET)
+        record["catalog_version"] = getattr(mcp_client, "catalog_version", None)
+
+        for _ in range(max_rounds):  
+            resp = await _complete(  
+                model      = DEPLOYMENT,       
+                messages   = context.prune(messages),  
+                tools      = mcp_client.OPENAI_TOOLS,   
+                tool_choice= "auto",  
+            )  
+            context.record_usage(resp.usage)
   
-        assistant_msg = resp.choices[0].message  
-        print(f"LLM Message {assistant_msg}")
+            assistant_msg = resp.choices[0].message  
+            print(f"LLM Message {assistant_msg}")
 
-        messages.append(assistant_msg)     # keep context  
+            messages.append(context.assistant_message(assistant_msg))     # keep context  
   
-        # a) The model wants to call a tool  
-        if assistant_msg.tool_calls:  
-            for call in assistant_msg.tool_calls:  
-                name      = call.function.name  
-                arguments = json.loads(call.function.arguments)  
+            # a) The model wants to call a tool  
+            if assistant_msg.tool_calls:  
+                # Independent calls of one turn run concurrently (bounded)
+                results = await _run_tool_calls(mcp_client, assistant_msg.tool_calls, max_concurrency, context)
 
-                #print(f"Model wants to call tool: {name} with arguments: {arguments}")
-                
-                #result  = _dispatch(mcp_client, name, arguments)  
-                result  = await mcp_client.call_tool(name, arguments)  
-                #print(f"Tool {name} Result: {result}")
+                for call, result in zip(assistant_msg.tool_calls, results):  
+                    name = call.function.name  
                 
-                #print(f"Result: {json.dumps(result)}")
-
-                if name == "customer_get_by_email":   user_rec     = result  
-                if name == "customer_get_products":   product_rec  = result  
-
-                messages.append(  
-                    {  
-                        "role":         "tool",  
-                        "tool_call_id": call.id,  
-                        "content": json.dumps(result),  
-                    }  
-                )  
-            continue    # let model think again with new info
-        
-        else: 
-            ## No further tool calls → final answer
-            break    
+                    #print(f"Result: {json.dumps(result)}")
 
-    await mcp_client.cleanup()
+                    _remember(record, name, result)
+
+                    messages.append(context.tool_message(call.id, result))  
+                continue    # let model think again with new info
+        
+            else: 
+                ## No further tool calls → final answer
+                break    
 
     # b) No further tool calls → final answer  
-    return {  
-        "assistant_answer": assistant_msg.content,  
-        "user_record":      user_rec,  
-        "products":         product_rec,  
-    }  
+    record["assistant_answer"] = assistant_msg.content
+    record["context"] = context.report()
+    print(f"Prompt tokens per round: {record['context']['prompt_tokens']}")
+    return record
   
     #raise RuntimeError("Exceeded maximum tool-calling turns.")  
+
+
+class PlanStepFailed(Exception):
+    """A fixed plan step did not produce what the next step needs."""
+
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message)
+        self.retryable = retryable          # the server was overloaded – same call may succeed later
+
+
+def _plan_step(result: Dict) -> Dict:
+    data = _structured(result)
+    if data is None:
+        error = (result.get("structuredContent") or {}).get("error") or {}
+        raise PlanStepFailed(_error_text(result), retryable=bool(error.get("retryable")))
+    return data
+
+
+def _render_answer(customer: Dict, products: List[Dict]) -> str:
+    lines = [f"{customer['name']} (id {customer['id']}, {customer['email']}, born {customer['dob']})"]
+    if products:
+        lines.append(f"Products ({len(products)}):")
+        lines += [f"- {p['name']} ({p['code']}), bought {p['date']} for ${p['buy_price']:.2f}" for p in products]
+    else:
+        lines.append("No products purchased.")
+    return "\n".join(lines)
+
+
+async def plan_user_and_products(REMOTE_MCP_URL, email, summarize=True, fallback=True,
+                                 pool: Optional[MCPClientPool] = None,
+                                 cache: Optional[OrchestrationCache] = orchestration_cache,
+                                 **kwargs) -> Dict:
+    """Deterministic fast path for the customer + products query.
+
+    The tool chain for this query never changes, so it is run directly over
+    MCP – customer_get_by_email, then customer_get_products with the id it
+    returned – without asking the model to pick tools. The LLM is only used
+    for one final summary (summarize=True); with summarize=False a plain
+    rendering of the structured records is returned and no LLM is called.
+
+    If a step fails (unknown email, unexpected output) and `fallback` is set,
+    the regular LLM-driven loop takes over; its answer is cached under this
+    planner variant only. A retryable failure (server overloaded) is raised
+    instead.
+    """
+    query = QUERY_TEMPLATE.format(email=email)
+    variant = "planner" if summarize else "planner-raw"
+    return await _cached(cache, REMOTE_MCP_URL, query, variant,
+                         lambda: _plan_user_and_products(REMOTE_MCP_URL, email, summarize, fallback,
+                                                         pool, **kwargs))
+
+
+async def _plan_user_and_products(REMOTE_MCP_URL, email, summarize, fallback,
+                                  pool: Optional[MCPClientPool], **kwargs) -> Dict:
+    record = {"assistant_answer": None, "user_record": None, "products": None, "mode": "planner"}
+    try:
+        async with _mcp_session(REMOTE_MCP_URL, pool) as mcp_client:
+            record["catalog_version"] = getattr(mcp_client, "catalog_version", None)
+            customer = _plan_step(await mcp_client.call_tool(
+                "customer_get_by_email", {"email": email, "response_format": "json"}))
+
+            result = await mcp_client.call_tool(
+                "customer_get_products", {"customer_id": customer["id"], "response_format": "json"})
+            # The API answers 404 for a customer without purchases
+            if result.get("isError") and "not found" in _error_text(result).lower():
+                products = []
+            else:
+                products = _plan_step(result)["products"]
+    except PlanStepFailed as e:
+        # An overloaded server is not helped by the longer LLM-driven loop
+        if not fallback or e.retryable:
+            raise
+        print(f"Planner step failed ({e}) – falling back to the LLM loop")
+        return await _fetch_user_and_products(REMOTE_MCP_URL, QUERY_TEMPLATE.format(email=email),
+                                              pool=pool, **kwargs)
+
+    record["user_record"], record["products"] = customer, products
+    if not summarize:
+        record["assistant_answer"] = _render_answer(customer, products)
+        return record
+
+    data = fast_json.dumps_str(strip_nulls({"customer": customer, "products": products}))
+    resp = await _complete(
+        model    = DEPLOYMENT,
+        messages = [
+            {"role": "system", "content": "Answer the user's request using only the data provided."},
+            {"role": "user", "content": f"{QUERY_TEMPLATE.format(email=email)}\n\nData:\n{data}"},
+        ],
+    )
+    record["assistant_answer"] = resp.choices[0].message.content
+    return record
+
+
+async def run_many(REMOTE_MCP_URL, emails: List[str],
+                   max_in_flight=ORCHESTRATION_CONCURRENCY,
+                   pool: Optional[MCPClientPool] = None, **kwargs) -> List:
+    """Run fetch_user_and_products for many emails concurrently in this process.
+
+    All orchestrations share `pool` (a temporary one of MCP_POOL_SIZE warm
+    sessions if none is given). Results are returned in input order; a
+    failed orchestration is returned as its exception instead of aborting
+    the others.
+    """
+    if pool is None:
+        async with MCPClientPool(REMOTE_MCP_URL, size=min(MCP_POOL_SIZE, max_in_flight)) as own_pool:
+            return await run_many(REMOTE_MCP_URL, emails, max_in_flight, pool=own_pool, **kwargs)
+
+    semaphore = asyncio.Semaphore(max_in_flight)
+
+    async def one(email):
+        async with semaphore:
+            return await fetch_user_and_products(REMOTE_MCP_URL, email, pool=pool, **kwargs)
+
+    return await asyncio.gather(*(one(e) for e in emails), return_exceptions=True)
   
-  
+
+async def stream_user_and_products(REMOTE_MCP_URL, email, max_rounds=5,
+                                   max_concurrency=TOOL_CONCURRENCY,
+                                   pool: Optional[MCPClientPool] = None,
+                                   record: Optional[Dict] = None,
+                                   cache: Optional[OrchestrationCache] = orchestration_cache) -> AsyncIterator[str]:
+    """Streaming variant of fetch_user_and_products.
+
+    Consumes chat-completion deltas and starts each tool call as soon as its
+    arguments are complete – i.e. when the model moves on to the next call
+    or the stream ends – so tool latency overlaps with generation. Yields the
+    assistant's text tokens as they arrive. Pass a dict as `record` to
+    receive assistant_answer / user_record / products once the generator is
+    exhausted.
+
+    Shares fetch_user_and_products' cache entries: a cached answer is
+    yielded as a single token, and a finished stream is stored for both.
+
+        async for token in stream_user_and_products(url, email):
+            print(token, end="", flush=True)
+    """
+    record = record if record is not None else {}
+    record.update(assistant_answer=None, user_record=None, products=None)
+    query = QUERY_TEMPLATE.format(email=email)
+    if cache is not None:
+        hit = await _cache_lookup(cache, REMOTE_MCP_URL, query, "llm")
+        if hit is not None:
+            record.update(hit)
+            if hit["assistant_answer"]:
+                yield hit["assistant_answer"]
+            return
+        generation = cache.generation
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    messages = [{"role": "user", "content": query}]
+    finished = False
+
+    async with _mcp_session(REMOTE_MCP_URL, pool) as mcp_client:
+        context = ConversationContext(mcp_client.tools, token_budget=CONTEXT_TOKEN_BUDGET)
+        record["context"] = context.report()
+        record["catalog_version"] = getattr(mcp_client, "catalog_version", None)
+
+        for _ in range(max_rounds):
+            content: List[str] = []
+            calls: Dict[int, Dict] = {}             # index -> {id, name, arguments}
+            tasks: Dict[int, asyncio.Task] = {}
+
+            def dispatch(index: int):
+                call = calls[index]
+                tasks[index] = asyncio.create_task(_call_tool_safely(
+                    mcp_client, call["name"], context.force_json(call["name"], call["arguments"]), semaphore))
+
+            chunks: asyncio.Queue = asyncio.Queue()
+            producer = asyncio.create_task(_stream_completion(
+                chunks,
+                model       = DEPLOYMENT,
+                messages    = context.prune(messages),
+                tools       = mcp_client.OPENAI_TOOLS,
+                tool_choice = "auto",
+            ))
+            try:
+                while (chunk := await chunks.get()) is not None:
+                    context.record_usage(getattr(chunk, "usage", None))
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    if delta.content:
+                        content.append(delta.content)
+                        yield delta.content
+                    for tc in delta.tool_calls or []:
+                        if tc.index not in calls:
+                            # A new call begins – every earlier one is complete
+                            for done in sorted(set(calls) - set(tasks)):
+                                dispatch(done)
+                            calls[tc.index] = {"id": tc.id, "name": "", "arguments": ""}
+                        if tc.function and tc.function.name:
+                            calls[tc.index]["name"] += tc.function.name
+                        if tc.function and tc.function.arguments:
+                            calls[tc.index]["arguments"] += tc.function.arguments
+                await producer                     # re-raises an upstream failure
+                for index in sorted(set(calls) - set(tasks)):
+                    dispatch(index)
+
+                ordered = sorted(calls)
+                results = [await tasks[i] for i in ordered]
+            finally:
+                producer.cancel()
+                for task in tasks.values():
+                    task.cancel()
+
+            record["assistant_answer"] = "".join(content) or None
+            record["context"] = context.report()
+            if not calls:
+                ## No further tool calls → final answer
+                finished = True
+                break
+
+            messages.append({
+                "role": "assistant",
+                "content": record["assistant_answer"],
+                "tool_calls": [
+                    {"id": calls[i]["id"], "type": "function",
+                     "function": {"name": calls[i]["name"], "arguments": calls[i]["arguments"]}}
+                    for i in ordered
+                ],
+            })
+            for i, result in zip(ordered, results):
+                _remember(record, calls[i]["name"], result)
+                messages.append(context.tool_message(calls[i]["id"], result))
+
+    if finished and cache is not None:
+        await _cache_store(cache, query, "llm", record, generation)
+
 
 if __name__ == "__main__":  
     
     REMOTE_MCP_URL = "http://localhost:3000/mcp"
     email  = "jane.smith@example.com"
 
-    res = asyncio.run(fetch_user_and_products(REMOTE_MCP_URL, email)) 
+    if ORCHESTRATION_MODE == "planner":
+        res = asyncio.run(plan_user_and_products(REMOTE_MCP_URL, email))
+    else:
+        res = asyncio.run(fetch_user_and_products(REMOTE_MCP_URL, email)) 
     print("**************************************")  
     #print(json.dumps(res, indent=2)) 
     print(res['assistant_answer'])
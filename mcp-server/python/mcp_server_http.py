@@ -19,20 +19,103 @@ Claude Desktop config:
     }
 """
 
+import asyncio
+import functools
+import importlib.util
 import json
+import os
 import sys
 import logging
-from typing import Optional
+from collections import OrderedDict
+from contextlib import asynccontextmanager, suppress
+from typing import Annotated, Any, Callable, Hashable, Iterable, Optional
 
 import httpx
 from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp.exceptions import ToolError
+from mcp.types import CallToolResult, TextContent
+from pydantic import BaseModel
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+from models import Customer, CustomerProduct, Product, ProductTotals
+import fast_json
+import telemetry
+from admission import AdmissionController, Overloaded
+from resilience import CircuitBreaker, CircuitOpenError, ResilientUpstream, RetryPolicy, retry_after_seconds
+from response_cache import ResponseCache
 
 # ---------------------------------------------------------------------------
-# Config  – adjust these two values to match your environment
+# Config  – adjust these two values to match your environment (or set
+# CUSTOMER_API_URL / MCP_PORT)
 # ---------------------------------------------------------------------------
-CUSTOMER_API_URL = "http://localhost:8000"   # your Customer API base URL
-MCP_PORT         = 3000                      # port this MCP server listens on
-HTTPX_TIMEOUT    = 10.0                      # seconds
+CUSTOMER_API_URL = os.getenv("CUSTOMER_API_URL", "http://localhost:8000")   # your Customer API base URL
+MCP_PORT         = int(os.getenv("MCP_PORT", "3000"))                       # port this MCP server listens on
+MCP_HOST         = os.getenv("MCP_HOST", "127.0.0.1")                       # 0.0.0.0 to accept remote clients
+HTTPX_TIMEOUT    = 10.0                      # seconds (read/write)
+MAX_BATCH_SIZE   = 500                       # keys per /customers/batch call
+
+# Worker processes behind MCP_PORT (see the entry point). A streamable-HTTP
+# session lives in the memory of the worker that created it, so several
+# workers need stateless mode: every request is self-contained and any worker
+# can serve it. json_response answers with plain JSON instead of an SSE stream.
+MCP_WORKERS       = int(os.getenv("MCP_WORKERS", "1"))
+MCP_STATELESS     = os.getenv("MCP_STATELESS", "1" if MCP_WORKERS > 1 else "0") == "1"
+MCP_JSON_RESPONSE = os.getenv("MCP_JSON_RESPONSE", "1" if MCP_STATELESS else "0") == "1"
+
+# Upstream connection pool (see _build_http)
+HTTPX_MAX_CONNECTIONS   = int(os.getenv("HTTPX_MAX_CONNECTIONS", "100"))
+HTTPX_MAX_KEEPALIVE     = int(os.getenv("HTTPX_MAX_KEEPALIVE", "50"))
+HTTPX_KEEPALIVE_EXPIRY  = float(os.getenv("HTTPX_KEEPALIVE_EXPIRY", "30"))
+HTTPX_CONNECT_TIMEOUT   = float(os.getenv("HTTPX_CONNECT_TIMEOUT", "3"))
+HTTPX_POOL_TIMEOUT      = float(os.getenv("HTTPX_POOL_TIMEOUT", "5"))
+HTTPX_HTTP2             = os.getenv("HTTPX_HTTP2", "0") == "1"   # needs `pip install httpx[http2]`
+
+# Retries / circuit breaker / hedging for upstream calls (see resilience.py)
+RETRY_MAX_ATTEMPTS        = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY          = float(os.getenv("RETRY_BASE_DELAY", "0.1"))
+RETRY_MAX_DELAY           = float(os.getenv("RETRY_MAX_DELAY", "2.0"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT     = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+HEDGE_AFTER               = float(os.getenv("HEDGE_AFTER", "0"))   # seconds, 0 = no hedging
+
+# Admission control in front of every tool (see admission.py) – per worker
+ADMISSION_ENABLED         = os.getenv("ADMISSION_ENABLED", "1") == "1"
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "64"))   # tool calls running at once
+ADMISSION_MAX_PER_CLIENT  = int(os.getenv("ADMISSION_MAX_PER_CLIENT", "16"))    # ... of them for one client
+ADMISSION_MAX_QUEUE       = int(os.getenv("ADMISSION_MAX_QUEUE", "128"))        # calls allowed to wait
+ADMISSION_MAX_WAIT        = float(os.getenv("ADMISSION_MAX_WAIT", "2.0"))       # seconds before a waiter is shed
+TOOL_RATE_LIMITS = {                         # (calls per second, burst), per tool
+    "customer_get_by_email":       (200.0, 400),
+    "customer_list_all":           (20.0, 40),
+    "customer_get_products":       (200.0, 400),
+    "customer_get_by_emails":      (20.0, 40),
+    "customer_get_products_batch": (20.0, 40),
+    "customer_get_profile":        (200.0, 400),
+    "customer_find_products":      (50.0, 100),
+    "customer_product_summary":    (50.0, 100),
+}
+
+# Response cache in front of the Customer API (CACHE_ENABLED=0 turns it off)
+CACHE_ENABLED     = os.getenv("CACHE_ENABLED", "1") == "1"
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "4096"))
+CACHE_TTLS = {                               # seconds, per tool
+    "customer_get_by_email":       60.0,
+    "customer_list_all":           15.0,
+    "customer_get_products":       60.0,
+    "customer_get_by_emails":      60.0,
+    "customer_get_products_batch": 60.0,
+    "customer_get_profile":        60.0,
+    "customer_find_products":      30.0,
+    "customer_product_summary":    30.0,
+}
+
+# Change feed of the Customer API (see _follow_changes). While it is live
+# every write drops exactly the cached entries it touched, so entries are
+# kept for CACHE_TTL_WITH_FEED instead of the short CACHE_TTLS above
+CHANGE_FEED_ENABLED = os.getenv("CHANGE_FEED_ENABLED", "1") == "1"
+CHANGE_FEED_WAIT    = float(os.getenv("CHANGE_FEED_WAIT", "30"))       # long-poll seconds
+CACHE_TTL_WITH_FEED = float(os.getenv("CACHE_TTL_WITH_FEED", "600"))
 
 # ---------------------------------------------------------------------------
 # Logging  – stderr only, never touches the HTTP stream
@@ -42,26 +125,284 @@ logging.basicConfig(stream=sys.stderr, level=logging.INFO,
 logger = logging.getLogger("customer_mcp")
 
 # ---------------------------------------------------------------------------
-# Shared async HTTP client (created lazily, reused across calls)
+# Shared async HTTP client
+#
+# Opened when the app starts and closed when it stops (see create_app);
+# _get_http still creates it on first use for callers outside the app, with
+# a lock so concurrent first calls cannot each build their own pool.
 # ---------------------------------------------------------------------------
+class _CountingTransport(httpx.AsyncBaseTransport):
+    """Wraps the pooled transport to count requests in flight."""
+
+    def __init__(self, inner: httpx.AsyncHTTPTransport):
+        self.inner = inner
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests_total = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.in_flight += 1
+        self.requests_total += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            return await self.inner.handle_async_request(request)
+        finally:
+            self.in_flight -= 1
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
 _http: Optional[httpx.AsyncClient] = None
+_http_transport: Optional[_CountingTransport] = None
+_http_lock = asyncio.Lock()
+
+def _build_http() -> httpx.AsyncClient:
+    global _http_transport
+    http2 = HTTPX_HTTP2
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("HTTPX_HTTP2=1 but the 'h2' package is missing – falling back to HTTP/1.1")
+        http2 = False
+    # HTTP/2 is negotiated via TLS ALPN, so it only applies to https:// upstreams
+    _http_transport = _CountingTransport(httpx.AsyncHTTPTransport(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=HTTPX_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTPX_MAX_KEEPALIVE,
+            keepalive_expiry=HTTPX_KEEPALIVE_EXPIRY,
+        ),
+    ))
+    return httpx.AsyncClient(
+        base_url=CUSTOMER_API_URL,
+        transport=_http_transport,
+        timeout=httpx.Timeout(HTTPX_TIMEOUT, connect=HTTPX_CONNECT_TIMEOUT, pool=HTTPX_POOL_TIMEOUT),
+    )
 
 async def _get_http() -> httpx.AsyncClient:
     global _http
     if _http is None or _http.is_closed:
-        _http = httpx.AsyncClient(base_url=CUSTOMER_API_URL, timeout=HTTPX_TIMEOUT)
+        async with _http_lock:
+            if _http is None or _http.is_closed:
+                _http = _build_http()
     return _http
 
+async def _close_http() -> None:
+    global _http
+    async with _http_lock:
+        if _http is not None and not _http.is_closed:
+            await _http.aclose()
+        _http = None
+
+def _connection_stats() -> dict:
+    """Open and idle upstream connections, or "unknown".
+
+    httpx does not publish pool gauges; its transport keeps the httpcore pool
+    in a private attribute, so read it defensively – a release that moves it
+    only costs these two numbers.
+    """
+    try:
+        connections = list(_http_transport.inner._pool.connections)
+        return {"connections": len(connections),
+                "idle_connections": sum(1 for c in connections if c.is_idle())}
+    except Exception:
+        return {"connections": "unknown", "idle_connections": "unknown"}
+
+def _pool_stats() -> dict:
+    stats = {
+        "max_connections": HTTPX_MAX_CONNECTIONS,
+        "max_keepalive": HTTPX_MAX_KEEPALIVE,
+        "http2": HTTPX_HTTP2,
+        "open": _http is not None and not _http.is_closed,
+    }
+    if _http_transport is None:
+        return stats
+    # From our own counters: over HTTP/1.1 each request in flight holds a
+    # connection and those beyond max_connections wait for one (HTTP/2
+    # multiplexes, so there both are upper bounds)
+    in_flight = _http_transport.in_flight
+    stats.update(
+        in_flight=in_flight,
+        peak_in_flight=_http_transport.peak_in_flight,
+        requests_total=_http_transport.requests_total,
+        queued_requests=max(0, in_flight - HTTPX_MAX_CONNECTIONS),
+        utilization=round(min(in_flight, HTTPX_MAX_CONNECTIONS) / HTTPX_MAX_CONNECTIONS, 4),
+        **_connection_stats(),
+    )
+    return stats
+
+# ---------------------------------------------------------------------------
+# Response cache + resilience – every upstream read goes through _fetch_json
+# ---------------------------------------------------------------------------
+_cache = ResponseCache(max_entries=CACHE_MAX_ENTRIES)
+_upstream = ResilientUpstream(
+    RetryPolicy(max_attempts=RETRY_MAX_ATTEMPTS, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY),
+    CircuitBreaker(failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT),
+    hedge_after=HEDGE_AFTER or None,
+)
+
+# Last ETag and body seen per GET: once its cache entry is gone the request
+# is revalidated with If-None-Match and a 304 reuses the body we already have
+_validators: "OrderedDict[Hashable, tuple[str, Any]]" = OrderedDict()
+_not_modified = 0
+
+def _remember_validator(key: Hashable, etag: str, value: Any) -> None:
+    _validators[key] = (etag, value)
+    _validators.move_to_end(key)
+    while len(_validators) > CACHE_MAX_ENTRIES:
+        _validators.popitem(last=False)
+
+async def _fetch_json(tool: str, path: str, params: Optional[dict] = None,
+                      body: Optional[dict] = None, tags: Iterable[Hashable] = ()) -> Any:
+    """Fetch a JSON resource from the Customer API through the response cache.
+
+    GET when `body` is None, otherwise POST (read-only batch endpoints, so
+    just as safe to retry). Identical concurrent requests share one upstream
+    call, transient failures are retried, and the remaining HTTP errors
+    propagate to the caller and are never cached. `tags` name the customers
+    the response depends on, so the change feed can invalidate it.
+    """
+    key = (path, tuple(sorted((params or {}).items())),
+           json.dumps(body, sort_keys=True) if body is not None else None)
+
+    async def fetch() -> Any:
+        global _not_modified
+        http = await _get_http()
+        validator = _validators.get(key) if body is None and CACHE_ENABLED else None
+        with telemetry.span("upstream", tool) as hop:
+            headers = telemetry.inject({})          # the API continues this trace
+            if body is None:
+                if validator is not None:
+                    headers["If-None-Match"] = validator[0]
+                resp = await _upstream.request(lambda: http.get(path, params=params, headers=headers))
+            else:
+                content = fast_json.dumps(body)
+                headers["Content-Type"] = "application/json"
+                resp = await _upstream.request(lambda: http.post(path, content=content, headers=headers))
+            if resp.status_code >= 500:
+                hop.status = "error"
+        if resp.status_code == 304 and validator is not None:
+            _not_modified += 1
+            _validators.move_to_end(key)
+            return validator[1]
+        resp.raise_for_status()
+        value = fast_json.loads(resp.content)
+        etag = resp.headers.get("etag")
+        if etag and body is None and CACHE_ENABLED:
+            _remember_validator(key, etag, value)
+        return value
+
+    if not CACHE_ENABLED:
+        ttl = 0.0
+    elif _feed["connected"]:
+        ttl = CACHE_TTL_WITH_FEED
+    else:
+        ttl = CACHE_TTLS.get(tool, 0.0)
+    return await _cache.get_or_fetch(tool, key, fetch, ttl=ttl, tags=tags)
+
+# ---------------------------------------------------------------------------
+# Change feed – drops the cache entries a write on the Customer API made stale
+# ---------------------------------------------------------------------------
+_LIST_TAG = ("customers",)                      # every page of customer_list_all
+_PRODUCTS_TAG = ("products",)                   # product queries across customers
+
+_feed = {"enabled": CHANGE_FEED_ENABLED and CACHE_ENABLED, "connected": False, "last_seq": None,
+         "changes": 0, "resets": 0, "invalidated": 0}
+
+def _change_tags(change: dict) -> list:
+    tags: list = [("customer", change["customer_id"])]
+    tags += [("email", e) for e in change["emails"]]
+    if change["entity"] == "customer":
+        tags.append(_LIST_TAG)
+    if change["entity"] != "customer" or change["op"] == "delete":
+        tags.append(_PRODUCTS_TAG)
+    return tags
+
+async def _follow_changes() -> None:
+    """Long-poll /changes for as long as the app runs.
+
+    Entries are only kept for CACHE_TTL_WITH_FEED while the feed is live: if
+    it drops, the whole cache is flushed and the short per-tool TTLs apply
+    until it is back. The position survives reconnects, so writes made in
+    between are still applied; if the API no longer has them (`reset`),
+    the cache is flushed instead.
+    """
+    since: Optional[int] = None
+    delay = 1.0
+    while True:
+        try:
+            http = await _get_http()
+            params = {} if since is None else {"since": since, "wait": CHANGE_FEED_WAIT, "limit": 1000}
+            resp = await http.get("/changes", params=params, timeout=CHANGE_FEED_WAIT + HTTPX_TIMEOUT)
+            resp.raise_for_status()
+            feed = fast_json.loads(resp.content)
+        except Exception as e:
+            if _feed["connected"]:
+                _feed["connected"] = False
+                removed = _cache.invalidate()
+                logger.warning("Change feed lost (%s) – flushed %d cache entries", e, removed)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+            continue
+
+        delay = 1.0
+        if feed["reset"]:
+            _feed["resets"] += 1
+            _feed["invalidated"] += _cache.invalidate()
+            logger.warning("Change feed reset at seq %d – cache flushed", feed["last_seq"])
+        for change in feed["changes"]:
+            _feed["invalidated"] += _cache.invalidate_tags(_change_tags(change))
+        _feed["changes"] += len(feed["changes"])
+        since = _feed["last_seq"] = feed["last_seq"]
+        if not _feed["connected"]:
+            _feed["connected"] = True
+            logger.info("Following the Customer API change feed from seq %d", since)
+
+# ===========================================================================
+# Structured output – advertised as each tool's outputSchema
+# ===========================================================================
+class CustomerPageOut(BaseModel):
+    items: list[dict[str, Any]]             # projected rows – only the requested fields
+    next_cursor: Optional[str] = None
+
+class ProductsOut(BaseModel):
+    products: list[Product]
+
+class CustomersByEmailOut(BaseModel):
+    customers: dict[str, Optional[Customer]]
+
+class ProductsByIdOut(BaseModel):
+    products: dict[str, Optional[list[Product]]]
+
+class CustomerProfileOut(BaseModel):
+    customer: Customer
+    products: list[Product]
+
+class ProductPageOut(BaseModel):
+    items: list[CustomerProduct]
+    next_cursor: Optional[str] = None
+
+class ProductSummaryOut(BaseModel):
+    totals: ProductTotals
+    by_customer: Optional[list[ProductTotals]] = None
+
+def _tool_result(data: dict, response_format: str, markdown: Callable[[], str]) -> CallToolResult:
+    """Structured content plus one text block – compact JSON or markdown.
+
+    `data` is the parsed API payload as-is; it is serialized once, by the
+    transport, and clients read it back from structuredContent.
+    """
+    text = fast_json.dumps_str(data) if response_format == "json" else markdown()
+    return CallToolResult(content=[TextContent(type="text", text=text)], structuredContent=data)
+
 # ===========================================================================
 # Formatting helpers
 # ===========================================================================
+_CUSTOMER_LABELS = (("id", "ID"), ("name", "Name"), ("email", "Email"), ("dob", "Date of Birth"))
+
 def _fmt_customer(c: dict) -> str:
-    return (
-        f"- **ID:** {c['id']}\n"
-        f"  **Name:** {c['name']}\n"
-        f"  **Email:** {c['email']}\n"
-        f"  **Date of Birth:** {c['dob']}"
-    )
+    # Only the fields present are rendered, so projected rows format too
+    lines = [f"**{label}:** {c[key]}" for key, label in _CUSTOMER_LABELS if key in c]
+    return "- " + "\n  ".join(lines)
 
 def _fmt_product(p: dict) -> str:
     warranty = (
@@ -77,40 +418,136 @@ def _fmt_product(p: dict) -> str:
         f"{warranty}"
     )
 
-def _api_error(e: Exception) -> str:
-    """Translate any HTTP / network exception into a user-friendly string."""
+def _fmt_totals(t: dict) -> str:
+    return (f"**Products:** {t['count']} (with warranty: {t['with_warranty']})  |  "
+            f"**List Total:** ${t['list_total']:,.2f}  |  **Spend:** ${t['spend']:,.2f}  |  "
+            f"**Discount:** ${t['discount']:,.2f}")
+
+def _product_query(customer_id: Optional[int], **filters) -> tuple[dict, list]:
+    """Query parameters of /products and /products/summary, and the cache tags of the result."""
+    params = {k: v for k, v in filters.items() if v is not None}
+    if customer_id is not None:
+        params["customer_id"] = customer_id
+        return params, [("customer", customer_id)]
+    return params, [_PRODUCTS_TAG]
+
+def _api_error(e: Exception) -> Exception:
+    """Translate any HTTP / network exception into a user-friendly tool error.
+
+    An API that is rate limiting or unavailable yields Overloaded, which
+    reaches the client as a structured, retryable error (see CustomerMCP).
+    """
     if isinstance(e, httpx.HTTPStatusError):
         s = e.response.status_code
         if s == 404:
-            return "Error: Resource not found. Double-check the ID or email."
+            return ToolError("Resource not found. Double-check the ID or email.")
         if s == 422:
             try:
-                return f"Error: Validation failed – {e.response.json().get('detail', [])}"
+                return ToolError(f"Validation failed – {e.response.json().get('detail', [])}")
             except Exception:
-                return "Error: Validation failed. Check your input parameters."
+                return ToolError("Validation failed. Check your input parameters.")
         if s == 429:
-            return "Error: Rate limit hit. Please wait and retry."
-        return f"Error: API returned status {s}."
+            return Overloaded("upstream_rate_limited", retry_after_seconds(e.response) or 1.0,
+                              "Customer API is rate limiting requests.")
+        if s >= 500:
+            return ToolError(f"Customer API failed with status {s} after retries. Try again later.")
+        return ToolError(f"API returned status {s}.")
+    if isinstance(e, CircuitOpenError):
+        return Overloaded("upstream_unavailable", e.retry_in, "Customer API is temporarily unavailable.")
     if isinstance(e, httpx.TimeoutException):
-        return "Error: Request timed out. Try again shortly."
+        return ToolError("Request timed out. Try again shortly.")
     if isinstance(e, httpx.ConnectError):
-        return f"Error: Cannot connect to Customer API at {CUSTOMER_API_URL}. Is it running?"
-    return f"Error: {type(e).__name__} – {e}"
+        return ToolError(f"Cannot connect to Customer API at {CUSTOMER_API_URL}. Is it running?")
+    return ToolError(f"{type(e).__name__} – {e}")
+
+# ===========================================================================
+# Admission control
+# ===========================================================================
+_admission: Optional[AdmissionController] = AdmissionController(
+    max_concurrency=ADMISSION_MAX_CONCURRENCY,
+    max_per_client=ADMISSION_MAX_PER_CLIENT,
+    max_queue=ADMISSION_MAX_QUEUE,
+    max_wait=ADMISSION_MAX_WAIT,
+    rate_limits=TOOL_RATE_LIMITS,
+) if ADMISSION_ENABLED else None
+
+def _client_id() -> str:
+    """The unit of the per-client limit: the X-Client-Id header, else the peer address."""
+    try:
+        request = mcp.get_context().request_context.request
+    except ValueError:                      # called outside an MCP request
+        return "local"
+    if request is None:
+        return "local"
+    return request.headers.get("x-client-id") or (request.client.host if request.client else "unknown")
+
+def _overloaded_result(tool: str, e: Overloaded) -> CallToolResult:
+    return CallToolResult(
+        content=[TextContent(type="text", text=f"Error executing tool {tool}: {e}")],
+        structuredContent=e.to_dict(),
+        isError=True,
+    )
+
+class CustomerMCP(FastMCP):
+    """FastMCP whose tool calls pass admission control first.
+
+    call_tool is the handler FastMCP registers for tools/call, so overriding
+    it covers every tool and can answer an overload with a structured result
+    ({"error": {"type": "overloaded", "retryable": true, "retry_after": ...}}).
+    A tool body can only raise ToolError, which reaches the client as text.
+    """
+
+    async def call_tool(self, name: str, arguments: dict[str, Any]) -> Any:
+        try:
+            if _admission is None:
+                return await super().call_tool(name, arguments)
+            async with _admission.admit(name, _client_id()):
+                return await super().call_tool(name, arguments)
+        except Overloaded as e:
+            return _overloaded_result(name, e)
+        except ToolError as e:
+            # FastMCP wraps what a tool raised – e.g. _api_error's Overloaded
+            if isinstance(e.__cause__, Overloaded):
+                return _overloaded_result(name, e.__cause__)
+            raise
 
 # ===========================================================================
 # FastMCP server instance
 # ===========================================================================
-mcp = FastMCP(
+mcp = CustomerMCP(
     name="customer_mcp",
-    host="127.0.0.1",
+    host=MCP_HOST,
     port=MCP_PORT,
+    stateless_http=MCP_STATELESS,
+    json_response=MCP_JSON_RESPONSE,
 )
 
+def _caller_trace() -> Optional[telemetry.SpanContext]:
+    """The traceparent the client sent in the tool call's _meta, if any."""
+    try:
+        meta = mcp.get_context().request_context.meta
+    except ValueError:                      # called outside an MCP request
+        return None
+    return telemetry.parse_traceparent(getattr(meta, "traceparent", None))
+
+def _traced(tool: Callable) -> Callable:
+    """Run a tool body inside a "tool" span that continues the caller's trace.
+
+    Goes under @mcp.tool(); functools.wraps keeps the signature and docstring
+    FastMCP builds the input/output schemas and description from.
+    """
+    @functools.wraps(tool)
+    async def wrapper(*args, **kwargs):
+        with telemetry.span("tool", tool.__name__, parent=_caller_trace()):
+            return await tool(*args, **kwargs)
+    return wrapper
+
 # ===========================================================================
 # Tool 1 – customer_get_by_email
 # ===========================================================================
 @mcp.tool()
-async def customer_get_by_email(email: str, response_format: str = "markdown") -> str:
+@_traced
+async def customer_get_by_email(email: str, response_format: str = "markdown") -> Annotated[CallToolResult, Customer]:
     """Look up a single customer by their email address.
 
     Returns the customer's id, name, email and date of birth.
@@ -121,83 +558,465 @@ async def customer_get_by_email(email: str, response_format: str = "markdown") -
         response_format: 'markdown' (default, human-readable) or 'json'
     """
     email = email.strip().lower()
-    http = await _get_http()
     try:
-        resp = await http.get("/customer", params={"email": email})
-        resp.raise_for_status()
-        customer = resp.json()
+        customer = await _fetch_json("customer_get_by_email", "/customer", params={"email": email},
+                                     tags=[("email", email)])
     except Exception as e:
-        return _api_error(e)
+        raise _api_error(e) from e
 
-    if response_format == "json":
-        return json.dumps(customer, indent=2)
-    return f"### Customer\n{_fmt_customer(customer)}"
+    return _tool_result(customer, response_format, lambda: f"### Customer\n{_fmt_customer(customer)}")
 
 
 # ===========================================================================
 # Tool 2 – customer_list_all
 # ===========================================================================
 @mcp.tool()
-async def customer_list_all(response_format: str = "markdown") -> str:
-    """Retrieve every customer currently in the database.
+@_traced
+async def customer_list_all(
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    fields: Optional[list[str]] = None,
+    email_prefix: Optional[str] = None,
+    dob_from: Optional[str] = None,
+    dob_to: Optional[str] = None,
+    response_format: str = "markdown",
+) -> Annotated[CallToolResult, CustomerPageOut]:
+    """List customers one page at a time.
+
+    Returns at most `limit` customers. If more exist, the result includes a
+    next_cursor; pass it back as `cursor` to fetch the following page.
+    Ask only for the fields you need to keep the result small.
 
     Args:
+        limit: Page size, 1-1000 (default 50)
+        cursor: next_cursor from the previous page; omit for the first page
+        fields: Subset of ['id', 'email', 'name', 'dob'] to return (default: all)
+        email_prefix: Only customers whose email starts with this prefix
+        dob_from: Only customers born on or after this date (YYYY-MM-DD)
+        dob_to: Only customers born on or before this date (YYYY-MM-DD)
         response_format: 'markdown' (default, human-readable) or 'json'
     """
-    http = await _get_http()
+    if not 1 <= limit <= 1000:
+        raise ToolError("limit must be between 1 and 1000.")
+
+    params: dict = {"limit": limit}
+    if cursor:
+        params["cursor"] = cursor
+    if fields:
+        params["fields"] = ",".join(fields)
+    if email_prefix:
+        params["email_prefix"] = email_prefix
+    if dob_from:
+        params["dob_from"] = dob_from
+    if dob_to:
+        params["dob_to"] = dob_to
+
     try:
-        resp = await http.get("/customers")
-        resp.raise_for_status()
-        customers: list[dict] = resp.json()
+        page: dict = await _fetch_json("customer_list_all", "/customers", params=params, tags=[_LIST_TAG])
     except Exception as e:
-        return _api_error(e)
+        raise _api_error(e) from e
+
+    def markdown() -> str:
+        customers: list[dict] = page["items"]
+        if not customers:
+            return "### Customers\n_No customers found._"
+        body = "\n\n".join(_fmt_customer(c) for c in customers)
+        more = (f"\n\n_More customers available – call again with cursor='{page['next_cursor']}'._"
+                if page.get("next_cursor") else "")
+        return f"### Customers (this page: {len(customers)})\n\n{body}{more}"
 
-    if response_format == "json":
-        return json.dumps(customers, indent=2)
-    if not customers:
-        return "### All Customers\n_No customers found._"
-    body = "\n\n".join(_fmt_customer(c) for c in customers)
-    return f"### All Customers (total: {len(customers)})\n\n{body}"
+    return _tool_result(page, response_format, markdown)
 
 
 # ===========================================================================
 # Tool 3 – customer_get_products
 # ===========================================================================
 @mcp.tool()
-async def customer_get_products(customer_id: int, response_format: str = "markdown") -> str:
+@_traced
+async def customer_get_products(customer_id: int, response_format: str = "markdown") -> Annotated[CallToolResult, ProductsOut]:
     """Get all products purchased by a customer.
 
     IMPORTANT: This tool requires a numeric customer_id, NOT an email.
-    If you only have an email address, call customer_get_by_email first
-    to look up the customer and retrieve their numeric 'id' field, then
-    pass that id here.
+    If you only have an email address, call customer_get_profile instead –
+    it returns the customer and their products in one step.
 
     Args:
-        customer_id: Numeric customer ID (e.g. 42). Call customer_get_by_email first if you only have an email.
+        customer_id: Numeric customer ID (e.g. 42). Use customer_get_profile if you only have an email.
         response_format: 'markdown' (default, human-readable) or 'json'
     """
     if customer_id < 1:
-        return "Error: customer_id must be a positive integer (>= 1)."
+        raise ToolError("customer_id must be a positive integer (>= 1).")
 
-    http = await _get_http()
     try:
-        resp = await http.get(f"/customer/{customer_id}/products")
-        resp.raise_for_status()
-        products: list[dict] = resp.json()
+        products: list[dict] = await _fetch_json("customer_get_products", f"/customer/{customer_id}/products",
+                                                tags=[("customer", customer_id)])
     except Exception as e:
-        return _api_error(e)
+        raise _api_error(e) from e
+
+    def markdown() -> str:
+        if not products:
+            return f"### Products for Customer {customer_id}\n_No purchases recorded._"
+        body = "\n\n".join(_fmt_product(p) for p in products)
+        return f"### Products for Customer {customer_id} (total: {len(products)})\n\n{body}"
 
-    if response_format == "json":
-        return json.dumps(products, indent=2)
-    if not products:
-        return f"### Products for Customer {customer_id}\n_No purchases recorded._"
-    body = "\n\n".join(_fmt_product(p) for p in products)
-    return f"### Products for Customer {customer_id} (total: {len(products)})\n\n{body}"
+    return _tool_result({"products": products}, response_format, markdown)
+
+
+# ===========================================================================
+# Tool 4 – customer_get_by_emails
+# ===========================================================================
+@mcp.tool()
+@_traced
+async def customer_get_by_emails(emails: list[str], response_format: str = "markdown") -> Annotated[CallToolResult, CustomersByEmailOut]:
+    """Look up many customers by email address in a single call.
+
+    Prefer this over calling customer_get_by_email repeatedly. Results are
+    keyed by the email as given; unknown emails map to null.
+
+    Args:
+        emails: Customer email addresses (up to 500)
+        response_format: 'markdown' (default, human-readable) or 'json'
+    """
+    if not emails:
+        raise ToolError("emails must contain at least one address.")
+    if len(emails) > MAX_BATCH_SIZE:
+        raise ToolError(f"at most {MAX_BATCH_SIZE} emails per call.")
+
+    keys = {e: e.strip().lower() for e in emails}
+    unique = list(dict.fromkeys(keys.values()))
+    try:
+        data: dict = await _fetch_json("customer_get_by_emails", "/customers/batch",
+                                       body={"emails": unique}, tags=[("email", k) for k in unique])
+        found: dict = data["by_email"]
+    except Exception as e:
+        raise _api_error(e) from e
+
+    customers = {e: found.get(k) for e, k in keys.items()}
+    def markdown() -> str:
+        sections = [
+            f"#### {e}\n{_fmt_customer(c) if c else '_Not found._'}"
+            for e, c in customers.items()
+        ]
+        hits = sum(1 for c in customers.values() if c)
+        return f"### Customers ({hits} of {len(customers)} found)\n\n" + "\n\n".join(sections)
+
+    return _tool_result({"customers": customers}, response_format, markdown)
+
+
+# ===========================================================================
+# Tool 5 – customer_get_products_batch
+# ===========================================================================
+@mcp.tool()
+@_traced
+async def customer_get_products_batch(customer_ids: list[int], response_format: str = "markdown") -> Annotated[CallToolResult, ProductsByIdOut]:
+    """Get the purchased products of many customers in a single call.
+
+    Prefer this over calling customer_get_products repeatedly. Results are
+    keyed by customer id; unknown ids map to null, customers without
+    purchases map to an empty list.
+
+    Args:
+        customer_ids: Numeric customer IDs (up to 500)
+        response_format: 'markdown' (default, human-readable) or 'json'
+    """
+    if not customer_ids:
+        raise ToolError("customer_ids must contain at least one id.")
+    if len(customer_ids) > MAX_BATCH_SIZE:
+        raise ToolError(f"at most {MAX_BATCH_SIZE} customer_ids per call.")
+    if any(i < 1 for i in customer_ids):
+        raise ToolError("every customer_id must be a positive integer (>= 1).")
+
+    ids = list(dict.fromkeys(customer_ids))
+    try:
+        data: dict = await _fetch_json("customer_get_products_batch", "/customers/batch",
+                                       body={"ids": ids, "include_products": True},
+                                       tags=[("customer", i) for i in ids])
+    except Exception as e:
+        raise _api_error(e) from e
+
+    products = data.get("products") or {}
+    # JSON object keys are strings, so ids are keyed as str – the same as the API
+    results = {str(i): products.get(str(i)) if data["by_id"].get(str(i)) else None for i in ids}
+
+    def markdown() -> str:
+        sections = []
+        for customer_id, items in results.items():
+            if items is None:
+                body = "_Customer not found._"
+            elif not items:
+                body = "_No purchases recorded._"
+            else:
+                body = "\n\n".join(_fmt_product(p) for p in items)
+            sections.append(f"#### Customer {customer_id}\n{body}")
+        return f"### Products for {len(results)} Customers\n\n" + "\n\n".join(sections)
+
+    return _tool_result({"products": results}, response_format, markdown)
+
+
+# ===========================================================================
+# Tool 6 – customer_get_profile
+# ===========================================================================
+@mcp.tool()
+@_traced
+async def customer_get_profile(email: str, response_format: str = "markdown") -> Annotated[CallToolResult, CustomerProfileOut]:
+    """Get a customer AND all of their purchased products by email, in one step.
+
+    Use this whenever you need both the customer details and their products;
+    there is no need to call customer_get_by_email and then
+    customer_get_products.
+
+    Args:
+        email: Customer email address (e.g. jane@example.com)
+        response_format: 'markdown' (default, human-readable) or 'json'
+    """
+    email = email.strip().lower()
+    try:
+        # The API resolves the email and loads the products server-side
+        profile: dict = await _fetch_json("customer_get_profile", "/customer/profile",
+                                          params={"email": email}, tags=[("email", email)])
+    except Exception as e:
+        raise _api_error(e) from e
+
+    def markdown() -> str:
+        customer, products = profile["customer"], profile["products"]
+        body = ("\n\n".join(_fmt_product(p) for p in products)
+                if products else "_No purchases recorded._")
+        return (f"### Customer\n{_fmt_customer(customer)}\n\n"
+                f"### Products (total: {len(products)})\n\n{body}")
+
+    return _tool_result(profile, response_format, markdown)
+
+
+# ===========================================================================
+# Tool 7 – customer_find_products
+# ===========================================================================
+@mcp.tool()
+@_traced
+async def customer_find_products(
+    has_warranty: Optional[bool] = None,
+    warranty_from: Optional[str] = None,
+    warranty_to: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    customer_id: Optional[int] = None,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    response_format: str = "markdown",
+) -> Annotated[CallToolResult, ProductPageOut]:
+    """Find products across all customers by warranty and purchase date.
+
+    The filtering runs on the server – e.g. warranty_from='2025-06-01' and
+    warranty_to='2025-06-30' list every warranty expiring in June 2025.
+    Each product comes with its customer_id and discount (list - buy price).
+    If more exist, the result includes a next_cursor; pass it back as
+    `cursor` with the same filters. For counts and totals use customer_product_summary instead.
+
+    Args:
+        has_warranty: Only products with (true) or without (false) a warranty
+        warranty_from: Only warranties expiring on or after this date (YYYY-MM-DD)
+        warranty_to: Only warranties expiring on or before this date (YYYY-MM-DD)
+        date_from: Only products bought on or after this date (YYYY-MM-DD)
+        date_to: Only products bought on or before this date (YYYY-MM-DD)
+        customer_id: Only this customer's products
+        limit: Page size, 1-1000 (default 50)
+        cursor: next_cursor from the previous page; omit for the first page
+        response_format: 'markdown' (default, human-readable) or 'json'
+    """
+    if not 1 <= limit <= 1000:
+        raise ToolError("limit must be between 1 and 1000.")
+
+    params, tags = _product_query(customer_id, has_warranty=has_warranty, warranty_from=warranty_from,
+                                  warranty_to=warranty_to, date_from=date_from, date_to=date_to,
+                                  limit=limit, cursor=cursor or None)
+    try:
+        page: dict = await _fetch_json("customer_find_products", "/products", params=params, tags=tags)
+    except Exception as e:
+        raise _api_error(e) from e
+
+    def markdown() -> str:
+        items: list[dict] = page["items"]
+        if not items:
+            return "### Products\n_No matching products._"
+        body = "\n\n".join(
+            f"{_fmt_product(p)}\n  **Customer ID:** {p['customer_id']}  |  **Discount:** ${p['discount']:.2f}"
+            for p in items
+        )
+        more = (f"\n\n_More products available – call again with cursor='{page['next_cursor']}'._"
+                if page.get("next_cursor") else "")
+        return f"### Products (this page: {len(items)})\n\n{body}{more}"
+
+    return _tool_result(page, response_format, markdown)
+
+
+# ===========================================================================
+# Tool 8 – customer_product_summary
+# ===========================================================================
+@mcp.tool()
+@_traced
+async def customer_product_summary(
+    by_customer: bool = False,
+    order_by: str = "spend",
+    limit: int = 10,
+    has_warranty: Optional[bool] = None,
+    warranty_from: Optional[str] = None,
+    warranty_to: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    customer_id: Optional[int] = None,
+    response_format: str = "markdown",
+) -> Annotated[CallToolResult, ProductSummaryOut]:
+    """Count and total products on the server: spend, list total and discount.
+
+    Use this for questions like "total spend per customer", "who saved the
+    most" or "how many warranties expire this month" instead of fetching
+    every product. Takes the same filters as customer_find_products.
+
+    Args:
+        by_customer: Also return the top customers (default false: totals only)
+        order_by: Rank customers by 'spend' (sum of buy price, default),
+            'discount' (sum of list - buy price) or 'count'
+        limit: Number of top customers, 1-1000 (default 10)
+        has_warranty: Only products with (true) or without (false) a warranty
+        warranty_from: Only warranties expiring on or after this date (YYYY-MM-DD)
+        warranty_to: Only warranties expiring on or before this date (YYYY-MM-DD)
+        date_from: Only products bought on or after this date (YYYY-MM-DD)
+        date_to: Only products bought on or before this date (YYYY-MM-DD)
+        customer_id: Only this customer's products
+        response_format: 'markdown' (default, human-readable) or 'json'
+    """
+    if order_by not in ("spend", "discount", "count"):
+        raise ToolError("order_by must be 'spend', 'discount' or 'count'.")
+    if not 1 <= limit <= 1000:
+        raise ToolError("limit must be between 1 and 1000.")
+
+    params, tags = _product_query(customer_id, has_warranty=has_warranty, warranty_from=warranty_from,
+                                  warranty_to=warranty_to, date_from=date_from, date_to=date_to)
+    if by_customer:
+        params.update(by_customer=True, order_by=order_by, limit=limit)
+    try:
+        summary: dict = await _fetch_json("customer_product_summary", "/products/summary",
+                                          params=params, tags=tags)
+    except Exception as e:
+        raise _api_error(e) from e
+
+    def markdown() -> str:
+        text = f"### Product Summary\n- {_fmt_totals(summary['totals'])}"
+        groups = summary.get("by_customer")
+        if groups is None:
+            return text
+        if not groups:
+            return f"{text}\n\n#### Top Customers by {order_by}\n_No matching products._"
+        rows = "\n".join(f"{n}. **Customer {g['customer_id']}** – {_fmt_totals(g)}"
+                         for n, g in enumerate(groups, 1))
+        return f"{text}\n\n#### Top Customers by {order_by}\n{rows}"
+
+    return _tool_result(summary, response_format, markdown)
+
+
+# ===========================================================================
+# Admin routes – cache and latency metrics, cache invalidation
+# ===========================================================================
+@mcp.custom_route("/cache/stats", methods=["GET"])
+async def cache_stats(request: Request) -> JSONResponse:
+    return JSONResponse({**_cache.stats(), "validators": len(_validators), "not_modified": _not_modified})
+
+
+@mcp.custom_route("/stats/http-pool", methods=["GET"])
+async def http_pool_stats(request: Request) -> JSONResponse:
+    return JSONResponse(_pool_stats())
+
+
+@mcp.custom_route("/stats/upstream", methods=["GET"])
+async def upstream_stats(request: Request) -> JSONResponse:
+    return JSONResponse(_upstream.stats())
+
+
+@mcp.custom_route("/stats/change-feed", methods=["GET"])
+async def change_feed_stats(request: Request) -> JSONResponse:
+    return JSONResponse(_feed)
+
+
+@mcp.custom_route("/stats/admission", methods=["GET"])
+async def admission_stats(request: Request) -> JSONResponse:
+    return JSONResponse(_admission.stats() if _admission is not None else {"enabled": False})
+
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics(request: Request) -> Response:
+    """Per-hop latency histograms (tool, upstream) in the Prometheus text format."""
+    return Response(telemetry.render_metrics(), media_type=telemetry.CONTENT_TYPE)
+
+
+@mcp.custom_route("/traces", methods=["GET"])
+async def traces(request: Request) -> JSONResponse:
+    """Recently sampled spans, newest first: ?trace_id=<id> for one trace."""
+    try:
+        limit = min(max(int(request.query_params.get("limit", 200)), 1), 2000)
+    except ValueError:
+        return JSONResponse({"error": "limit must be an integer"}, status_code=400)
+    return JSONResponse({"spans": telemetry.recent_spans(request.query_params.get("trace_id"), limit)})
+
+
+@mcp.custom_route("/cache/invalidate", methods=["POST"])
+async def cache_invalidate(request: Request) -> JSONResponse:
+    """Drop cached responses: ?tool=<name> for one tool, no parameter for all."""
+    tool = request.query_params.get("tool")
+    if tool is not None and tool not in CACHE_TTLS:
+        return JSONResponse({"error": f"Unknown tool '{tool}'"}, status_code=400)
+    removed = _cache.invalidate(tool)
+    logger.info("Cache invalidated (tool=%s): %d entries", tool or "*", removed)
+    return JSONResponse({"invalidated": removed})
+
+
+# ===========================================================================
+# ASGI app
+# ===========================================================================
+def create_app():
+    """Streamable-HTTP app whose lifespan also owns the upstream HTTP client
+    and the change-feed follower.
+
+    FastMCP's own `lifespan=` hook runs once per MCP session on this
+    transport, so the process-wide pool is bound to the ASGI app instead.
+    """
+    app = mcp.streamable_http_app()
+    session_manager_lifespan = app.router.lifespan_context
+
+    @asynccontextmanager
+    async def lifespan(app_):
+        async with session_manager_lifespan(app_):
+            await _get_http()
+            follower = asyncio.create_task(_follow_changes()) if _feed["enabled"] else None
+            try:
+                yield
+            finally:
+                if follower is not None:
+                    follower.cancel()
+                    with suppress(asyncio.CancelledError):
+                        await follower
+                await _close_http()
+                logger.info("Upstream HTTP client closed")
+
+    app.router.lifespan_context = lifespan
+    return app
 
 
 # ===========================================================================
 # Entry point
 # ===========================================================================
 if __name__ == "__main__":
-    logger.info("Starting customer_mcp on port %d → Customer API at %s", MCP_PORT, CUSTOMER_API_URL)
-    mcp.run(transport="streamable-http")
\ No newline at end of file
+    import uvicorn
+
+    logger.info("Starting customer_mcp on %s:%d (%d worker(s), %s) → Customer API at %s",
+                MCP_HOST, MCP_PORT, MCP_WORKERS, "stateless" if MCP_STATELESS else "sessions",
+                CUSTOMER_API_URL)
+    if MCP_WORKERS > 1:
+        if not MCP_STATELESS:
+            logger.warning("MCP_WORKERS=%d with MCP_STATELESS=0 – a session only works if every "
+                           "request carrying its Mcp-Session-Id reaches the same worker", MCP_WORKERS)
+        # Every worker imports this module and calls create_app itself, so each
+        # one owns its response cache, upstream pool and circuit breaker
+        uvicorn.run("mcp_server_http:create_app", factory=True, host=MCP_HOST, port=MCP_PORT,
+                    workers=MCP_WORKERS, log_level=mcp.settings.log_level.lower())
+    else:
+        uvicorn.run(create_app(), host=MCP_HOST, port=MCP_PORT,
+                    log_level=mcp.settings.log_level.lower())
\ No newline at end of file
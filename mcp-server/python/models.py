@@ -0,0 +1,44 @@
+from pydantic import BaseModel, EmailStr
+from datetime import date
+from typing import Optional
+
+
+class Customer(BaseModel):
+    id: int
+    email: EmailStr
+    name: str
+    dob: date
+
+
+class Product(BaseModel):
+    code: str
+    name: str
+    list_price: float
+    buy_price: float
+    date: date
+    has_warranty: bool
+    warranty_date: Optional[date] = None
+
+
+class CustomerProduct(Product):
+    customer_id: int
+    discount: float                 # list_price - buy_price
+
+
+class ProductTotals(BaseModel):
+    customer_id: Optional[int] = None   # None for the totals over every customer
+    count: int
+    with_warranty: int
+    list_total: float
+    spend: float                    # sum of buy_price
+    discount: float                 # list_total - spend
+
+
+class Change(BaseModel):
+    seq: int                        # monotonic, never reused
+    at: float                       # unix time of the write
+    op: str                         # create | update | delete
+    entity: str                     # customer | products | product
+    customer_id: int
+    emails: list[str]               # normalized email(s) of the customer – old and new on a change of email
+    code: Optional[str] = None      # product code of a single-product change
@@ -0,0 +1,261 @@
+"""
+Orchestration cache – whole fetch_user_and_products results, reused.
+
+The same query for the same email tends to arrive many times within minutes,
+and each run repeats every LLM round and tool call. OrchestrationCache keeps
+the finished record (assistant_answer / user_record / products) keyed on
+
+    (normalized query, tool catalog version, deployment, variant)
+
+so a new tool catalog or a different model deployment never serves an old
+answer. `variant` separates the LLM loop from the planner fast path.
+
+* Bounded: at most `max_entries` records in memory, least-recently-used
+  evicted first.
+* TTL: entries expire `ttl` seconds after they were stored (wall clock, so
+  the on-disk copies age across restarts too).
+* Optional on-disk backend: with `path` set, records are also written to a
+  small SQLite file and read back on a memory miss, so a restarted process
+  starts warm.  Disk reads and writes run in a worker thread, never on the
+  event loop.
+* Tags: a record may carry tags naming the data it was built from, e.g.
+  ("customer", 42), so a change to that data drops exactly the records it
+  made stale with invalidate_tags().  A record finished after such an
+  invalidation began is not stored (see `generation`).
+
+Records are stored as JSON text; every hit decodes a fresh copy, so callers
+can modify what they get back.
+"""
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, Optional
+
+import fast_json
+
+_SQL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS orchestration_cache (
+    key        TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL,
+    record     TEXT NOT NULL
+)
+"""
+_SQL_TAGS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS orchestration_cache_tags (
+    tag TEXT NOT NULL,
+    key TEXT NOT NULL,
+    PRIMARY KEY (tag, key)
+) WITHOUT ROWID
+"""
+_SQL_GET = "SELECT expires_at, record FROM orchestration_cache WHERE key = ?"
+_SQL_PUT = "INSERT OR REPLACE INTO orchestration_cache (key, expires_at, record) VALUES (?, ?, ?)"
+_SQL_PUT_TAG = "INSERT OR IGNORE INTO orchestration_cache_tags (tag, key) VALUES (?, ?)"
+_SQL_DELETE = "DELETE FROM orchestration_cache WHERE key = ?"
+_SQL_DELETE_TAGS = "DELETE FROM orchestration_cache_tags WHERE key = ?"
+_SQL_TAGGED = "SELECT key FROM orchestration_cache_tags WHERE tag = ?"
+_SQL_TAGS_OF = "SELECT tag FROM orchestration_cache_tags WHERE key = ?"
+_SQL_PURGE = """
+DELETE FROM orchestration_cache
+WHERE expires_at <= ?
+   OR key NOT IN (SELECT key FROM orchestration_cache ORDER BY expires_at DESC LIMIT ?)
+"""
+_SQL_PURGE_TAGS = "DELETE FROM orchestration_cache_tags WHERE key NOT IN (SELECT key FROM orchestration_cache)"
+
+_PURGE_EVERY = 64                       # disk writes between purges of expired/excess rows
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form of a query."""
+    return " ".join(query.split()).lower()
+
+
+class OrchestrationCache:
+
+    def __init__(self, ttl: float = 300.0, max_entries: int = 1024, path: Optional[str] = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path or None
+        self._entries: "OrderedDict[str, tuple[float, str, tuple]]" = OrderedDict()
+        self._tagged: dict[Hashable, set[str]] = {}     # tag -> keys of the records carrying it
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()                # one worker thread on the connection at a time
+        self._writes = 0
+        self.generation = 0                             # bumped by every invalidation
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        if self.path:
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(_SQL_SCHEMA)
+            self._db.execute(_SQL_TAGS_SCHEMA)
+
+    @staticmethod
+    def key(query: str, catalog_version: str, deployment: str, variant: str = "llm") -> str:
+        raw = json.dumps([normalize_query(query), catalog_version, deployment, variant])
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    # -----------------------------------------------------------------------
+    # Lookup
+    # -----------------------------------------------------------------------
+    async def get(self, key: str) -> Optional[Dict]:
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= now:
+            self._forget(key)
+            entry = None
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return fast_json.loads(entry[1])
+
+        if self._db is not None:
+            generation = self.generation
+            row = await asyncio.to_thread(self._disk_get, key)
+            # Skip a row read while an invalidation was running
+            if row is not None and row[0] > now and generation == self.generation:
+                self._remember(key, row[0], row[1], row[2])
+                self.disk_hits += 1
+                return fast_json.loads(row[1])
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, record: Dict, ttl: Optional[float] = None,
+                  tags: Iterable[Hashable] = (), generation: Optional[int] = None) -> None:
+        """Store `record`; with `generation` (read before the record was built),
+        only if nothing was invalidated since."""
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or (generation is not None and generation != self.generation):
+            return
+        expires_at = time.time() + ttl
+        text = fast_json.dumps_str(record)
+        tags = tuple(tags)
+        self._remember(key, expires_at, text, tags)
+        if self._db is not None:
+            await asyncio.to_thread(self._disk_put, key, expires_at, text, tags)
+
+    def _remember(self, key: str, expires_at: float, text: str, tags: tuple) -> None:
+        if key in self._entries:
+            self._forget(key)
+        self._entries[key] = (expires_at, text, tags)
+        for tag in tags:
+            self._tagged.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._forget(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _forget(self, key: str) -> None:
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+
+    # -----------------------------------------------------------------------
+    # Invalidation
+    # -----------------------------------------------------------------------
+    async def invalidate(self, key: Optional[str] = None) -> int:
+        """Drop one record, or everything when no key is given; returns how
+        many in-memory records were removed."""
+        self.generation += 1
+        keys = list(self._entries) if key is None else [key] if key in self._entries else []
+        for k in keys:
+            self._forget(k)
+        self.invalidations += len(keys)
+        if self._db is not None:
+            await asyncio.to_thread(self._disk_delete, key)
+        return len(keys)
+
+    async def invalidate_tags(self, tags: Iterable[Hashable]) -> int:
+        """Drop every record carrying any of `tags`; returns how many were removed."""
+        self.generation += 1
+        tags = set(tags)
+        doomed = {k for tag in tags for k in self._tagged.get(tag, ())}
+        for k in doomed:
+            self._forget(k)
+        if self._db is not None:
+            doomed |= await asyncio.to_thread(self._disk_delete_tags, tags)
+        self.invalidations += len(doomed)
+        return len(doomed)
+
+    def close(self) -> None:
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+                self._db = None
+
+    # -----------------------------------------------------------------------
+    # SQLite tier – called through asyncio.to_thread
+    # -----------------------------------------------------------------------
+    @staticmethod
+    def _tag_text(tag: Hashable) -> str:
+        return json.dumps(tag)
+
+    @staticmethod
+    def _tag_value(text: str) -> Hashable:
+        tag = json.loads(text)
+        return tuple(tag) if isinstance(tag, list) else tag     # JSON has no tuples
+
+    def _disk_get(self, key: str) -> Optional[tuple]:
+        with self._db_lock:
+            row = self._db.execute(_SQL_GET, (key,)).fetchone()
+            if row is None:
+                return None
+            tags = tuple(self._tag_value(t) for (t,) in self._db.execute(_SQL_TAGS_OF, (key,)))
+        return row[0], row[1], tags
+
+    def _disk_put(self, key: str, expires_at: float, text: str, tags: tuple) -> None:
+        with self._db_lock:
+            self._db.execute("BEGIN")
+            self._db.execute(_SQL_DELETE_TAGS, (key,))
+            self._db.execute(_SQL_PUT, (key, expires_at, text))
+            self._db.executemany(_SQL_PUT_TAG, [(self._tag_text(t), key) for t in tags])
+            self._db.execute("COMMIT")
+            self._writes += 1
+            if self._writes % _PURGE_EVERY == 0:
+                self._db.execute(_SQL_PURGE, (time.time(), self.max_entries))
+                self._db.execute(_SQL_PURGE_TAGS)
+
+    def _disk_delete(self, key: Optional[str]) -> None:
+        with self._db_lock:
+            if key is None:
+                self._db.execute("DELETE FROM orchestration_cache")
+                self._db.execute("DELETE FROM orchestration_cache_tags")
+            else:
+                self._db.execute(_SQL_DELETE, (key,))
+                self._db.execute(_SQL_DELETE_TAGS, (key,))
+
+    def _disk_delete_tags(self, tags: set) -> set:
+        with self._db_lock:
+            keys = {k for tag in tags for (k,) in self._db.execute(_SQL_TAGGED, (self._tag_text(tag),))}
+            for k in keys:
+                self._db.execute(_SQL_DELETE, (k,))
+                self._db.execute(_SQL_DELETE_TAGS, (k,))
+        return keys
+
+    # -----------------------------------------------------------------------
+    # Metrics
+    # -----------------------------------------------------------------------
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "disk": self.path,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_ratio": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+        }
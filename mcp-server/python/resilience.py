@@ -0,0 +1,187 @@
+"""
+Resilience – retries, circuit breaker and hedging for Customer API calls.
+
+Used by mcp_server_http.py so transient upstream failures are absorbed at
+the tool layer instead of being handed to the LLM as an error string:
+
+    resp = await upstream.request(lambda: http.get("/customer", params=...))
+
+* Retries: idempotent requests are retried on connection errors, timeouts
+  and 429/502/503/504 with full-jitter exponential backoff; a Retry-After
+  header from the API is honoured (up to `max_retry_after`).
+* Circuit breaker: after `failure_threshold` consecutive failures the
+  breaker opens and calls fail fast with CircuitOpenError until
+  `reset_timeout` has passed; then one probe request decides whether it
+  closes again.
+* Hedging (optional): if a request has not answered after `hedge_after`
+  seconds a second copy is sent and whichever finishes first wins.
+"""
+
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Optional
+
+import httpx
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling upstream while the breaker is open."""
+
+    def __init__(self, retry_in: float):
+        super().__init__(f"circuit open, retry in {retry_in:.1f}s")
+        self.retry_in = retry_in
+
+
+@dataclass
+class RetryPolicy:
+    max_attempts: int = 3
+    base_delay: float = 0.1                  # seconds
+    max_delay: float = 2.0                   # cap for computed backoff
+    max_retry_after: float = 5.0             # longest Retry-After we will wait out
+    retry_statuses: frozenset = field(default_factory=lambda: frozenset({429, 502, 503, 504}))
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given (1-based) attempt."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+
+def retry_after_seconds(resp: httpx.Response) -> Optional[float]:
+    """Parse Retry-After as delta-seconds or an HTTP date; None if absent/invalid."""
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"                # closed | open | half_open
+        self.failures = 0
+        self.opened_at = 0.0
+        self.short_circuits = 0
+        self._probing = False
+
+    def before_call(self) -> None:
+        if self.state == "open":
+            remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+            if remaining > 0:
+                self.short_circuits += 1
+                raise CircuitOpenError(remaining)
+            self.state = "half_open"
+        if self.state == "half_open":
+            # Only one probe at a time; everyone else keeps failing fast
+            if self._probing:
+                self.short_circuits += 1
+                raise CircuitOpenError(self.reset_timeout)
+            self._probing = True
+
+    def record_success(self) -> None:
+        self.state, self.failures, self._probing = "closed", 0, False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state, self.opened_at = "open", time.monotonic()
+        self._probing = False
+
+    def release_probe(self) -> None:
+        """Probe ended without a verdict (e.g. cancelled)."""
+        self._probing = False
+
+
+class ResilientUpstream:
+
+    def __init__(self, retry: RetryPolicy, breaker: CircuitBreaker,
+                 hedge_after: Optional[float] = None):
+        self.retry = retry
+        self.breaker = breaker
+        self.hedge_after = hedge_after
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    async def request(self, send: Callable[[], Awaitable[httpx.Response]],
+                      idempotent: bool = True) -> httpx.Response:
+        """Run `send` with retries (idempotent only), breaker and hedging.
+
+        Returns the last response – the caller still decides what a 4xx/5xx
+        means – or raises the last transport error / CircuitOpenError.
+        """
+        attempts = self.retry.max_attempts if idempotent else 1
+        for attempt in range(1, attempts + 1):
+            self.breaker.before_call()
+            try:
+                if idempotent and self.hedge_after and self.breaker.state == "closed":
+                    resp = await self._hedged(send)
+                else:
+                    resp = await send()
+            except httpx.TransportError:
+                self.breaker.record_failure()
+                if attempt == attempts:
+                    raise
+                delay = self.retry.backoff(attempt)
+            except BaseException:
+                self.breaker.release_probe()
+                raise
+            else:
+                if resp.status_code >= 500:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                if resp.status_code not in self.retry.retry_statuses or attempt == attempts:
+                    return resp
+                delay = retry_after_seconds(resp)
+                if delay is None:
+                    delay = self.retry.backoff(attempt)
+                elif delay > self.retry.max_retry_after:
+                    return resp              # upstream wants a longer pause than we can hold the tool
+            self.retries += 1
+            await asyncio.sleep(delay)
+        raise AssertionError("unreachable")
+
+    async def _hedged(self, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        primary = asyncio.ensure_future(send())
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_after)
+        if done:
+            return primary.result()
+
+        self.hedges += 1
+        hedge = asyncio.ensure_future(send())
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "breaker_state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "short_circuits": self.breaker.short_circuits,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+        }
@@ -0,0 +1,194 @@
+"""
+Response cache – TTL + LRU cache for upstream Customer API responses.
+
+Used by mcp_server_http.py in front of every upstream read:
+
+    value = await cache.get_or_fetch("customer_get_by_email", key, fetch, ttl=60)
+
+* Bounded: at most `max_entries` values, least-recently-used evicted first.
+* Per-entry TTL: each tool passes its own ttl; expired entries are dropped
+  on access.
+* Request coalescing: concurrent misses for the same key share one in-flight
+  fetch instead of each going upstream.
+* Errors are never cached – every waiter of a failed fetch sees the error and
+  the next call retries.
+* Tags: an entry may carry tags naming the data it was built from, e.g.
+  ("customer", 42) or ("email", "a@b.com"), so a change to that data can
+  drop exactly the entries it made stale with invalidate_tags().
+
+All bookkeeping happens between awaits on the event loop thread, so no lock
+is needed for the dictionaries themselves.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Iterable, Optional
+
+CacheKey = tuple[str, Hashable]        # (tool, request key)
+
+
+class ResponseCache:
+
+    def __init__(self, max_entries: int = 1024, default_ttl: float = 30.0):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries: "OrderedDict[CacheKey, tuple[float, Any, tuple]]" = OrderedDict()
+        self._inflight: dict[CacheKey, asyncio.Future] = {}
+        self._inflight_tags: dict[CacheKey, tuple] = {}
+        self._tagged: dict[Hashable, set[CacheKey]] = {}     # tag -> keys of the entries carrying it
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    # -----------------------------------------------------------------------
+    # Lookup
+    # -----------------------------------------------------------------------
+    def get(self, tool: str, key: Hashable) -> tuple[bool, Any]:
+        """Return (found, value) without fetching."""
+        ck = (tool, key)
+        entry = self._entries.get(ck)
+        if entry is None:
+            return False, None
+        expires_at, value, _ = entry
+        if expires_at <= time.monotonic():
+            self._drop(ck)
+            self.expirations += 1
+            return False, None
+        self._entries.move_to_end(ck)
+        return True, value
+
+    async def get_or_fetch(self, tool: str, key: Hashable,
+                           fetch: Callable[[], Awaitable[Any]],
+                           ttl: Optional[float] = None, tags: Iterable[Hashable] = ()) -> Any:
+        found, value = self.get(tool, key)
+        if found:
+            self.hits += 1
+            return value
+
+        ck = (tool, key)
+        pending = self._inflight.get(ck)
+        if pending is not None:
+            # Someone is already fetching this key – wait for their result
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling():
+                    raise
+                # The fetching task was cancelled, not us – fetch ourselves
+                return await self.get_or_fetch(tool, key, fetch, ttl, tags)
+
+        self.misses += 1
+        tags = tuple(tags)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[ck] = future
+        if tags:
+            self._inflight_tags[ck] = tags
+        try:
+            value = await fetch()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()              # mark retrieved when nobody waits
+            raise
+        else:
+            # Skip the store if the key was invalidated while we were fetching
+            if self._inflight.get(ck) is future:
+                self.put(tool, key, value, ttl, tags)
+            future.set_result(value)
+            return value
+        finally:
+            if self._inflight.get(ck) is future:
+                del self._inflight[ck]
+                self._inflight_tags.pop(ck, None)
+
+    def put(self, tool: str, key: Hashable, value: Any, ttl: Optional[float] = None,
+            tags: Iterable[Hashable] = ()) -> None:
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        ck = (tool, key)
+        if ck in self._entries:
+            self._drop(ck)
+        tags = tuple(tags)
+        self._entries[ck] = (time.monotonic() + ttl, value, tags)
+        for tag in tags:
+            self._tagged.setdefault(tag, set()).add(ck)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _drop(self, ck: CacheKey) -> None:
+        _, _, tags = self._entries.pop(ck)
+        for tag in tags:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(ck)
+                if not keys:
+                    del self._tagged[tag]
+
+    # -----------------------------------------------------------------------
+    # Invalidation
+    # -----------------------------------------------------------------------
+    def invalidate(self, tool: Optional[str] = None, key: Optional[Hashable] = None) -> int:
+        """Drop cached entries; returns how many were removed.
+
+        invalidate()                 – everything
+        invalidate(tool)             – every entry of one tool
+        invalidate(tool, key)        – a single entry
+
+        In-flight fetches for the same keys are detached so their (possibly
+        stale) results are not stored.
+        """
+        def matches(ck: CacheKey) -> bool:
+            return tool is None or (ck[0] == tool and (key is None or ck[1] == key))
+
+        doomed = [ck for ck in self._entries if matches(ck)]
+        for ck in doomed:
+            self._drop(ck)
+        for ck in [ck for ck in self._inflight if matches(ck)]:
+            del self._inflight[ck]
+            self._inflight_tags.pop(ck, None)
+        self.invalidations += len(doomed)
+        return len(doomed)
+
+    def invalidate_tags(self, tags: Iterable[Hashable]) -> int:
+        """Drop every entry carrying any of `tags`; returns how many were removed.
+
+        In-flight fetches tagged the same way are detached too, so a read
+        that started before the change cannot store its stale result.
+        """
+        tags = set(tags)
+        doomed = {ck for tag in tags for ck in self._tagged.get(tag, ())}
+        for ck in doomed:
+            self._drop(ck)
+        for ck in [ck for ck, t in self._inflight_tags.items() if not tags.isdisjoint(t)]:
+            del self._inflight[ck]
+            del self._inflight_tags[ck]
+        self.invalidations += len(doomed)
+        return len(doomed)
+
+    # -----------------------------------------------------------------------
+    # Metrics
+    # -----------------------------------------------------------------------
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "tags": len(self._tagged),
+            "max_entries": self.max_entries,
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "hit_ratio": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+        }
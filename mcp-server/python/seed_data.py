@@ -0,0 +1,120 @@
+"""
+Sample customers and purchases used to seed an empty store.
+"""
+
+from datetime import date
+
+from models import Customer, Product
+
+# Mock database with sample customers
+customers_db = [
+    Customer(
+        id=1,
+        email="john.doe@example.com",
+        name="John Doe",
+        dob=date(1990, 5, 15)
+    ),
+    Customer(
+        id=2,
+        email="jane.smith@example.com",
+        name="Jane Smith",
+        dob=date(1985, 8, 22)
+    ),
+    Customer(
+        id=3,
+        email="bob.wilson@example.com",
+        name="Bob Wilson",
+        dob=date(1992, 3, 10)
+    ),
+]
+
+# Mock database of products purchased by customers
+customer_products_db = {
+    1: [  # John Doe's purchases
+        Product(
+            code="LAP001",
+            name="Dell XPS 15 Laptop",
+            list_price=1899.99,
+            buy_price=1699.99,
+            date=date(2024, 1, 15),
+            has_warranty=True,
+            warranty_date=date(2027, 1, 15)
+        ),
+        Product(
+            code="MOU002",
+            name="Logitech MX Master 3",
+            list_price=99.99,
+            buy_price=89.99,
+            date=date(2024, 2, 20),
+            has_warranty=True,
+            warranty_date=date(2025, 2, 20)
+        ),
+        Product(
+            code="USB003",
+            name="USB-C Hub Adapter",
+            list_price=49.99,
+            buy_price=39.99,
+            date=date(2024, 3, 10),
+            has_warranty=False,
+            warranty_date=None
+        ),
+    ],
+    2: [  # Jane Smith's purchases
+        Product(
+            code="PHO001",
+            name="iPhone 15 Pro",
+            list_price=1199.99,
+            buy_price=1099.99,
+            date=date(2024, 6, 5),
+            has_warranty=True,
+            warranty_date=date(2026, 6, 5)
+        ),
+        Product(
+            code="CAB002",
+            name="USB-C to Lightning Cable",
+            list_price=29.99,
+            buy_price=24.99,
+            date=date(2024, 6, 5),
+            has_warranty=False,
+            warranty_date=None
+        ),
+    ],
+    3: [  # Bob Wilson's purchases
+        Product(
+            code="TAB001",
+            name="iPad Air",
+            list_price=599.99,
+            buy_price=549.99,
+            date=date(2023, 11, 20),
+            has_warranty=True,
+            warranty_date=date(2024, 11, 20)
+        ),
+        Product(
+            code="PEN001",
+            name="Apple Pencil 2nd Gen",
+            list_price=129.99,
+            buy_price=119.99,
+            date=date(2023, 11, 20),
+            has_warranty=True,
+            warranty_date=date(2024, 11, 20)
+        ),
+        Product(
+            code="KEY001",
+            name="Magic Keyboard",
+            list_price=299.99,
+            buy_price=279.99,
+            date=date(2023, 12, 5),
+            has_warranty=True,
+            warranty_date=date(2024, 12, 5)
+        ),
+        Product(
+            code="BAG001",
+            name="Laptop Backpack",
+            list_price=79.99,
+            buy_price=59.99,
+            date=date(2024, 1, 10),
+            has_warranty=False,
+            warranty_date=None
+        ),
+    ],
+}
@@ -0,0 +1,361 @@
+"""
+Telemetry – per-hop spans, latency histograms and trace propagation.
+
+Everything is in-process; there is no collector or agent to run. Each hop of
+an orchestration runs inside a span:
+
+    llm           one chat completion (mcp_orchestrator._complete)
+    orchestration a whole fetch/plan run, cache hits included
+    client        MCPClient.setup / call_tool, i.e. the MCP transport round trip
+    tool          the body of an @mcp.tool function on the server
+    upstream      one Customer API request from the MCP server (retries included)
+    api           one api.py request, until the last body byte is sent
+
+Every span is timed into the `hop_duration_seconds` histogram (labels hop,
+target, status), which /metrics serves in the Prometheus text format. A
+share of traces (TRACE_SAMPLE_RATE) is also kept as span records in a ring
+buffer (/traces) and, when TRACE_EXPORT_PATH is set, appended to a JSON-lines
+file.
+
+Trace context follows the W3C traceparent format. It is sent as an HTTP
+header to the API and in the `_meta` of MCP tool calls, so one trace id ties
+the LLM, MCP and API hops of a request together:
+
+    with telemetry.span("upstream", "customer_get_profile"):
+        resp = await http.get(path, headers=telemetry.inject({}))
+
+A span costs a few microseconds; set TELEMETRY_ENABLED=0 to skip it all.
+Metrics are per process, so scrape each worker separately.
+"""
+
+import bisect
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Optional
+
+TELEMETRY_ENABLED = os.getenv("TELEMETRY_ENABLED", "1") == "1"
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))   # share of new traces whose spans are kept
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "2048"))     # spans kept in memory for /traces
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH")                  # JSON-lines file; unset = memory only
+
+# Seconds – sub-millisecond cache hits up to slow LLM turns
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ===========================================================================
+# Histograms
+# ===========================================================================
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Histogram:
+    """Prometheus-style histogram, one series per label tuple (thread-safe)."""
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...],
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[tuple[str, ...], list] = {}      # labels -> [count per bucket..., +Inf, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)     # le is inclusive
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for labels, series in sorted(snapshot.items()):
+            base = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {cumulative}')
+            cumulative += series[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-1]}")
+            lines.append(f"{self.name}_count{{{base}}} {cumulative}")
+        return lines
+
+
+_metrics: dict[str, Histogram] = {}
+
+
+def histogram(name: str, help: str, labelnames: tuple[str, ...],
+              buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    """Return the process-wide histogram `name`, creating it on first use."""
+    metric = _metrics.get(name)
+    if metric is None:
+        metric = _metrics.setdefault(name, Histogram(name, help, labelnames, buckets))
+    return metric
+
+
+def render_metrics() -> str:
+    """All histograms of this process in the Prometheus text format."""
+    lines: list[str] = []
+    for metric in _metrics.values():
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+HOP_SECONDS = histogram("hop_duration_seconds", "Time spent in one hop of a request.",
+                        ("hop", "target", "status"))
+
+
+# ===========================================================================
+# Trace context
+# ===========================================================================
+class SpanContext:
+    __slots__ = ("trace_id", "span_id", "sampled")
+
+    def __init__(self, trace_id: str, span_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+
+_current: ContextVar[Optional[SpanContext]] = ContextVar("telemetry_span", default=None)
+
+
+def current() -> Optional[SpanContext]:
+    return _current.get()
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[SpanContext]:
+    """SpanContext from a W3C traceparent value, None if absent or malformed."""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    try:
+        trace_id, span_id, flags = int(parts[1], 16), int(parts[2], 16), int(parts[3], 16)
+    except ValueError:
+        return None
+    if parts[0] == "ff" or not trace_id or not span_id:
+        return None
+    return SpanContext(parts[1].lower(), parts[2].lower(), bool(flags & 1))
+
+
+def traceparent(context: Optional[SpanContext] = None) -> Optional[str]:
+    """W3C traceparent of `context` (default: the current span)."""
+    context = context or _current.get()
+    if context is None:
+        return None
+    return f"00-{context.trace_id}-{context.span_id}-{'01' if context.sampled else '00'}"
+
+
+def inject(carrier: dict) -> dict:
+    """Add the current traceparent to `carrier` (HTTP headers or MCP _meta)."""
+    value = traceparent()
+    if value is not None:
+        carrier["traceparent"] = value
+    return carrier
+
+
+# ===========================================================================
+# Spans
+# ===========================================================================
+class Span:
+    """A timed hop, used as a context manager (see span()).
+
+    `target` and `status` may be changed until the span ends; an exception
+    marks it as an error.
+    """
+
+    __slots__ = ("hop", "target", "status", "context", "parent_id", "attributes",
+                 "_parent", "_token", "_start")
+
+    def __init__(self, hop: str, target: str, parent: Optional[SpanContext] = None):
+        self.hop = hop
+        self.target = target
+        self.status = "ok"
+        self.context: Optional[SpanContext] = None
+        self.parent_id: Optional[str] = None
+        self.attributes: Optional[dict] = None
+        self._parent = parent
+
+    def __enter__(self) -> "Span":
+        parent = self._parent or _current.get()
+        if parent is None:
+            self.context = SpanContext(f"{random.getrandbits(128):032x}", f"{random.getrandbits(64):016x}",
+                                       random.random() < TRACE_SAMPLE_RATE)
+        else:
+            self.context = SpanContext(parent.trace_id, f"{random.getrandbits(64):016x}", parent.sampled)
+            self.parent_id = parent.span_id
+        self._token = _current.set(self.context)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._start
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.status = "error"
+        HOP_SECONDS.observe(duration, self.hop, self.target, self.status)
+        if self.context.sampled:
+            _exporter.export(self, self._start, duration)
+
+    def set(self, key: str, value) -> None:
+        """Attach an attribute – only kept when the trace is sampled."""
+        if self.context is not None and self.context.sampled:
+            if self.attributes is None:
+                self.attributes = {}
+            self.attributes[key] = value
+
+
+class _NoopSpan(Span):
+    """Stand-in when telemetry is disabled – records nothing."""
+
+    def __enter__(self) -> "Span":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan("", "")
+
+
+def span(hop: str, target: str, parent: Optional[SpanContext] = None) -> Span:
+    """Time a hop into HOP_SECONDS and make it the current span:
+
+        with telemetry.span("tool", name) as hop: ...
+
+    The parent is `parent` (e.g. from an incoming traceparent) or the current
+    span; without either a new trace starts and is sampled at
+    TRACE_SAMPLE_RATE. With telemetry disabled a shared no-op span is used.
+    """
+    return Span(hop, target, parent) if TELEMETRY_ENABLED else _NOOP_SPAN
+
+
+# ===========================================================================
+# Local span exporter
+# ===========================================================================
+class SpanExporter:
+    """Keeps sampled spans in a ring buffer and optionally a JSON-lines file."""
+
+    def __init__(self, max_spans: int = TRACE_BUFFER_SIZE, path: Optional[str] = TRACE_EXPORT_PATH):
+        self._spans: deque = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8") if path else None
+        # perf_counter has no epoch; anchor it once to wall-clock time
+        self._epoch = time.time() - time.perf_counter()
+
+    def export(self, finished: Span, start: float, duration: float):
+        record = {
+            "trace_id": finished.context.trace_id,
+            "span_id": finished.context.span_id,
+            "parent_id": finished.parent_id,
+            "hop": finished.hop,
+            "target": finished.target,
+            "status": finished.status,
+            "start": round(self._epoch + start, 6),
+            "duration_ms": round(duration * 1000, 3),
+        }
+        if finished.attributes:
+            record["attributes"] = finished.attributes
+        with self._lock:
+            self._spans.append(record)
+            if self._file is not None:
+                self._file.write(json.dumps(record, default=str) + "\n")
+                self._file.flush()
+
+    def spans(self, trace_id: Optional[str] = None, limit: int = 200) -> list[dict]:
+        """Most recent spans first, optionally of one trace."""
+        with self._lock:
+            spans = list(self._spans)
+        if trace_id is not None:
+            spans = [s for s in spans if s["trace_id"] == trace_id]
+        return spans[::-1][:limit]
+
+
+_exporter = SpanExporter()
+
+
+def recent_spans(trace_id: Optional[str] = None, limit: int = 200) -> list[dict]:
+    return _exporter.spans(trace_id, limit)
+
+
+# ===========================================================================
+# ASGI middleware and a standalone /metrics server
+# ===========================================================================
+class TracingMiddleware:
+    """Traces each HTTP request as a span, continuing an incoming traceparent.
+
+    The target is the matched route template (FastAPI stores the route in the
+    scope), so path parameters do not multiply the series. 5xx responses
+    count as errors. Streaming responses are timed until their last chunk.
+    """
+
+    def __init__(self, app, hop: str = "api"):
+        self.app = app
+        self.hop = hop
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not TELEMETRY_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        parent = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                parent = parse_traceparent(value.decode("latin-1"))
+                break
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        with span(self.hop, "unmatched", parent=parent) as current_span:
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                route = scope.get("route")
+                current_span.target = f"{scope['method']} {getattr(route, 'path', 'unmatched')}"
+                if status_code >= 500:
+                    current_span.status = "error"
+                current_span.set("http.status_code", status_code)
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1"):
+    """Serve /metrics from a daemon thread – for processes without a web app."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_metrics().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,75 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from customer_store import InMemoryCustomerStore, SQLiteCustomerStore
+from models import Customer, Product
+
+
+def make_dataset(customers: int = 40, seed: int = 7) -> tuple[list[Customer], dict[int, list[Product]]]:
+    """Customers with 0-6 products each, spread over two months of purchases.
+
+    Prices are multiples of 0.25 so every sum is exact in binary floating
+    point and both backends round totals the same way.
+    """
+    rnd = random.Random(seed)
+    rows = [Customer(id=i, email=f"user{i}@example.com", name=f"User {i}",
+                     dob=date(1980, 1, 1) + timedelta(days=i))
+            for i in range(1, customers + 1)]
+    products: dict[int, list[Product]] = {}
+    for c in rows:
+        items = []
+        for j in range(rnd.randint(0, 6)):
+            warranty = rnd.random() < 0.5
+            list_price = rnd.randint(10, 500) + rnd.choice((0, 0.25, 0.5, 0.75))
+            items.append(Product(
+                code=f"P{c.id}-{j}", name=f"Product {j}", list_price=list_price,
+                buy_price=list_price - rnd.randint(0, 8) * 0.5,
+                date=date(2024, 1, 1) + timedelta(days=rnd.randint(0, 59)),
+                has_warranty=warranty,
+                warranty_date=date(2025, 1, 1) + timedelta(days=rnd.randint(0, 364)) if warranty else None,
+            ))
+        if items:
+            products[c.id] = items
+    return rows, products
+
+
+@pytest.fixture
+def dataset():
+    return make_dataset()
+
+
+@pytest.fixture
+def new_store(tmp_path):
+    """Factory for an empty store: new_store("memory" | "sqlite", **kwargs)."""
+    opened = []
+
+    def new(kind: str, **kwargs):
+        if kind == "memory":
+            s = InMemoryCustomerStore(**kwargs)
+        else:
+            s = SQLiteCustomerStore(str(tmp_path / f"customers-{len(opened)}.db"), **kwargs)
+        opened.append(s)
+        return s
+
+    yield new
+    for s in opened:
+        s.close()
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, new_store, dataset):
+    """Each backend in turn, loaded with `dataset`."""
+    s = new_store(request.param)
+    s.bulk_load(*dataset)
+    return s
+
+
+@pytest.fixture
+def stores(new_store, dataset):
+    """Both backends, loaded with the same data – for parity checks."""
+    pair = new_store("memory"), new_store("sqlite")
+    for s in pair:
+        s.bulk_load(*dataset)
+    return pair
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, Overloaded, TokenBucket
+
+
+async def hold(controller, tool, client, release: asyncio.Event, admitted: asyncio.Event = None):
+    async with controller.admit(tool, client):
+        if admitted is not None:
+            admitted.set()
+        await release.wait()
+
+
+def test_token_bucket_refills():
+    bucket = TokenBucket(rate=10, burst=2)
+    assert bucket.take() == 0 and bucket.take() == 0
+    wait = bucket.take()
+    assert 0 < wait <= 0.1
+
+
+def test_rate_limited_tool():
+    async def main():
+        controller = AdmissionController(rate_limits={"search": (0.5, 1)})
+        async with controller.admit("search", "a"):
+            pass
+        with pytest.raises(Overloaded) as e:
+            async with controller.admit("search", "a"):
+                pass
+        assert e.value.reason == "rate_limited" and e.value.retry_after > 1
+        async with controller.admit("other", "a"):      # unlimited tools are unaffected
+            pass
+        assert controller.rejected == {"rate_limited": 1}
+    asyncio.run(main())
+
+
+def test_full_queue_rejects_at_once():
+    async def main():
+        controller = AdmissionController(max_concurrency=1, max_queue=0)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(controller, "t", "a", release))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as e:
+            async with controller.admit("t", "b"):
+                pass
+        assert e.value.reason == "queue_full"
+        release.set()
+        await holder
+    asyncio.run(main())
+
+
+def test_queued_call_times_out():
+    async def main():
+        controller = AdmissionController(max_concurrency=1, max_wait=0.05)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(controller, "t", "a", release))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as e:
+            async with controller.admit("t", "b"):
+                pass
+        assert e.value.reason == "queue_timeout"
+        assert controller.queued == 0
+        release.set()
+        await holder
+    asyncio.run(main())
+
+
+def test_queued_call_runs_when_a_slot_frees():
+    async def main():
+        controller = AdmissionController(max_concurrency=1)
+        release, admitted = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(hold(controller, "t", "a", release))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(hold(controller, "t", "b", asyncio.Event(), admitted))
+        await asyncio.sleep(0)
+        assert controller.queued == 1 and not admitted.is_set()
+        release.set()
+        await asyncio.wait_for(admitted.wait(), 1)
+        assert controller.in_flight == 1
+        waiter.cancel()
+        await holder
+    asyncio.run(main())
+
+
+def test_one_client_cannot_take_every_slot():
+    async def main():
+        controller = AdmissionController(max_concurrency=4, max_per_client=1, max_wait=0.05)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(controller, "t", "busy", release))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded):
+            async with controller.admit("t", "busy"):
+                pass
+        async with controller.admit("t", "quiet"):
+            pass
+        release.set()
+        await holder
+    asyncio.run(main())
+
+
+def test_overloaded_is_retryable():
+    error = Overloaded("queue_full", 0.0)
+    assert error.retry_after == 0.1
+    assert error.to_dict()["error"] == {"type": "overloaded", "reason": "queue_full",
+                                        "retryable": True, "retry_after": 0.1}
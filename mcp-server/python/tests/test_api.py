@@ -0,0 +1,193 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+from etags import etag_for, etag_matches
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def client(request, monkeypatch, new_store, dataset):
+    store = new_store(request.param)
+    store.bulk_load(*dataset)
+    monkeypatch.setattr(api, "store", store)
+    with TestClient(api.app) as c:
+        yield c
+
+
+def pages(client, params, limit):
+    items, cursor = [], None
+    while True:
+        page = client.get("/products", params={**params, "limit": limit, **({"cursor": cursor} if cursor else {})})
+        assert page.status_code == 200
+        body = page.json()
+        items += body["items"]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return items
+
+
+def customer_pages(client, params, limit):
+    items, cursor = [], None
+    while True:
+        page = client.get("/customers", params={**params, "limit": limit, **({"cursor": cursor} if cursor else {})})
+        assert page.status_code == 200
+        body = page.json()
+        assert len(body["items"]) <= limit
+        items += body["items"]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return items
+
+
+# ---------------------------------------------------------------------------
+# Customer pages
+# ---------------------------------------------------------------------------
+def test_customer_pages_cover_every_customer_once(client):
+    assert [c["id"] for c in customer_pages(client, {}, 7)] == list(range(1, 41))
+
+
+def test_customer_fields_projection(client):
+    items = customer_pages(client, {"fields": "id,email"}, 15)
+    assert items[0] == {"id": 1, "email": "user1@example.com"}
+    assert client.get("/customers", params={"fields": "id,password"}).status_code == 400
+
+
+@pytest.mark.parametrize("params, ids", [
+    ({"email_prefix": "user1"}, [1] + list(range(10, 20))),
+    ({"dob_from": "1980-01-10", "dob_to": "1980-01-12"}, [9, 10, 11]),
+    ({"email_prefix": "user1", "dob_to": "1980-01-12"}, [1, 10, 11]),
+])
+def test_customer_filters(client, params, ids):
+    assert [c["id"] for c in customer_pages(client, params, 4)] == ids
+
+
+@pytest.mark.parametrize("cursor", ["garbage", "YzpqdW5r", "cDoxOjE"])
+def test_invalid_customer_cursor(client, cursor):
+    assert client.get("/customers", params={"cursor": cursor}).status_code == 400
+
+
+# ---------------------------------------------------------------------------
+# Batch lookups and profiles
+# ---------------------------------------------------------------------------
+def test_batch_keys_results_as_sent(client):
+    body = client.post("/customers/batch", json={"emails": ["User2@Example.com", "nobody@example.com"],
+                                                 "ids": [3, 999]}).json()
+    assert body["by_email"]["User2@Example.com"]["id"] == 2 and body["by_email"]["nobody@example.com"] is None
+    assert body["by_id"]["3"]["email"] == "user3@example.com" and body["by_id"]["999"] is None
+    assert body["products"] is None
+
+
+def test_batch_includes_products_of_every_customer_found(client, dataset):
+    _, products = dataset
+    ids = [i for i in range(1, 41) if i in products][:2] + [i for i in range(1, 41) if i not in products][:1]
+    body = client.post("/customers/batch", json={"ids": ids, "include_products": True}).json()
+    assert set(body["products"]) == {str(i) for i in ids}
+    for i in ids:
+        assert [p["code"] for p in body["products"][str(i)]] == [p.code for p in products.get(i, [])]
+
+
+def test_batch_size_is_limited(client):
+    too_many = {"ids": list(range(1, api.MAX_BATCH_SIZE + 2))}
+    assert client.post("/customers/batch", json=too_many).status_code == 400
+
+
+def test_profile(client, dataset):
+    _, products = dataset
+    customer_id = next(iter(products))
+    body = client.get("/customer/profile", params={"email": f"user{customer_id}@example.com"}).json()
+    assert body["customer"]["id"] == customer_id
+    assert [p["code"] for p in body["products"]] == [p.code for p in products[customer_id]]
+    assert client.get("/customer/profile", params={"email": "nobody@example.com"}).status_code == 404
+
+
+# ---------------------------------------------------------------------------
+# NDJSON export
+# ---------------------------------------------------------------------------
+@pytest.mark.parametrize("batch_size", [1000, 7])
+def test_export_streams_every_customer(client, monkeypatch, dataset, batch_size):
+    monkeypatch.setattr(api, "EXPORT_BATCH_SIZE", batch_size)
+    _, products = dataset
+    resp = client.get("/export/customers.ndjson", params={"include_products": "true"})
+    assert resp.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in resp.text.splitlines()]
+    assert [r["id"] for r in rows] == list(range(1, 41))
+    for r in rows:
+        assert [p["code"] for p in r["products"]] == [p.code for p in products.get(r["id"], [])]
+
+    plain = client.get("/export/customers.ndjson").text.splitlines()
+    assert len(plain) == 40 and "products" not in json.loads(plain[0])
+
+
+# ---------------------------------------------------------------------------
+# Product queries
+# ---------------------------------------------------------------------------
+@pytest.mark.parametrize("params", [
+    {},
+    {"has_warranty": "true"},
+    {"customer_id": 3},
+    {"date_from": "2024-01-10", "date_to": "2024-01-31"},
+    {"warranty_from": "2025-03-01", "warranty_to": "2025-09-30", "has_warranty": "true"},
+])
+def test_product_pages_cover_every_match(client, params):
+    everything = client.get("/products", params={**params, "limit": 1000}).json()
+    assert everything["next_cursor"] is None
+    assert pages(client, params, 3) == everything["items"]
+
+
+def test_product_discount(client):
+    item = client.get("/products", params={"limit": 1}).json()["items"][0]
+    assert item["discount"] == round(item["list_price"] - item["buy_price"], 2)
+
+
+def test_product_cursor_is_tied_to_its_order(client):
+    cursor = client.get("/products", params={"date_from": "2024-01-01", "limit": 1}).json()["next_cursor"]
+    assert client.get("/products", params={"date_from": "2024-01-02", "cursor": cursor}).status_code == 200
+    assert client.get("/products", params={"cursor": cursor}).status_code == 400
+    assert client.get("/products", params={"warranty_from": "2025-01-01", "cursor": cursor}).status_code == 400
+
+
+@pytest.mark.parametrize("cursor", ["garbage", "cDpjdXN0b21lcjp4OjE", "Y3VzdG9tZXI"])
+def test_invalid_product_cursor(client, cursor):
+    assert client.get("/products", params={"cursor": cursor}).status_code == 400
+
+
+def test_product_summary(client):
+    body = client.get("/products/summary", params={"by_customer": "true", "order_by": "count", "limit": 2}).json()
+    assert body["totals"]["count"] == len(client.get("/products", params={"limit": 1000}).json()["items"])
+    assert len(body["by_customer"]) == 2
+
+
+# ---------------------------------------------------------------------------
+# ETags
+# ---------------------------------------------------------------------------
+def test_etag_revalidation(client):
+    first = client.get("/customer/1/products")
+    etag = first.headers["etag"]
+    assert etag == etag_for(first.content)
+
+    again = client.get("/customer/1/products", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.content == b""
+    assert again.headers["etag"] == etag
+
+    client.post("/customer/1/products", json={"code": "NEW", "name": "New", "list_price": 2, "buy_price": 1,
+                                               "date": "2024-01-01", "has_warranty": False})
+    changed = client.get("/customer/1/products", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+
+
+def test_no_etag_on_errors_or_streams(client):
+    assert "etag" not in client.get("/customer/999999/products").headers
+    assert "etag" not in client.get("/export/customers.ndjson").headers
+
+
+@pytest.mark.parametrize("header, matches", [
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"x", "abc"', True),
+    ("*", True),
+    ('"abd"', False),
+])
+def test_etag_matches(header, matches):
+    assert etag_matches(header, '"abc"') is matches
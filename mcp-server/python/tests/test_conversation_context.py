@@ -0,0 +1,92 @@
+import json
+from types import SimpleNamespace
+
+from mcp import types
+
+from conversation_context import OMITTED, ConversationContext, compact_text, strip_nulls
+
+TOOLS = [
+    types.Tool(name="with_format", inputSchema={"type": "object", "properties": {"response_format": {}}}),
+    types.Tool(name="plain", inputSchema={"type": "object", "properties": {"id": {}}}),
+]
+
+
+def result(data):
+    return {"content": [{"type": "text", "text": json.dumps(data, indent=2)}], "structuredContent": data}
+
+
+def history(context, rounds, size=2000):
+    """A user prompt followed by one large tool result per round."""
+    messages = [{"role": "user", "content": "question"}]
+    for i in range(rounds):
+        context.prune(messages)
+        messages.append({"role": "assistant", "tool_calls": [
+            {"id": f"c{i}", "type": "function", "function": {"name": "plain", "arguments": "{}"}}]})
+        messages.append(context.tool_message(f"c{i}", result({"i": i, "blob": "x" * size})))
+    return messages
+
+
+# ---------------------------------------------------------------------------
+# What goes in
+# ---------------------------------------------------------------------------
+def test_force_json_only_for_tools_that_take_it():
+    context = ConversationContext(TOOLS)
+    assert json.loads(context.force_json("with_format", '{"email": "a@b.c"}')) == \
+        {"email": "a@b.c", "response_format": "json"}
+    assert context.force_json("plain", '{"id": 1}') == '{"id": 1}'
+    assert context.force_json("with_format", "not json") == "not json"
+
+
+def test_tool_message_is_compact_and_drops_nulls():
+    message = ConversationContext().tool_message("c1", result({"id": 1, "warranty_date": None,
+                                                               "items": [{"a": None, "b": 2}]}))
+    assert message == {"role": "tool", "tool_call_id": "c1", "content": '{"id":1,"items":[{"b":2}]}'}
+
+
+def test_tool_message_of_text_results_and_errors():
+    context = ConversationContext()
+    text = context.tool_message("c1", {"content": [{"type": "text", "text": '{"a": 1, "b": null}'}]})
+    assert text["content"] == '{"a":1}'
+    error = context.tool_message("c2", {"content": [{"type": "text", "text": "not found"}], "isError": True,
+                                        "structuredContent": {"ignored": True}})
+    assert error["content"] == "Error: not found"
+
+
+def test_strip_nulls_keeps_list_positions():
+    assert strip_nulls([None, {"a": None}]) == [None, {}]
+    assert compact_text("plain text") == "plain text"
+
+
+# ---------------------------------------------------------------------------
+# What stays
+# ---------------------------------------------------------------------------
+def test_stale_results_are_summarized():
+    context = ConversationContext(token_budget=10**6, summary_chars=100)
+    messages = history(context, 3)
+    context.prune(messages)
+    tools = [m for m in messages if m["role"] == "tool"]
+    # The latest result is intact; the older ones are cut to summary_chars
+    assert len(tools[-1]["content"]) > 2000
+    assert all(m["content"].startswith('{"i":') and "[truncated" in m["content"] and len(m["content"]) < 200
+               for m in tools[:-1])
+
+
+def test_over_budget_blanks_the_oldest_results_first():
+    context = ConversationContext(token_budget=300, keep_rounds=10)
+    messages = history(context, 3)
+    context.prune(messages)
+    tools = [m["content"] for m in messages if m["role"] == "tool"]
+    assert tools[0] == OMITTED and tools[-1] != OMITTED
+
+
+# ---------------------------------------------------------------------------
+# Reporting
+# ---------------------------------------------------------------------------
+def test_report_keeps_the_reported_prompt_tokens():
+    context = ConversationContext()
+    context.prune([{"role": "user", "content": "hi"}])
+    context.record_usage(SimpleNamespace(prompt_tokens=120))
+    context.record_usage(None)
+    report = context.report()
+    assert report["rounds"] == 1 and report["prompt_tokens"] == [120]
+    assert report["total_prompt_tokens"] == 120 and len(report["estimated_prompt_tokens"]) == 1
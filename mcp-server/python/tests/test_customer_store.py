@@ -0,0 +1,205 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from customer_store import PRODUCT_ORDERS, InMemoryCustomerStore, ProductFilter, _ProductIndex, product_order
+from models import Customer, Product
+
+FILTERS = [
+    ProductFilter(),
+    ProductFilter(has_warranty=True),
+    ProductFilter(has_warranty=False),
+    ProductFilter(customer_id=3),
+    ProductFilter(customer_id=3, has_warranty=True),
+    ProductFilter(customer_id=10_000),
+    ProductFilter(date_from=date(2024, 1, 10), date_to=date(2024, 1, 20)),
+    ProductFilter(date_from=date(2024, 2, 1), has_warranty=True),
+    ProductFilter(date_to=date(2024, 1, 5)),
+    ProductFilter(warranty_from=date(2025, 3, 1), warranty_to=date(2025, 5, 31)),
+    ProductFilter(warranty_to=date(2025, 2, 1), date_from=date(2024, 1, 15)),
+    ProductFilter(date_from=date(2030, 1, 1)),
+]
+
+
+def everything(store, f):
+    return store.find_products(f, limit=1_000_000)
+
+
+def walk(store, f, page_size):
+    after, seen = None, []
+    for _ in range(len(everything(store, f)) + 1):   # a cursor that stops advancing fails, not hangs
+        page = store.find_products(f, after, page_size)
+        if not page:
+            return seen
+        assert len(page) <= page_size
+        seen += page
+        after = page[-1][0]
+    pytest.fail("paging did not finish")
+
+
+def scramble(store, seed=3):
+    """The same sequence of product and customer writes, whatever the backend."""
+    rnd = random.Random(seed)
+    for i in range(150):
+        cid = rnd.randint(1, 40)
+        if not store.has_customer(cid):
+            continue
+        roll = rnd.random()
+        if roll < 0.4:
+            warranty = roll < 0.2
+            store.add_product(cid, Product(
+                code=f"N{i}", name="New", list_price=100.5, buy_price=90.25,
+                date=date(2024, 1, 1) + timedelta(days=rnd.randint(0, 59)), has_warranty=warranty,
+                warranty_date=date(2025, 1, 1) + timedelta(days=rnd.randint(0, 364)) if warranty else None))
+        elif roll < 0.6 and store.get_products(cid):
+            store.delete_product(cid, store.get_products(cid)[0].code)
+        elif roll < 0.75:
+            store.set_products(cid, store.get_products(cid)[1:])
+        elif roll < 0.8:
+            store.delete_customer(cid)
+        else:
+            c = store.get_customer(cid)
+            store.update_customer(Customer(id=cid, email=c.email, name=c.name + "!", dob=c.dob))
+
+
+# ---------------------------------------------------------------------------
+# Product queries
+# ---------------------------------------------------------------------------
+@pytest.mark.parametrize("f", FILTERS)
+def test_find_products_matches_filter(store, f, dataset):
+    rows = everything(store, f)
+    expected = sorted((cid, p.code) for cid, items in dataset[1].items() for p in items
+                      if f.matches(p) and f.customer_id in (None, cid))
+    assert sorted((cid, p.code) for _, cid, p in rows) == expected
+
+
+@pytest.mark.parametrize("f", FILTERS)
+def test_find_products_in_position_order(store, f):
+    positions = [pos for pos, _, _ in everything(store, f)]
+    assert positions == sorted(positions)
+    if product_order(f) == "customer":
+        assert all(pos[0] == cid for pos, cid, _ in everything(store, f))
+
+
+@pytest.mark.parametrize("f", FILTERS)
+@pytest.mark.parametrize("page_size", [1, 4, 50])
+def test_paging_walks_every_match_once(store, f, page_size):
+    assert walk(store, f, page_size) == everything(store, f)
+
+
+@pytest.mark.parametrize("f", FILTERS)
+def test_find_products_parity(stores, f):
+    memory, sqlite = stores
+    assert everything(memory, f) == everything(sqlite, f)
+
+
+@pytest.mark.parametrize("f", FILTERS)
+@pytest.mark.parametrize("order_by", sorted(PRODUCT_ORDERS))
+def test_summarize_products_parity(stores, f, order_by):
+    memory, sqlite = stores
+    assert memory.summarize_products(f, True, order_by, 5) == sqlite.summarize_products(f, True, order_by, 5)
+
+
+@pytest.mark.parametrize("f", FILTERS)
+def test_summary_agrees_with_find(store, f):
+    totals, _ = store.summarize_products(f)
+    rows = everything(store, f)
+    assert totals.count == len(rows)
+    assert totals.with_warranty == sum(p.has_warranty for _, _, p in rows)
+    assert totals.spend == pytest.approx(sum(p.buy_price for _, _, p in rows))
+
+
+def test_summary_ranks_customers(store):
+    _, groups = store.summarize_products(ProductFilter(), by_customer=True, order_by="count", limit=3)
+    counts = [g.count for g in groups]
+    assert len(groups) == 3 and counts == sorted(counts, reverse=True)
+
+
+@pytest.mark.parametrize("f", FILTERS)
+def test_queries_follow_writes(stores, f):
+    memory, sqlite = stores
+    for s in stores:
+        scramble(s)
+    assert everything(memory, f) == everything(sqlite, f)
+    assert memory.summarize_products(f, True) == sqlite.summarize_products(f, True)
+    assert walk(memory, f, 3) == everything(memory, f)
+
+
+def test_incremental_index_equals_rebuild(dataset):
+    s = InMemoryCustomerStore()
+    s.bulk_load(*dataset)
+    scramble(s)
+    rebuilt = _ProductIndex()
+    rebuilt.rebuild(s._by_product_id)
+    assert s._index.by_date == rebuilt.by_date
+    assert s._index.by_warranty == rebuilt.by_warranty
+    assert s._index.sums.keys() == rebuilt.sums.keys()
+    for cid, sums in rebuilt.sums.items():
+        assert s._index.sums[cid] == pytest.approx(sums)
+
+
+def test_product_order():
+    assert product_order(ProductFilter()) == "customer"
+    assert product_order(ProductFilter(customer_id=1, warranty_from=date(2025, 1, 1))) == "customer"
+    assert product_order(ProductFilter(warranty_to=date(2025, 1, 1), date_from=date(2024, 1, 1))) == "warranty"
+    assert product_order(ProductFilter(date_to=date(2024, 1, 1), has_warranty=True)) == "date"
+
+
+def test_product_filter_ranges_are_inclusive():
+    p = Product(code="A", name="A", list_price=2, buy_price=1, date=date(2024, 1, 10),
+                has_warranty=True, warranty_date=date(2025, 6, 30))
+    assert ProductFilter(date_from=date(2024, 1, 10), date_to=date(2024, 1, 10)).matches(p)
+    assert ProductFilter(warranty_to=date(2025, 6, 30), has_warranty=True).matches(p)
+    assert not ProductFilter(warranty_from=date(2025, 7, 1)).matches(p)
+    assert not ProductFilter(has_warranty=False).matches(p)
+    assert not ProductFilter(warranty_from=date(2020, 1, 1)).matches(p.model_copy(update={"warranty_date": None}))
+
+
+# ---------------------------------------------------------------------------
+# Change log
+# ---------------------------------------------------------------------------
+def test_bulk_load_is_not_recorded(store):
+    assert store.last_change_seq() == 0
+    assert store.changes_since(0) == []
+
+
+def test_writes_are_recorded_in_order(store):
+    c = store.get_customer(1)
+    store.update_customer(Customer(id=1, email="renamed@example.com", name=c.name, dob=c.dob))
+    store.add_product(1, Product(code="Z", name="Z", list_price=1, buy_price=1, date=date(2024, 1, 1),
+                                 has_warranty=False))
+    store.delete_product(1, "Z")
+    store.delete_customer(2)
+
+    changes = store.changes_since(0)
+    assert [c.seq for c in changes] == [1, 2, 3, 4]
+    assert [(c.op, c.entity, c.customer_id, c.code) for c in changes] == [
+        ("update", "customer", 1, None),
+        ("create", "product", 1, "Z"),
+        ("delete", "product", 1, "Z"),
+        ("delete", "customer", 2, None),
+    ]
+    assert sorted(changes[0].emails) == ["renamed@example.com", "user1@example.com"]
+    assert [c.seq for c in store.changes_since(2, limit=1)] == [3]
+    assert store.changes_since(4) == []
+    assert store.changes_since(9) is None            # ahead of the log: the store was recreated
+
+
+def test_failed_writes_are_not_recorded(store):
+    with pytest.raises(KeyError):
+        store.delete_product(1, "no-such-code")
+    with pytest.raises(ValueError):
+        store.add_customer(Customer(id=999, email="USER1@example.com", name="Dup", dob=date(2000, 1, 1)))
+    assert store.last_change_seq() == 0
+
+
+@pytest.mark.parametrize("kind", ["memory", "sqlite"])
+def test_pruned_log_asks_for_a_reset(kind, new_store):
+    s = new_store(kind, change_retention=5)
+    s.add_customer(Customer(id=1, email="a@example.com", name="A", dob=date(2000, 1, 1)))
+    for i in range(600):                             # SQLite prunes every few hundred writes
+        s.set_products(1, [])
+    assert s.changes_since(0) is None
+    last = s.last_change_seq()
+    assert [c.seq for c in s.changes_since(last - 2)] == [last - 1, last]
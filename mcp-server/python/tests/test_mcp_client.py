@@ -0,0 +1,246 @@
+import asyncio
+import os
+import stat
+
+import pytest
+from jsonschema import ValidationError
+from mcp import types
+
+import mcp_client
+from mcp_client import MCPClient, MCPClientPool, ToolCatalogCache
+
+SCHEMA_V1 = {"type": "object", "properties": {"id": {"type": "integer"}}, "required": ["id"]}
+SCHEMA_V2 = {"type": "object", "properties": {"uid": {"type": "string"}}, "required": ["uid"]}
+
+
+def tool(schema):
+    return types.Tool(name="lookup", inputSchema={"type": "object"}, outputSchema=schema)
+
+
+class FakeServer:
+    """Answers tools/call and tools/list like a ClientSession would."""
+
+    def __init__(self, tools, results):
+        self.tools = tools
+        self.results = list(results)
+        self.calls = []
+        self.listed = 0
+
+    async def send_request(self, request, result_type):
+        self.calls.append(request.root.params.name)
+        return types.CallToolResult(content=[], structuredContent=self.results.pop(0))
+
+    async def list_tools(self):
+        self.listed += 1
+        return types.ListToolsResult(tools=self.tools)
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+    cache = ToolCatalogCache(snapshot_dir=None)
+    monkeypatch.setattr(mcp_client, "tool_catalog", cache)
+    return cache
+
+
+def connected(catalog, server, cached_tools):
+    """A client set up from a cached catalog, as setup() does."""
+    client = MCPClient("http://mcp.invalid/mcp")
+    client.session = server
+    client._use_catalog(catalog.put(client.server_url, cached_tools))
+    return client
+
+
+class FakeSession:
+    """Stands in for a pooled session; the pool counts what is open."""
+
+    def __init__(self, pool, healthy=True):
+        self.pool = pool
+        self.client = object()
+        self.alive = True
+        self.healthy = healthy
+        self.last_used = 0.0
+
+    def age(self):
+        return 0.0
+
+    async def ping(self, timeout):
+        return self.healthy
+
+    async def close(self):
+        self.alive = False
+        self.pool.open -= 1
+
+
+class FakePool(MCPClientPool):
+    def __init__(self, size, healthy=True):
+        super().__init__("http://mcp.invalid/mcp", size=size)
+        self.healthy = healthy
+        self.open = self.peak = 0
+
+    async def _connect(self):
+        self.open += 1
+        self.peak = max(self.peak, self.open)
+        self.created += 1
+        await asyncio.sleep(0.01)
+        return FakeSession(self, self.healthy)
+
+
+async def borrow(pool, hold=0.02):
+    async with pool.session():
+        await asyncio.sleep(hold)
+
+
+# ---------------------------------------------------------------------------
+# Client pool
+# ---------------------------------------------------------------------------
+def test_warm_opens_up_to_size():
+    async def main():
+        pool = FakePool(size=3)
+        await pool.warm()
+        await pool.warm()
+        assert pool.stats()["idle"] == 3 and pool.created == 3
+    asyncio.run(main())
+
+
+def test_warm_counts_lent_out_sessions():
+    async def main():
+        pool = FakePool(size=2)
+        release = asyncio.Event()
+
+        async def hold():
+            async with pool.session():
+                await release.wait()
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0.05)
+        await pool.warm()
+        assert pool.stats()["idle"] == 1 and pool.open == 2
+        release.set()
+        await holder
+    asyncio.run(main())
+
+
+def test_borrowers_during_warm_stay_within_size():
+    async def main():
+        pool = FakePool(size=2)
+        await asyncio.gather(pool.warm(), *(borrow(pool) for _ in range(4)))
+        assert pool.peak <= 2
+        assert pool.stats()["idle"] + pool.stats()["in_use"] == pool.open <= 2
+    asyncio.run(main())
+
+
+def test_borrowers_beyond_size_wait_for_a_session():
+    async def main():
+        pool = FakePool(size=2)
+        await asyncio.gather(*(borrow(pool) for _ in range(6)))
+        assert pool.peak == 2 and pool.created == 2
+    asyncio.run(main())
+
+
+def test_sessions_are_reused():
+    async def main():
+        pool = FakePool(size=2)
+        for _ in range(5):
+            await borrow(pool, hold=0)
+        assert pool.created == 1 and pool.stats()["idle"] == 1
+    asyncio.run(main())
+
+
+def test_failed_borrower_drops_a_dead_session():
+    async def main():
+        pool = FakePool(size=1, healthy=False)
+        try:
+            async with pool.session():
+                raise RuntimeError("boom")
+        except RuntimeError:
+            pass
+        assert pool.failed_health_checks == 1 and pool.open == 0
+        assert pool.stats()["in_use"] == 0
+    asyncio.run(main())
+
+
+def test_closed_pool_closes_its_sessions():
+    async def main():
+        pool = FakePool(size=2)
+        await pool.warm()
+        await pool.close()
+        assert pool.open == 0
+    asyncio.run(main())
+
+
+# ---------------------------------------------------------------------------
+# Tool catalog
+# ---------------------------------------------------------------------------
+def test_cached_catalog_is_not_relisted(catalog):
+    async def main():
+        server = FakeServer([tool(SCHEMA_V1)], [{"id": 1}, {"id": 2}])
+        client = connected(catalog, server, [tool(SCHEMA_V1)])
+        assert (await client.call_tool("lookup", {}))["structuredContent"] == {"id": 1}
+        await client.call_tool("lookup", {})
+        assert server.listed == 0 and server.calls == ["lookup", "lookup"]
+    asyncio.run(main())
+
+
+def test_stale_schema_refreshes_and_retries_once(catalog):
+    async def main():
+        server = FakeServer([tool(SCHEMA_V2)], [{"uid": "a"}, {"uid": "a"}])
+        client = connected(catalog, server, [tool(SCHEMA_V1)])
+        old = client.catalog_version
+        assert (await client.call_tool("lookup", {}))["structuredContent"] == {"uid": "a"}
+        assert server.listed == 1 and len(server.calls) == 2
+        assert client.catalog_version != old
+        assert catalog.get(client.server_url).version == client.catalog_version
+    asyncio.run(main())
+
+
+def test_result_still_invalid_after_refresh_raises(catalog):
+    async def main():
+        server = FakeServer([tool(SCHEMA_V1)], [{"uid": "a"}, {"uid": "a"}])
+        client = connected(catalog, server, [tool(SCHEMA_V1)])
+        with pytest.raises(ValidationError):
+            await client.call_tool("lookup", {})
+        assert server.listed == 1 and len(server.calls) == 2
+    asyncio.run(main())
+
+
+def test_tools_without_output_schema_are_not_checked(catalog):
+    async def main():
+        server = FakeServer([], [None])
+        client = connected(catalog, server, [tool(None)])
+        assert (await client.call_tool("lookup", {}))["structuredContent"] is None
+        assert server.listed == 0
+    asyncio.run(main())
+
+
+def test_list_changed_notification_refreshes_the_catalog(catalog):
+    async def main():
+        server = FakeServer([tool(SCHEMA_V2)], [])
+        client = connected(catalog, server, [tool(SCHEMA_V1)])
+        old = client.catalog_version
+        await client._on_message(types.ServerNotification(types.ToolListChangedNotification()))
+        await client._refresh_task
+        assert server.listed == 1 and client.catalog_version != old
+        assert catalog.get(client.server_url).version == client.catalog_version
+    asyncio.run(main())
+
+
+def test_snapshot_survives_a_new_process(tmp_path):
+    directory = str(tmp_path / "catalog")
+    saved = ToolCatalogCache(snapshot_dir=directory).put("http://a/mcp", [tool(SCHEMA_V1)])
+    loaded = ToolCatalogCache(snapshot_dir=directory).get("http://a/mcp")
+    assert loaded.version == saved.version and loaded.tools == saved.tools
+    assert stat.S_IMODE(os.stat(directory).st_mode) == 0o700
+    assert all(stat.S_IMODE(os.stat(os.path.join(directory, f)).st_mode) == 0o600 for f in os.listdir(directory))
+
+
+def test_snapshot_of_another_user_is_ignored(tmp_path, monkeypatch):
+    directory = str(tmp_path / "catalog")
+    ToolCatalogCache(snapshot_dir=directory).put("http://a/mcp", [tool(SCHEMA_V1)])
+    monkeypatch.setattr(os, "getuid", lambda: os.stat(directory).st_uid + 1, raising=False)
+    assert ToolCatalogCache(snapshot_dir=directory).get("http://a/mcp") is None
+
+
+def test_expired_snapshot_is_dropped(tmp_path):
+    directory = str(tmp_path / "catalog")
+    ToolCatalogCache(snapshot_dir=directory).put("http://a/mcp", [tool(SCHEMA_V1)])
+    assert ToolCatalogCache(ttl=0, snapshot_dir=directory).get("http://a/mcp") is None
+    assert os.listdir(directory) == []
@@ -0,0 +1,179 @@
+import asyncio
+
+import httpx
+import pytest
+from mcp.shared.memory import create_connected_server_and_client_session
+from starlette.testclient import TestClient
+
+import api
+import mcp_server_http as server
+from customer_store import InMemoryCustomerStore
+
+TOOLS = {"customer_get_by_email", "customer_list_all", "customer_get_products", "customer_get_by_emails",
+         "customer_get_products_batch", "customer_get_profile", "customer_find_products",
+         "customer_product_summary"}
+
+
+@pytest.fixture
+def upstream(monkeypatch, dataset):
+    """The tools' upstream client talks to api.py in-process, over `dataset`."""
+    store = InMemoryCustomerStore()
+    store.bulk_load(*dataset)
+    monkeypatch.setattr(api, "store", store)
+    monkeypatch.setattr(server, "_http", httpx.AsyncClient(base_url="http://api",
+                                                           transport=httpx.ASGITransport(app=api.app)))
+    server._cache.invalidate()
+    server._validators.clear()
+    yield store
+    server._cache.invalidate()
+    server._validators.clear()
+
+
+def call(name, **args):
+    """Call one tool over an in-memory MCP session; returns the CallToolResult."""
+    async def main():
+        async with create_connected_server_and_client_session(server.mcp) as session:
+            return await session.call_tool(name, args)
+    return asyncio.run(main())
+
+
+def test_every_tool_declares_an_output_schema():
+    async def main():
+        async with create_connected_server_and_client_session(server.mcp) as session:
+            return (await session.list_tools()).tools
+    tools = asyncio.run(main())
+    assert {t.name for t in tools} == TOOLS
+    assert all(t.outputSchema for t in tools)
+
+
+# ---------------------------------------------------------------------------
+# Lookups
+# ---------------------------------------------------------------------------
+def test_get_by_email(upstream):
+    result = call("customer_get_by_email", email=" User3@Example.com ", response_format="json")
+    assert not result.isError
+    assert result.structuredContent == {"id": 3, "email": "user3@example.com", "name": "User 3",
+                                        "dob": "1980-01-04"}
+
+
+def test_unknown_email_is_a_tool_error(upstream):
+    result = call("customer_get_by_email", email="nobody@example.com")
+    assert result.isError and "not found" in result.content[0].text
+
+
+def test_markdown_is_the_default_rendering(upstream):
+    text = call("customer_get_by_email", email="user3@example.com").content[0].text
+    assert text.startswith("### Customer") and "**Name:** User 3" in text
+
+
+def test_repeated_lookup_is_served_from_the_cache(upstream):
+    call("customer_get_by_email", email="user3@example.com")
+    hits = server._cache.stats()["hits"]
+    call("customer_get_by_email", email="user3@example.com")
+    assert server._cache.stats()["hits"] == hits + 1
+
+
+# ---------------------------------------------------------------------------
+# Batch and composite tools
+# ---------------------------------------------------------------------------
+def test_get_by_emails_keys_results_as_given(upstream):
+    emails = ["User1@example.com", "user2@example.com", "nobody@example.com"]
+    customers = call("customer_get_by_emails", emails=emails, response_format="json").structuredContent["customers"]
+    assert list(customers) == emails
+    assert customers["User1@example.com"]["id"] == 1 and customers["nobody@example.com"] is None
+
+
+def test_get_products_batch(upstream, dataset):
+    _, products = dataset
+    with_products = next(iter(products))
+    without = next(i for i in range(1, 41) if i not in products)
+    ids = [with_products, without, 999]
+    result = call("customer_get_products_batch", customer_ids=ids, response_format="json").structuredContent
+    assert result["products"][str(without)] == [] and result["products"]["999"] is None
+    assert [p["code"] for p in result["products"][str(with_products)]] == [p.code for p in products[with_products]]
+
+
+def test_batch_size_is_limited(upstream):
+    result = call("customer_get_by_emails", emails=[f"u{i}@example.com" for i in range(server.MAX_BATCH_SIZE + 1)])
+    assert result.isError
+
+
+def test_profile_returns_customer_and_products(upstream, dataset):
+    _, products = dataset
+    customer_id = next(iter(products))
+    profile = call("customer_get_profile", email=f"user{customer_id}@example.com",
+                   response_format="json").structuredContent
+    assert profile["customer"]["id"] == customer_id
+    assert len(profile["products"]) == len(products[customer_id])
+
+
+# ---------------------------------------------------------------------------
+# Pagination and product queries
+# ---------------------------------------------------------------------------
+def test_list_all_pages_through_every_customer(upstream):
+    seen, cursor = [], None
+    while True:
+        page = call("customer_list_all", limit=7, fields=["id"], cursor=cursor,
+                    response_format="json").structuredContent
+        assert all(set(c) == {"id"} for c in page["items"])
+        seen += [c["id"] for c in page["items"]]
+        cursor = page.get("next_cursor")
+        if cursor is None:
+            break
+    assert seen == list(range(1, 41))
+
+
+def test_list_all_rejects_a_bad_limit(upstream):
+    assert call("customer_list_all", limit=0).isError
+
+
+def test_find_products_and_summary_agree(upstream):
+    filters = {"has_warranty": True, "warranty_from": "2025-03-01", "warranty_to": "2025-09-30"}
+    found = call("customer_find_products", limit=1000, response_format="json", **filters).structuredContent
+    summary = call("customer_product_summary", response_format="json", **filters).structuredContent
+    assert found["next_cursor"] is None
+    assert summary["totals"]["count"] == len(found["items"]) > 0
+    assert all(p["has_warranty"] for p in found["items"])
+
+
+# ---------------------------------------------------------------------------
+# Upstream pool stats
+# ---------------------------------------------------------------------------
+def test_pool_stats_count_requests(monkeypatch):
+    counting = server._CountingTransport(httpx.AsyncHTTPTransport())
+    monkeypatch.setattr(server, "_http_transport", counting)
+    stats = server._pool_stats()
+    assert (stats["in_flight"], stats["queued_requests"], stats["utilization"]) == (0, 0, 0)
+    assert (stats["connections"], stats["idle_connections"]) == (0, 0)
+    counting.in_flight = server.HTTPX_MAX_CONNECTIONS + 3
+    stats = server._pool_stats()
+    assert stats["queued_requests"] == 3 and stats["utilization"] == 1
+
+
+def test_pool_stats_without_a_readable_pool(monkeypatch):
+    # Any transport whose internals we cannot read – e.g. after an httpx upgrade
+    monkeypatch.setattr(server, "_http_transport", server._CountingTransport(httpx.ASGITransport(app=api.app)))
+    stats = server._pool_stats()
+    assert (stats["connections"], stats["idle_connections"]) == ("unknown", "unknown")
+    assert stats["in_flight"] == 0
+
+
+# ---------------------------------------------------------------------------
+# Multi-worker mode
+# ---------------------------------------------------------------------------
+def test_stateless_mode_answers_without_a_session(upstream, monkeypatch):
+    # What each worker runs with MCP_WORKERS > 1: no initialize handshake and
+    # no Mcp-Session-Id, so any worker can take any request
+    monkeypatch.setattr(server.mcp.settings, "stateless_http", True)
+    monkeypatch.setattr(server.mcp.settings, "json_response", True)
+    monkeypatch.setattr(server.mcp, "_session_manager", None)
+    monkeypatch.setitem(server._feed, "enabled", False)
+    request = {"jsonrpc": "2.0", "id": 1, "method": "tools/call",
+               "params": {"name": "customer_get_by_email",
+                          "arguments": {"email": "user3@example.com", "response_format": "json"}}}
+    headers = {"Accept": "application/json, text/event-stream"}
+    with TestClient(server.create_app(), base_url="http://127.0.0.1:3000") as client:
+        for _ in range(2):
+            resp = client.post("/mcp", json=request, headers=headers)
+            assert resp.status_code == 200 and "mcp-session-id" not in resp.headers
+            assert resp.json()["result"]["structuredContent"]["id"] == 3
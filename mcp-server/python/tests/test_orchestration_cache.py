@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from orchestration_cache import OrchestrationCache
+
+RECORD = {"assistant_answer": "Jane", "user_record": {"id": 1}, "products": []}
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def new_cache(request, tmp_path):
+    """Factory for caches; with SQLite, caches made by one test share a file."""
+    made = []
+
+    def make(**kwargs):
+        path = str(tmp_path / "orchestration.db") if request.param == "sqlite" else None
+        cache = OrchestrationCache(path=path, **kwargs)
+        made.append(cache)
+        return cache
+    yield make
+    for cache in made:
+        cache.close()
+
+
+def test_key_ignores_case_and_whitespace():
+    key = OrchestrationCache.key
+    assert key("Get  JANE", "v1", "gpt") == key(" get jane ", "v1", "gpt")
+    assert key("get jane", "v1", "gpt") != key("get jane", "v2", "gpt")
+    assert key("get jane", "v1", "gpt", "llm") != key("get jane", "v1", "gpt", "planner")
+
+
+def test_hits_return_fresh_copies(new_cache):
+    async def main():
+        cache = new_cache()
+        await cache.put("k", RECORD)
+        first = await cache.get("k")
+        first["products"].append("changed")
+        assert await cache.get("k") == RECORD
+        assert (cache.hits, cache.misses) == (2, 0)
+    asyncio.run(main())
+
+
+def test_entries_expire(new_cache):
+    async def main():
+        cache = new_cache()
+        await cache.put("k", RECORD, ttl=0.01)
+        time.sleep(0.02)
+        assert await cache.get("k") is None
+        await cache.put("k", RECORD, ttl=0)
+        assert await cache.get("k") is None
+    asyncio.run(main())
+
+
+def test_invalidate_tags_drops_only_that_customer(new_cache):
+    async def main():
+        cache = new_cache()
+        await cache.put("jane", RECORD, tags=[("customer", 1)])
+        await cache.put("john", RECORD, tags=[("customer", 2)])
+        assert await cache.invalidate_tags([("customer", 1)]) == 1
+        assert await cache.get("jane") is None
+        assert await cache.get("john") == RECORD
+        assert await cache.invalidate_tags([("customer", 1)]) == 0
+    asyncio.run(main())
+
+
+def test_invalidation_during_a_run_discards_its_record(new_cache):
+    async def main():
+        cache = new_cache()
+        generation = cache.generation
+        await cache.invalidate_tags([("customer", 1)])        # a write lands while the run is going
+        await cache.put("jane", RECORD, tags=[("customer", 1)], generation=generation)
+        assert await cache.get("jane") is None
+        await cache.put("jane", RECORD, tags=[("customer", 1)], generation=cache.generation)
+        assert await cache.get("jane") == RECORD
+    asyncio.run(main())
+
+
+def test_invalidate_everything(new_cache):
+    async def main():
+        cache = new_cache()
+        await cache.put("a", RECORD)
+        await cache.put("b", RECORD)
+        assert await cache.invalidate("a") == 1
+        assert await cache.invalidate() == 1
+        assert await cache.get("b") is None
+    asyncio.run(main())
+
+
+def test_least_recently_used_is_evicted():
+    async def main():
+        cache = OrchestrationCache(max_entries=2)
+        await cache.put("a", RECORD, tags=[("customer", 1)])
+        await cache.put("b", RECORD)
+        await cache.get("a")
+        await cache.put("c", RECORD)
+        assert await cache.get("b") is None and await cache.get("a") == RECORD
+        assert cache.evictions == 1
+        await cache.put("d", RECORD)
+        await cache.put("e", RECORD)                          # evicts "a" and its tag
+        assert cache._tagged == {}
+    asyncio.run(main())
+
+
+# ---------------------------------------------------------------------------
+# SQLite tier
+# ---------------------------------------------------------------------------
+def test_restarted_process_starts_warm(tmp_path):
+    async def main():
+        path = str(tmp_path / "orchestration.db")
+        first = OrchestrationCache(path=path)
+        await first.put("jane", RECORD, tags=[("customer", 1)])
+        first.close()
+
+        second = OrchestrationCache(path=path)
+        assert await second.get("jane") == RECORD
+        assert second.disk_hits == 1
+        # Tags come back with the record, in memory and on disk
+        assert await second.invalidate_tags([("customer", 1)]) == 1
+        second.close()
+        assert await OrchestrationCache(path=path).get("jane") is None
+    asyncio.run(main())
+
+
+def test_disk_reads_run_off_the_event_loop(tmp_path, monkeypatch):
+    async def main():
+        cache = OrchestrationCache(path=str(tmp_path / "orchestration.db"))
+        await cache.put("jane", RECORD)
+        cache._entries.clear()
+        threads = []
+        disk_get = cache._disk_get
+        monkeypatch.setattr(cache, "_disk_get", lambda key: threads.append(threading.get_ident()) or disk_get(key))
+        assert await cache.get("jane") == RECORD
+        assert threads and threads[0] != threading.get_ident()
+        cache.close()
+    asyncio.run(main())
@@ -0,0 +1,367 @@
+import asyncio
+import json
+import os
+import re
+from contextlib import asynccontextmanager
+
+import httpx
+import pytest
+from mcp import types
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+os.environ.setdefault("AZURE_OPENAI_API_KEY", "test")
+os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "http://llm.invalid")
+
+import api
+import mcp_orchestrator as orch
+from customer_store import InMemoryCustomerStore
+from mcp_client import ToolCatalogCache
+from orchestration_cache import OrchestrationCache
+
+URL = "http://mcp.invalid/mcp"
+JANE = {"id": 1, "email": "jane@example.com", "name": "Jane", "dob": "1990-01-01"}
+PRODUCTS = [{"code": "P1", "name": "Phone", "list_price": 10.0, "buy_price": 8.0,
+             "date": "2024-01-01", "has_warranty": False}]
+TOOLS = [
+    types.Tool(name=name, inputSchema={"type": "object", "properties": {"response_format": {"type": "string"}}})
+    for name in ("customer_get_by_email", "customer_get_products", "customer_get_profile")
+]
+
+
+class FakeMCP:
+    """An MCP session whose tools answer from fixed data after `delay` seconds."""
+
+    def __init__(self, delay=0.0, customers=None):
+        self.tools = TOOLS
+        self.OPENAI_TOOLS = [{"type": "function", "function": {"name": t.name}} for t in TOOLS]
+        self.catalog_version = orch.tool_catalog.get(URL).version
+        self.delay = delay
+        self.customers = customers if customers is not None else {JANE["email"]: JANE}
+        self.calls = []
+        self.in_flight = self.peak = 0
+
+    async def call_tool(self, name, args):
+        self.calls.append((name, args))
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        if name == "customer_get_by_email":
+            customer = self.customers.get(args["email"])
+            data = customer
+        elif name == "customer_get_products":
+            data = {"products": PRODUCTS}
+        else:
+            customer = self.customers.get(args["email"])
+            data = customer and {"customer": customer, "products": PRODUCTS}
+        if data is None:
+            return {"content": [{"type": "text", "text": "Customer not found"}], "isError": True}
+        return {"content": [{"type": "text", "text": json.dumps(data)}], "structuredContent": data, "isError": False}
+
+
+class FakePool:
+    def __init__(self, mcp):
+        self.mcp = mcp
+
+    @asynccontextmanager
+    async def session(self):
+        yield self.mcp
+
+
+def tool_call(i, name, **args):
+    return {"id": f"call_{i}", "type": "function", "function": {"name": name, "arguments": json.dumps(args)}}
+
+
+def completion(content=None, tool_calls=None, prompt_tokens=100):
+    return ChatCompletion.model_validate({
+        "id": "c", "object": "chat.completion", "created": 0, "model": "m",
+        "choices": [{"index": 0, "finish_reason": "tool_calls" if tool_calls else "stop",
+                     "message": {"role": "assistant", "content": content, "tool_calls": tool_calls}}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 1, "total_tokens": prompt_tokens + 1},
+    })
+
+
+def chunked(turn: ChatCompletion, size=4):
+    """The deltas a streamed completion of `turn` arrives as."""
+    message = turn.choices[0].message
+
+    def chunk(delta=None, usage=None):
+        return ChatCompletionChunk.model_validate({
+            "id": "c", "object": "chat.completion.chunk", "created": 0, "model": "m",
+            "choices": [] if delta is None else [{"index": 0, "delta": delta, "finish_reason": None}],
+            "usage": usage})
+
+    for i in range(0, len(message.content or ""), size):
+        yield chunk({"content": message.content[i:i + size]})
+    for index, call in enumerate(message.tool_calls or []):
+        yield chunk({"tool_calls": [{"index": index, "id": call.id, "type": "function",
+                                     "function": {"name": call.function.name, "arguments": ""}}]})
+        args = call.function.arguments
+        for i in range(0, len(args), size):
+            yield chunk({"tool_calls": [{"index": index, "function": {"arguments": args[i:i + size]}}]})
+    yield chunk(usage=turn.usage.model_dump())
+
+
+class FakeLLM:
+    """Stands in for the OpenAI client; answers with the scripted turns in order."""
+
+    def __init__(self, *turns, chunk_delay=0.0):
+        self.turns = list(turns)
+        self.requests = []
+        self.chunk_delay = chunk_delay
+        self.streaming = False                      # a stream is being consumed
+        self.chat = self
+        self.completions = self
+
+    async def create(self, stream=False, **kwargs):
+        self.requests.append(json.loads(json.dumps(kwargs["messages"])))
+        turn = self.turns.pop(0)
+        return self._stream(turn) if stream else turn
+
+    async def _stream(self, turn):
+        self.streaming = True
+        try:
+            for chunk in chunked(turn):
+                await asyncio.sleep(self.chunk_delay)
+                yield chunk
+        finally:
+            self.streaming = False
+
+
+class ProfileLLM:
+    """Answers any number of interleaved orchestrations: a profile call, then a summary."""
+
+    def __init__(self, fail_for=()):
+        self.fail_for = set(fail_for)
+        self.chat = self
+        self.completions = self
+
+    async def create(self, messages, **kwargs):
+        email = re.search(r"[\w.+-]+@[\w-]+\.[a-z]+", messages[0]["content"]).group(0)
+        if email in self.fail_for:
+            raise RuntimeError("LLM unavailable")
+        if messages[-1]["role"] == "user":
+            return completion(tool_calls=[tool_call(0, "customer_get_profile", email=email)])
+        return completion(f"done {email}")
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    def script(*turns):
+        fake = FakeLLM(*turns)
+        monkeypatch.setattr(orch, "client", fake)
+        return fake
+    return script
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+    cache = ToolCatalogCache(snapshot_dir=None)
+    cache.put(URL, TOOLS)
+    monkeypatch.setattr(orch, "tool_catalog", cache)
+    monkeypatch.setattr(orch, "ORCHESTRATION_CHANGE_FEED", False)
+    return cache
+
+
+async def stream(**kwargs):
+    record, tokens = {}, []
+    async for token in orch.stream_user_and_products(URL, JANE["email"], record=record, **kwargs):
+        tokens.append(token)
+    return tokens, record
+
+
+def profile_turns(answer="Jane has a phone"):
+    return [completion(tool_calls=[tool_call(0, "customer_get_profile", email=JANE["email"])]),
+            completion(answer)]
+
+
+def customers(n):
+    return {f"user{i}@example.com": {**JANE, "id": i, "email": f"user{i}@example.com"} for i in range(n)}
+
+
+def by_email_turns(emails):
+    calls = [tool_call(i, "customer_get_by_email", email=e) for i, e in enumerate(emails)]
+    return [completion(tool_calls=calls), completion("done")]
+
+
+def tool_messages(request):
+    return [m for m in request if m["role"] == "tool"]
+
+
+# ---------------------------------------------------------------------------
+# Concurrent tool calls
+# ---------------------------------------------------------------------------
+def test_tool_calls_of_one_turn_run_concurrently(llm, catalog):
+    async def main():
+        emails = ["user0@example.com", "nobody@example.com", "user2@example.com"]
+        fake, mcp = llm(*by_email_turns(emails)), FakeMCP(delay=0.05, customers=customers(3))
+        record = await orch.fetch_user_and_products(URL, JANE["email"], pool=FakePool(mcp), cache=None)
+        assert mcp.peak == 3
+        # Results go back in call order, each with its call id; the miss is an error
+        results = tool_messages(fake.requests[1])
+        assert [m["tool_call_id"] for m in results] == ["call_0", "call_1", "call_2"]
+        assert json.loads(results[0]["content"])["id"] == 0 and json.loads(results[2]["content"])["id"] == 2
+        assert results[1]["content"].startswith("Error")
+        assert record["errors"] == {"customer_get_by_email": "Customer not found"}
+        # Tools that take response_format are asked for JSON
+        assert all(args["response_format"] == "json" for _, args in mcp.calls)
+    asyncio.run(main())
+
+
+def test_tool_concurrency_is_bounded(llm, catalog):
+    async def main():
+        emails = list(customers(4))
+        llm(*by_email_turns(emails))
+        mcp = FakeMCP(delay=0.02, customers=customers(4))
+        await orch.fetch_user_and_products(URL, JANE["email"], max_concurrency=2, pool=FakePool(mcp), cache=None)
+        assert mcp.peak == 2 and len(mcp.calls) == 4
+    asyncio.run(main())
+
+
+def test_failing_tool_call_does_not_cancel_its_siblings(llm, catalog):
+    async def main():
+        fake, mcp = llm(*by_email_turns(["user0@example.com", "user1@example.com"])), FakeMCP(customers=customers(2))
+        answer = mcp.call_tool
+
+        async def call_tool(name, args):
+            if args["email"] == "user0@example.com":
+                raise ConnectionError("session dropped")
+            return await answer(name, args)
+        mcp.call_tool = call_tool
+
+        record = await orch.fetch_user_and_products(URL, JANE["email"], pool=FakePool(mcp), cache=None)
+        first, second = tool_messages(fake.requests[1])
+        assert first["content"].startswith("Error: ConnectionError")
+        assert record["user_record"]["id"] == 1 and record["assistant_answer"] == "done"
+    asyncio.run(main())
+
+
+def test_run_many_returns_results_in_input_order(monkeypatch, catalog):
+    async def main():
+        monkeypatch.setattr(orch, "client", ProfileLLM(fail_for={"user2@example.com"}))
+        mcp = FakeMCP(delay=0.02, customers=customers(4))
+        emails = list(customers(4))
+        results = await orch.run_many(URL, emails, max_in_flight=4, pool=FakePool(mcp), cache=None)
+        assert [r["assistant_answer"] for r in results if isinstance(r, dict)] == \
+               [f"done {e}" for e in emails if e != "user2@example.com"]
+        assert isinstance(results[2], RuntimeError)
+        assert [r["user_record"]["id"] for r in results if isinstance(r, dict)] == [0, 1, 3]
+        assert mcp.peak > 1
+    asyncio.run(main())
+
+
+# ---------------------------------------------------------------------------
+# Streaming
+# ---------------------------------------------------------------------------
+def test_stream_dispatches_a_tool_call_before_the_stream_ends(llm, catalog):
+    async def main():
+        emails = ["user0@example.com", "user1@example.com"]
+        fake, mcp = llm(*by_email_turns(emails)), FakeMCP(customers=customers(2))
+        fake.chunk_delay = 0.005
+        answer, started = mcp.call_tool, {}
+
+        async def call_tool(name, args):
+            started[args["email"]] = fake.streaming
+            return await answer(name, args)
+        mcp.call_tool = call_tool
+
+        tokens, record = await stream(pool=FakePool(mcp), cache=None)
+        # The first call is complete once the second begins; the last one at the end of the stream
+        assert started == {"user0@example.com": True, "user1@example.com": False}
+        assert [m["tool_call_id"] for m in tool_messages(fake.requests[1])] == ["call_0", "call_1"]
+        assert "".join(tokens) == "done" and record["user_record"]["id"] == 1
+    asyncio.run(main())
+
+
+# ---------------------------------------------------------------------------
+# Result cache
+# ---------------------------------------------------------------------------
+def test_repeated_query_is_answered_from_the_cache(llm, catalog):
+    async def main():
+        fake, cache, mcp = llm(*profile_turns()), OrchestrationCache(), FakeMCP()
+        first = await orch.fetch_user_and_products(URL, JANE["email"], pool=FakePool(mcp), cache=cache)
+        again = await orch.fetch_user_and_products(URL, JANE["email"], pool=FakePool(mcp), cache=cache)
+        assert again["cached"] and again["assistant_answer"] == first["assistant_answer"]
+        assert again["user_record"] == JANE and again["products"] == PRODUCTS
+        assert len(fake.requests) == 2 and len(mcp.calls) == 1
+    asyncio.run(main())
+
+
+def test_planner_fallback_is_cached_under_the_planner_key_only(llm, catalog):
+    async def main():
+        llm(*profile_turns())
+        cache = OrchestrationCache()
+        mcp = FakeMCP()
+        by_email = mcp.call_tool
+
+        async def call_tool(name, args):
+            # The by-email step fails, so the planner hands over to the LLM loop
+            if name == "customer_get_by_email":
+                return {"content": [{"type": "text", "text": "Unexpected output"}], "isError": True}
+            return await by_email(name, args)
+        mcp.call_tool = call_tool
+
+        record = await orch.plan_user_and_products(URL, JANE["email"], pool=FakePool(mcp), cache=cache)
+        assert record["assistant_answer"] == "Jane has a phone"
+        assert cache.stats()["entries"] == 1
+        query, version = orch.QUERY_TEMPLATE.format(email=JANE["email"]), mcp.catalog_version
+        assert await cache.get(cache.key(query, version, orch.DEPLOYMENT, "planner")) is not None
+        assert await cache.get(cache.key(query, version, orch.DEPLOYMENT, "llm")) is None
+    asyncio.run(main())
+
+
+def test_stream_shares_the_cache_with_the_loop(llm, catalog):
+    async def main():
+        fake, cache, mcp = llm(*profile_turns()), OrchestrationCache(), FakeMCP()
+        tokens, record = await stream(pool=FakePool(mcp), cache=cache)
+        assert "".join(tokens) == "Jane has a phone" and len(tokens) > 1
+        assert record["catalog_version"] == mcp.catalog_version and "cached" not in record
+
+        tokens, again = await stream(pool=FakePool(mcp), cache=cache)
+        assert tokens == ["Jane has a phone"] and again["cached"]
+        assert again["user_record"] == JANE and again["products"] == PRODUCTS
+        looped = await orch.fetch_user_and_products(URL, JANE["email"], pool=FakePool(mcp), cache=cache)
+        assert looped["cached"]
+        assert len(fake.requests) == 2 and len(mcp.calls) == 1
+    asyncio.run(main())
+
+
+def test_unfinished_stream_is_not_cached(llm, catalog):
+    async def main():
+        llm(*profile_turns()[:1] * 2)                       # never gives a final answer
+        cache = OrchestrationCache()
+        _, record = await stream(pool=FakePool(FakeMCP()), cache=cache, max_rounds=2)
+        assert record["user_record"] == JANE
+        assert cache.stats()["entries"] == 0
+    asyncio.run(main())
+
+
+def test_change_feed_drops_the_written_customers_records(monkeypatch, dataset):
+    store = InMemoryCustomerStore()
+    store.bulk_load(*dataset)
+    monkeypatch.setattr(api, "store", store)
+
+    async def main():
+        cache = OrchestrationCache()
+        await cache.put("one", {"a": 1}, tags=[("customer", 1)])
+        await cache.put("two", {"a": 2}, tags=[("customer", 2)])
+        transport = httpx.ASGITransport(app=api.app)
+        follower = asyncio.create_task(orch._follow_changes(cache, "http://api", transport=transport))
+        try:
+            await asyncio.sleep(0.1)                      # first poll learns the position
+            customer = store.get_customer(1)
+            async with httpx.AsyncClient(base_url="http://api", transport=transport) as http:
+                resp = await http.put("/customer/1", json={"email": customer.email, "name": "Renamed",
+                                                           "dob": customer.dob.isoformat()})
+                assert resp.status_code == 200
+            for _ in range(100):
+                if await cache.get("one") is None:
+                    break
+                await asyncio.sleep(0.02)
+            assert await cache.get("one") is None
+            assert await cache.get("two") == {"a": 2}
+        finally:
+            follower.cancel()
+    asyncio.run(main())
@@ -0,0 +1,143 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from resilience import CircuitBreaker, CircuitOpenError, ResilientUpstream, RetryPolicy, retry_after_seconds
+
+
+def opened(threshold=2, reset_timeout=30.0):
+    breaker = CircuitBreaker(failure_threshold=threshold, reset_timeout=reset_timeout)
+    for _ in range(threshold):
+        breaker.before_call()
+        breaker.record_failure()
+    return breaker
+
+
+def rewind(breaker):
+    """Pretend the reset timeout has passed."""
+    breaker.opened_at = time.monotonic() - breaker.reset_timeout - 1
+
+
+# ---------------------------------------------------------------------------
+# Circuit breaker
+# ---------------------------------------------------------------------------
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError) as e:
+        breaker.before_call()
+    assert 0 < e.value.retry_in <= breaker.reset_timeout
+    assert breaker.short_circuits == 1
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = opened()
+    rewind(breaker)
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()                        # a second caller while the probe runs
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_call()
+
+
+def test_failed_probe_reopens():
+    breaker = opened(threshold=5)
+    rewind(breaker)
+    breaker.before_call()
+    breaker.record_failure()                         # one failure is enough in half-open
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_released_probe_lets_the_next_caller_probe():
+    breaker = opened()
+    rewind(breaker)
+    breaker.before_call()
+    breaker.release_probe()
+    breaker.before_call()
+    assert breaker.state == "half_open"
+
+
+# ---------------------------------------------------------------------------
+# Retries
+# ---------------------------------------------------------------------------
+def responses(*statuses, headers=None):
+    queue = list(statuses)
+    calls = []
+
+    async def send():
+        calls.append(1)
+        status = queue.pop(0)
+        if status is None:
+            raise httpx.ConnectError("refused")
+        return httpx.Response(status, headers=headers)
+    return send, calls
+
+
+def upstream(attempts=3, threshold=5):
+    return ResilientUpstream(RetryPolicy(max_attempts=attempts, base_delay=0.0, max_delay=0.0),
+                             CircuitBreaker(failure_threshold=threshold))
+
+
+def test_retries_transient_statuses_and_errors():
+    send, calls = responses(503, None, 200)
+    up = upstream()
+    assert asyncio.run(up.request(send)).status_code == 200
+    assert len(calls) == 3 and up.retries == 2
+    assert up.breaker.state == "closed"
+
+
+def test_gives_up_with_the_last_response():
+    send, calls = responses(503, 503, 503)
+    assert asyncio.run(upstream().request(send)).status_code == 503
+    assert len(calls) == 3
+
+
+def test_client_errors_are_not_retried():
+    send, calls = responses(404)
+    assert asyncio.run(upstream().request(send)).status_code == 404
+    assert len(calls) == 1
+
+
+def test_non_idempotent_requests_are_not_retried():
+    send, calls = responses(None)
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(upstream().request(send, idempotent=False))
+    assert len(calls) == 1
+
+
+def test_long_retry_after_is_returned_not_waited_out():
+    send, calls = responses(429, 200, headers={"Retry-After": "120"})
+    assert asyncio.run(upstream().request(send)).status_code == 429
+    assert len(calls) == 1
+
+
+def test_open_breaker_fails_fast():
+    send, calls = responses(None, None, None)
+    up = upstream(attempts=3, threshold=2)
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(up.request(send))
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize("value, expected", [("3", 3.0), ("-1", 0.0), ("soon", None), (None, None)])
+def test_retry_after_seconds(value, expected):
+    headers = {"Retry-After": value} if value is not None else {}
+    assert retry_after_seconds(httpx.Response(429, headers=headers)) == expected
@@ -0,0 +1,152 @@
+import asyncio
+import time
+
+import pytest
+
+from response_cache import ResponseCache
+
+
+class Upstream:
+    """Counts fetches; each one waits for `release` so tests control overlap."""
+
+    def __init__(self, value="v"):
+        self.value = value
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def fetch(self):
+        self.calls += 1
+        await self.release.wait()
+        if isinstance(self.value, Exception):
+            raise self.value
+        return self.value
+
+
+def test_hit_after_miss():
+    async def main():
+        cache, upstream = ResponseCache(), Upstream()
+        upstream.release.set()
+        assert await cache.get_or_fetch("tool", "k", upstream.fetch) == "v"
+        assert await cache.get_or_fetch("tool", "k", upstream.fetch) == "v"
+        assert upstream.calls == 1
+        assert (cache.misses, cache.hits) == (1, 1)
+    asyncio.run(main())
+
+
+def test_concurrent_misses_share_one_fetch():
+    async def main():
+        cache, upstream = ResponseCache(), Upstream()
+        waiters = [asyncio.create_task(cache.get_or_fetch("tool", "k", upstream.fetch)) for _ in range(5)]
+        await asyncio.sleep(0)
+        upstream.release.set()
+        assert await asyncio.gather(*waiters) == ["v"] * 5
+        assert upstream.calls == 1
+        assert (cache.misses, cache.coalesced) == (1, 4)
+    asyncio.run(main())
+
+
+def test_errors_reach_every_waiter_and_are_not_cached():
+    async def main():
+        cache, upstream = ResponseCache(), Upstream(RuntimeError("down"))
+        waiters = [asyncio.create_task(cache.get_or_fetch("tool", "k", upstream.fetch)) for _ in range(3)]
+        await asyncio.sleep(0)
+        upstream.release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert cache.get("tool", "k") == (False, None)
+
+        upstream.value = "ok"
+        assert await cache.get_or_fetch("tool", "k", upstream.fetch) == "ok"
+        assert upstream.calls == 2
+    asyncio.run(main())
+
+
+def test_cancelled_fetcher_hands_over_to_a_waiter():
+    async def main():
+        cache, upstream = ResponseCache(), Upstream()
+        first = asyncio.create_task(cache.get_or_fetch("tool", "k", upstream.fetch))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(cache.get_or_fetch("tool", "k", upstream.fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        upstream.release.set()
+        assert await second == "v"
+        assert upstream.calls == 2
+    asyncio.run(main())
+
+
+def test_entries_expire():
+    cache = ResponseCache()
+    cache.put("tool", "k", "v", ttl=0.01)
+    assert cache.get("tool", "k") == (True, "v")
+    time.sleep(0.02)
+    assert cache.get("tool", "k") == (False, None)
+    assert cache.expirations == 1
+
+
+def test_zero_ttl_is_not_stored():
+    cache = ResponseCache()
+    cache.put("tool", "k", "v", ttl=0)
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_is_evicted():
+    cache = ResponseCache(max_entries=2)
+    cache.put("tool", "a", 1)
+    cache.put("tool", "b", 2)
+    cache.get("tool", "a")
+    cache.put("tool", "c", 3)
+    assert cache.get("tool", "b") == (False, None)
+    assert cache.get("tool", "a") == (True, 1)
+    assert cache.evictions == 1
+
+
+def test_invalidate_by_tool_and_key():
+    cache = ResponseCache()
+    cache.put("one", "a", 1)
+    cache.put("one", "b", 2)
+    cache.put("two", "a", 3)
+    assert cache.invalidate("one", "a") == 1
+    assert cache.invalidate("one") == 1
+    assert cache.get("two", "a") == (True, 3)
+    assert cache.invalidate() == 1
+
+
+def test_invalidate_tags_drops_only_tagged_entries():
+    cache = ResponseCache()
+    cache.put("profile", "a@x.com", 1, tags=[("customer", 1), ("email", "a@x.com")])
+    cache.put("products", 1, 2, tags=[("customer", 1)])
+    cache.put("profile", "b@x.com", 3, tags=[("customer", 2), ("email", "b@x.com")])
+    assert cache.invalidate_tags([("customer", 1)]) == 2
+    assert cache.get("profile", "a@x.com") == (False, None)
+    assert cache.get("profile", "b@x.com") == (True, 3)
+    assert cache.stats()["tags"] == 2                # customer 1's tags are gone with its entries
+    assert cache.invalidate_tags([("customer", 1)]) == 0
+
+
+def test_replacing_an_entry_replaces_its_tags():
+    cache = ResponseCache()
+    cache.put("tool", "k", 1, tags=["old"])
+    cache.put("tool", "k", 2, tags=["new"])
+    assert cache.invalidate_tags(["old"]) == 0
+    assert cache.invalidate_tags(["new"]) == 1
+
+
+def test_invalidation_during_a_fetch_discards_its_result():
+    async def main():
+        cache, upstream = ResponseCache(), Upstream("stale")
+        reader = asyncio.create_task(cache.get_or_fetch("tool", "k", upstream.fetch, tags=["t"]))
+        await asyncio.sleep(0)
+        cache.invalidate_tags(["t"])
+        upstream.release.set()
+        assert await reader == "stale"               # the caller still gets its answer
+        assert cache.get("tool", "k") == (False, None)
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("hits, misses, coalesced, ratio", [(0, 0, 0, 0.0), (3, 1, 0, 0.75), (1, 1, 2, 0.75)])
+def test_hit_ratio(hits, misses, coalesced, ratio):
+    cache = ResponseCache()
+    cache.hits, cache.misses, cache.coalesced = hits, misses, coalesced
+    assert cache.stats()["hit_ratio"] == ratio
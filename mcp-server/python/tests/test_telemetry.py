@@ -0,0 +1,107 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+import telemetry
+from customer_store import InMemoryCustomerStore
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+SAMPLED = f"00-{TRACE_ID}-00f067aa0ba902b7-01"
+
+
+@pytest.fixture
+def exporter(monkeypatch):
+    """A fresh span buffer, so tests only see their own spans."""
+    fresh = telemetry.SpanExporter(max_spans=100, path=None)
+    monkeypatch.setattr(telemetry, "_exporter", fresh)
+    return fresh
+
+
+# ---------------------------------------------------------------------------
+# Trace context
+# ---------------------------------------------------------------------------
+def test_parse_traceparent():
+    context = telemetry.parse_traceparent(SAMPLED)
+    assert (context.trace_id, context.span_id, context.sampled) == (TRACE_ID, "00f067aa0ba902b7", True)
+    assert telemetry.traceparent(context) == SAMPLED
+
+
+@pytest.mark.parametrize("value", [
+    None,
+    "",
+    "00-abc-00f067aa0ba902b7-01",
+    f"00-{TRACE_ID}-00f067aa0ba902b7",
+    f"00-{'0' * 32}-00f067aa0ba902b7-01",
+    f"ff-{TRACE_ID}-00f067aa0ba902b7-01",
+    f"00-{'z' * 32}-00f067aa0ba902b7-01",
+])
+def test_malformed_traceparent_is_ignored(value):
+    assert telemetry.parse_traceparent(value) is None
+
+
+def test_inject_only_inside_a_span():
+    assert telemetry.inject({}) == {}
+    with telemetry.span("client", "t") as hop:
+        assert telemetry.inject({}) == {"traceparent": telemetry.traceparent(hop.context)}
+    assert telemetry.current() is None
+
+
+# ---------------------------------------------------------------------------
+# Spans
+# ---------------------------------------------------------------------------
+def test_child_spans_continue_the_trace(exporter):
+    parent = telemetry.parse_traceparent(SAMPLED)
+    with telemetry.span("orchestration", "fetch", parent=parent) as outer:
+        with telemetry.span("client", "call_tool") as inner:
+            inner.set("tool", "customer_get_profile")
+    assert outer.context.trace_id == inner.context.trace_id == TRACE_ID
+    assert outer.parent_id == parent.span_id and inner.parent_id == outer.context.span_id
+
+    spans = exporter.spans(TRACE_ID)
+    assert [s["hop"] for s in spans] == ["orchestration", "client"]      # most recent first
+    assert spans[1]["attributes"] == {"tool": "customer_get_profile"}
+
+
+def test_unsampled_traces_are_only_timed(exporter):
+    unsampled = telemetry.parse_traceparent(SAMPLED[:-2] + "00")
+    with telemetry.span("tool", "unsampled_tool", parent=unsampled) as hop:
+        hop.set("ignored", True)
+    assert exporter.spans() == [] and hop.attributes is None
+    assert 'target="unsampled_tool"' in telemetry.render_metrics()
+
+
+def test_exception_marks_the_span_as_error():
+    with pytest.raises(ValueError):
+        with telemetry.span("tool", "failing_tool"):
+            raise ValueError("boom")
+    assert 'hop_duration_seconds_count{hop="tool",target="failing_tool",status="error"} 1' \
+        in telemetry.render_metrics()
+
+
+def test_histogram_buckets_are_cumulative():
+    metric = telemetry.Histogram("test_seconds", "Test.", ("op",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        metric.observe(value, "read")
+    lines = metric.render()
+    assert 'test_seconds_bucket{op="read",le="0.1"} 2' in lines
+    assert 'test_seconds_bucket{op="read",le="1.0"} 3' in lines
+    assert 'test_seconds_bucket{op="read",le="+Inf"} 4' in lines
+    assert 'test_seconds_count{op="read"} 4' in lines
+
+
+# ---------------------------------------------------------------------------
+# API middleware
+# ---------------------------------------------------------------------------
+def test_api_continues_an_incoming_trace(monkeypatch, dataset, exporter):
+    store = InMemoryCustomerStore()
+    store.bulk_load(*dataset)
+    monkeypatch.setattr(api, "store", store)
+    with TestClient(api.app) as client:
+        assert client.get("/customer/1/products", headers={"traceparent": SAMPLED}).status_code == 200
+        spans = client.get("/traces", params={"trace_id": TRACE_ID}).json()["spans"]
+        metrics = client.get("/metrics")
+    assert [(s["hop"], s["target"], s["parent_id"]) for s in spans] == \
+        [("api", "GET /customer/{customer_id}/products", "00f067aa0ba902b7")]
+    assert spans[0]["attributes"] == {"http.status_code": 200}
+    assert metrics.headers["content-type"] == telemetry.CONTENT_TYPE
+    assert 'target="GET /customer/{customer_id}/products"' in metrics.text